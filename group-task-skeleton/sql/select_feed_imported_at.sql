@@ -0,0 +1,2 @@
+SELECT MAX(imported_at) AS imported_at
+FROM gtfs_import_metadata;
@@ -0,0 +1,3 @@
+SELECT filename, sha256
+FROM gtfs_import_metadata
+ORDER BY filename;
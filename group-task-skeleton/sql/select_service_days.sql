@@ -0,0 +1,2 @@
+SELECT service_id, date
+FROM service_days;
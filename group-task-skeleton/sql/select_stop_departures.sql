@@ -0,0 +1,32 @@
+SELECT
+    st.trip_id,
+    t.route_id,
+    t.trip_headsign,
+    st.stop_sequence,
+    st.arrival_secs,
+    st.departure_secs,
+    sd.date AS service_date
+FROM (
+    -- Trips of the previous service day still run after midnight with times past 24:00.
+    SELECT :service_date AS date, :after_secs AS after_secs, 0 AS day_offset
+    UNION ALL
+    SELECT :previous_date, :after_secs + 86400, 86400
+) AS days
+JOIN stop_times AS st
+    ON st.stop_id = :stop_id
+    AND st.departure_secs >= days.after_secs
+JOIN trips AS t
+    ON t.trip_id = st.trip_id
+JOIN service_days AS sd
+    ON sd.service_id = t.service_id
+    AND sd.date = days.date
+WHERE EXISTS (
+    SELECT 1
+    FROM stop_times AS later
+    WHERE later.trip_id = st.trip_id
+        AND later.stop_sequence > st.stop_sequence
+        AND later.stop_id IN (SELECT value FROM json_each(:destination_stop_ids))
+)
+ORDER BY
+    st.departure_secs - days.day_offset
+LIMIT :limit;
\ No newline at end of file
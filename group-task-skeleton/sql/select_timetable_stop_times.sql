@@ -0,0 +1,2 @@
+SELECT trip_id, stop_sequence, stop_id, arrival_secs, departure_secs
+FROM stop_times;
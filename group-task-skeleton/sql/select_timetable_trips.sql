@@ -0,0 +1,3 @@
+SELECT trip_id, route_id, trip_headsign, service_id, variant_id, shape_id
+FROM trips
+ORDER BY trip_id;
@@ -5,8 +5,14 @@ SELECT
     s.stop_name,
     s.stop_lat,
     s.stop_lon,
-    st.arrival_time,
-    st.departure_time
+    st.arrival_secs,
+    st.departure_secs,
+    (
+        SELECT MIN(sd.date)
+        FROM service_days AS sd
+        WHERE sd.service_id = t.service_id
+            AND sd.date >= :from_date
+    ) AS service_date
 FROM trips AS t
 LEFT JOIN stop_times AS st
     ON t.trip_id = st.trip_id
@@ -0,0 +1,280 @@
+"""
+ASGI entry point of the API: the Flask app of main.py served from a bounded thread pool.
+
+    uvicorn public_transport_api.asgi:app --app-dir src --workers 4
+
+Request bodies are read and responses are written on the event loop, so slow clients do not hold a
+thread; only the Flask request itself (parsing, database work, serialisation) runs on one of
+PUBLIC_TRANSPORT_ASGI_THREADS threads. Requests wait for a thread in arrival order. Once
+PUBLIC_TRANSPORT_ASGI_QUEUE requests are waiting, or a request has waited PUBLIC_TRANSPORT_ASGI_QUEUE_TIMEOUT
+seconds, it is answered with 503 and Retry-After instead of queueing without bound. A request whose
+client disconnects before its body is read is dropped without taking a thread. WebSocket connections
+are refused during the handshake.
+
+Response bodies are streamed: every chunk the WSGI iterable yields is handed to the event loop and sent
+as it is produced, so the first NDJSON lines of a streamed response reach the client while later ones
+are still being computed.
+"""
+import asyncio
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from public_transport_api.main import app as flask_app
+
+# Threads running Flask requests per worker process
+MAX_THREADS = int(os.environ.get('PUBLIC_TRANSPORT_ASGI_THREADS', '4'))
+# Requests waiting for a thread before new requests are rejected
+MAX_QUEUE = int(os.environ.get('PUBLIC_TRANSPORT_ASGI_QUEUE', '64'))
+# Seconds a request waits for a thread before it is rejected
+QUEUE_TIMEOUT_SECS = float(os.environ.get('PUBLIC_TRANSPORT_ASGI_QUEUE_TIMEOUT', '10'))
+# Largest request body accepted
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class WsgiToAsgi:
+    """
+    ASGI application running a WSGI application on a bounded thread pool, with admission control.
+
+    At most max_threads requests run at a time. Further requests wait in FIFO order (asyncio.Semaphore
+    wakes its waiters in order); a request arriving while max_queue requests are waiting, or waiting
+    longer than queue_timeout_secs, gets 503 Service Unavailable with a Retry-After header. The thread
+    passes the response messages to the event loop as the body is produced and keeps its slot until the
+    iterable is exhausted; the event loop sends them.
+    """
+
+    def __init__(self, wsgi_app, max_threads=MAX_THREADS, max_queue=MAX_QUEUE,
+                 queue_timeout_secs=QUEUE_TIMEOUT_SECS):
+        """
+        Parameters:
+        - wsgi_app (callable): The WSGI application.
+        - max_threads (int): Requests run concurrently.
+        - max_queue (int): Requests allowed to wait for a thread.
+        - queue_timeout_secs (float): Seconds a request may wait for a thread.
+        """
+        self.wsgi_app = wsgi_app
+        self.max_threads = max_threads
+        self.max_queue = max_queue
+        self.queue_timeout_secs = queue_timeout_secs
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='wsgi')
+        self._slots = None
+        self.waiting = self.running = self.rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'websocket':
+            # The API has no WebSocket endpoints: close during the handshake, which servers send as 403.
+            message = await receive()
+            if message['type'] == 'websocket.connect':
+                await send({'type': 'websocket.close', 'code': 1000})
+        else:
+            logger.warning(f"Ignored a connection with the unsupported ASGI scope type {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body, disconnected = await self._read_body(receive)
+        if disconnected:
+            # Nobody is left to read the response.
+            return
+        if body is None:
+            await self._send_error(send, 413, 'Request body too large')
+            return
+        if self._slots is None:
+            # Created on first use, on the loop of the server.
+            self._slots = asyncio.Semaphore(self.max_threads)
+        if self.waiting >= self.max_queue and self._slots.locked():
+            await self._reject(send)
+            return
+        self.waiting += 1
+        try:
+            acquired = await self._acquire_slot()
+        finally:
+            self.waiting -= 1
+        if not acquired:
+            await self._reject(send)
+            return
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue()
+        stopped = threading.Event()
+
+        def emit(message):
+            loop.call_soon_threadsafe(messages.put_nowait, message)
+
+        def finished(_):
+            # The thread is free once the iterable is exhausted, however long the client takes to read.
+            self.running -= 1
+            self._slots.release()
+
+        try:
+            running = loop.run_in_executor(self.executor, run_wsgi, self.wsgi_app, wsgi_environ(scope, body),
+                                           emit, stopped)
+        except BaseException:
+            finished(None)
+            raise
+        running.add_done_callback(finished)
+        try:
+            while (message := await messages.get()) is not None:
+                await send(message)
+        except BaseException:
+            # The client is gone: stop iterating the body.
+            stopped.set()
+            raise
+        # Raises the exception of the WSGI application, if any.
+        await running
+
+    async def _acquire_slot(self):
+        """
+        Waits up to queue_timeout_secs for a thread and returns True once one is acquired, or False.
+        """
+        acquire = asyncio.ensure_future(self._slots.acquire())
+        try:
+            await asyncio.wait_for(asyncio.shield(acquire), self.queue_timeout_secs)
+            return True
+        except BaseException as e:
+            # The wait can end (time out, or the request be cancelled) right after the semaphore was
+            # acquired: hand the permit back instead of leaking it. A pending acquire is cancelled,
+            # which asyncio.Semaphore handles without losing a permit.
+            if acquire.done() and not acquire.cancelled():
+                self._slots.release()
+            else:
+                acquire.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                return False
+            raise
+
+    @staticmethod
+    async def _read_body(receive):
+        """
+        Returns (body, disconnected): the request body, or None if it exceeds MAX_BODY_BYTES, and whether
+        the client disconnected before sending all of it.
+        """
+        parts = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None, True
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                return None, False
+            parts.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(parts), False
+
+    async def _reject(self, send):
+        self.rejected += 1
+        logger.warning(f"Rejected a request: {self.waiting} waiting, {self.running} running")
+        await self._send_error(send, 503, 'Server busy, retry later', [(b'retry-after', b'1')])
+
+    @staticmethod
+    async def _send_error(send, status, message, headers=()):
+        body = f'{{"error": "{message}"}}'.encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode('latin-1')), *headers]})
+        await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+    def stats(self):
+        """
+        Returns the number of running, waiting and rejected requests.
+        """
+        return {"running": self.running, "waiting": self.waiting, "rejected": self.rejected,
+                "max_threads": self.max_threads, "max_queue": self.max_queue}
+
+
+def wsgi_environ(scope, body):
+    """
+    Returns the PEP 3333 environ of an ASGI HTTP scope and its request body.
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = 'HTTP_' + name
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def run_wsgi(wsgi_app, environ, emit, stopped):
+    """
+    Calls a WSGI application and passes its response to emit as ASGI messages as it is produced: the
+    http.response.start message before the first body chunk, a message per chunk and a last one without
+    more_body. Then, and also if the application raises, emits None. Stops iterating the body once the
+    stopped event is set.
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info is not None and response.get('started'):
+            raise exc_info[1].with_traceback(exc_info[2])
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        return write
+
+    def write(chunk):
+        if not response.get('started'):
+            response['started'] = True
+            emit({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+        if chunk:
+            emit({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+    try:
+        iterable = wsgi_app(environ, start_response)
+        try:
+            for chunk in iterable:
+                if stopped.is_set():
+                    return
+                if chunk:
+                    write(chunk)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        write(b'')
+        emit({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        emit(None)
+
+
+app = WsgiToAsgi(flask_app)
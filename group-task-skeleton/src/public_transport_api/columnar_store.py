@@ -0,0 +1,226 @@
+import json
+import os
+from datetime import datetime, timezone
+from functools import cached_property, lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Layout version written by tools/database_tool.py (COLUMNAR_FORMAT_VERSION)
+FORMAT_VERSION = 1
+# File naming the published version folder of a snapshot (COLUMNAR_CURRENT_FILE)
+CURRENT_FILE = 'CURRENT'
+
+TRIP_DATA_COLUMNS = ['trip_id', 'route_id', 'trip_headsign', 'stop_name', 'stop_lat', 'stop_lon',
+                     'arrival_secs', 'departure_secs', 'service_date']
+STOP_DEPARTURES_COLUMNS = ['trip_id', 'route_id', 'trip_headsign', 'stop_sequence', 'arrival_secs',
+                           'departure_secs', 'service_date']
+
+
+def stop_departures_result(columns, as_frame):
+    """
+    Returns a stop_departures result from a dict of STOP_DEPARTURES_COLUMNS arrays: a DataFrame, or
+    with as_frame=False a list of row tuples of Python values like the cursor rows of SqliteFeed.
+    """
+    if as_frame:
+        return pd.DataFrame(columns, columns=STOP_DEPARTURES_COLUMNS)
+    return list(zip(*(list(values) if isinstance(values, list) else np.asarray(values).tolist()
+                      for values in (columns[col] for col in STOP_DEPARTURES_COLUMNS))))
+
+
+def current_snapshot(columnar_dir):
+    """
+    Returns the folder of the version currently published in columnar_dir.
+    """
+    with open(os.path.join(columnar_dir, CURRENT_FILE), encoding='utf-8') as file:
+        return os.path.join(columnar_dir, file.read().strip())
+
+
+class ColumnarFeed:
+    """
+    Read-only timetable backed by the columnar snapshot written by `database_tool.py --columnar-dir`.
+
+    Every column is a .npy file opened with mmap_mode='r': opening the feed parses nothing but the
+    manifest, and processes serving the same snapshot share its pages through the OS page cache.
+    Text columns are int32 codes into sorted string dictionaries. trips is sorted by trip_id, so a
+    trip's code is also its row; stop_times is sorted by (trip_id, stop_sequence) and stop_departures
+    by (stop_id, departure_secs), so lookups are binary searches over contiguous arrays.
+
+    The query methods return DataFrames with the columns of the matching .sql files, so they can be
+    used in place of SqliteFeed.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar snapshot version: {manifest.get('format_version')}")
+        self.directory = directory
+        # Version folder name, unique per export
+        self.version = os.path.basename(os.path.normpath(directory))
+        self.created_at = manifest['created_at']
+        # Export time in UTC; created_at is the local time of the export
+        self.last_modified = datetime.fromisoformat(self.created_at).astimezone(timezone.utc)
+        self._columns = {}
+        self._dictionaries = {}
+        for table_name, table in manifest['tables'].items():
+            for col, spec in table['columns'].items():
+                self._columns[(table_name, col)] = np.load(os.path.join(directory, spec['file']), mmap_mode='r')
+                if 'dictionary' in spec:
+                    self._dictionaries[(table_name, col)] = np.load(os.path.join(directory, spec['dictionary']),
+                                                                    mmap_mode='r')
+        trip_count = len(self._dictionaries[('trips', 'trip_id')])
+        # stop_times rows of the trip with code c are _trip_offsets[c]:_trip_offsets[c + 1]
+        self._trip_offsets = np.searchsorted(self.column('stop_times', 'trip_id'), np.arange(trip_count + 1))
+        # A request looks up departures at several stops on the same dates towards the same destinations.
+        self._active_service_ids = lru_cache(maxsize=64)(self._scan_active_service_ids)
+        self._destination_reach = lru_cache(maxsize=64)(self._scan_destination_reach)
+
+    def column(self, table_name, col):
+        return self._columns[(table_name, col)]
+
+    def decode(self, table_name, col, codes):
+        """
+        Returns the strings of dictionary-encoded codes of a text column.
+        """
+        return self._dictionaries[(table_name, col)][codes]
+
+    def _lookup_code(self, table_name, col, value):
+        dictionary = self._dictionaries[(table_name, col)]
+        code = int(np.searchsorted(dictionary, value))
+        if code < len(dictionary) and dictionary[code] == value:
+            return code
+        return None
+
+    def _scan_active_service_ids(self, service_date):
+        date_code = self._lookup_code('service_days', 'date', service_date)
+        if date_code is None:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(self.column('service_days', 'service_id')[self.column('service_days', 'date') == date_code])
+
+    def _stop_departure_range(self, stop_id):
+        stop_ids = self.column('stop_departures', 'stop_id')
+        return np.searchsorted(stop_ids, stop_id, 'left'), np.searchsorted(stop_ids, stop_id, 'right')
+
+    def _scan_destination_reach(self, destination_stop_ids):
+        """
+        Returns (trip_codes, last_rows): the sorted codes of the trips calling at one of the destination
+        stops (JSON list) and, for each of them, its last stop_times row at one of those stops.
+        """
+        stop_time_rows = self.column('stop_departures', 'row')
+        ranges = [self._stop_departure_range(stop_id) for stop_id in json.loads(destination_stop_ids)]
+        rows = np.concatenate([stop_time_rows[lo:hi] for lo, hi in ranges] + [np.empty(0, dtype=np.int64)])
+        trip_codes = self.column('stop_times', 'trip_id')[rows]
+        order = np.lexsort((rows, trip_codes))
+        trip_codes, rows = trip_codes[order], rows[order]
+        last = np.append(trip_codes[1:] != trip_codes[:-1], True) if len(rows) else np.empty(0, dtype=bool)
+        return trip_codes[last], rows[last]
+
+    @cached_property
+    def _stops(self):
+        return pd.DataFrame({
+            'stop_id': self.column('stops', 'stop_id'),
+            'stop_code': self.decode('stops', 'stop_code', self.column('stops', 'stop_code')),
+            'stop_name': self.decode('stops', 'stop_name', self.column('stops', 'stop_name')),
+            'stop_lat': self.column('stops', 'stop_lat'),
+            'stop_lon': self.column('stops', 'stop_lon'),
+        })
+
+    def all_stops(self):
+        """
+        Equivalent of select_all_stops.sql.
+        """
+        return self._stops.copy()
+
+    def trip_data(self, params):
+        """
+        Equivalent of select_trip_data.sql for the params {trip_id, from_date}.
+        """
+        code = self._lookup_code('trips', 'trip_id', params['trip_id'])
+        if code is None:
+            return pd.DataFrame(columns=TRIP_DATA_COLUMNS)
+
+        service_id = self.column('trips', 'service_id')[code]
+        service_ids = self.column('service_days', 'service_id')
+        lo, hi = np.searchsorted(service_ids, service_id, 'left'), np.searchsorted(service_ids, service_id, 'right')
+        dates = self.decode('service_days', 'date', self.column('service_days', 'date')[lo:hi])
+        # service_days is sorted by (service_id, date), so the first remaining date is the next one.
+        dates = dates[dates >= params['from_date']]
+
+        start, end = self._trip_offsets[code], self._trip_offsets[code + 1]
+        if start == end:
+            # LEFT JOIN semantics: a trip without stop times still yields one row.
+            stop_columns = {col: [None] for col in TRIP_DATA_COLUMNS[3:8]}
+        else:
+            stop_ids = self.column('stops', 'stop_id')
+            trip_stop_ids = self.column('stop_times', 'stop_id')[start:end]
+            stop_rows = np.minimum(np.searchsorted(stop_ids, trip_stop_ids), max(len(stop_ids) - 1, 0))
+            # LEFT JOIN semantics: a stop missing from stops has no name or coordinates.
+            known = stop_ids[stop_rows] == trip_stop_ids if len(stop_ids) else np.zeros(end - start, bool)
+            stop_rows = stop_rows[known]
+            stop_names = np.full(end - start, None, dtype=object)
+            stop_names[known] = self.decode('stops', 'stop_name', self.column('stops', 'stop_name')[stop_rows])
+            stop_lats, stop_lons = np.full(end - start, np.nan), np.full(end - start, np.nan)
+            stop_lats[known] = self.column('stops', 'stop_lat')[stop_rows]
+            stop_lons[known] = self.column('stops', 'stop_lon')[stop_rows]
+            stop_columns = {
+                'stop_name': stop_names,
+                'stop_lat': stop_lats,
+                'stop_lon': stop_lons,
+                'arrival_secs': self.column('stop_times', 'arrival_secs')[start:end],
+                'departure_secs': self.column('stop_times', 'departure_secs')[start:end],
+            }
+        return pd.DataFrame({
+            'trip_id': params['trip_id'],
+            'route_id': self.decode('trips', 'route_id', self.column('trips', 'route_id')[code]),
+            'trip_headsign': self.decode('trips', 'trip_headsign', self.column('trips', 'trip_headsign')[code]),
+            **stop_columns,
+            'service_date': str(dates[0]) if len(dates) else None,
+        }, columns=TRIP_DATA_COLUMNS)
+
+    def stop_departures(self, params, as_frame=True):
+        """
+        Equivalent of select_stop_departures.sql for the params {stop_id, service_date, previous_date,
+        after_secs, destination_stop_ids (JSON list), limit}; see stop_departures_result for as_frame.
+        Every departure of the stop after the start time is tested at once: it qualifies if its trip
+        runs on the service day and calls at a destination stop at a later row of stop_times.
+        """
+        limit = params['limit']
+        lo, hi = self._stop_departure_range(params['stop_id'])
+        departure_secs = self.column('stop_departures', 'departure_secs')
+        stop_time_rows = self.column('stop_departures', 'row')
+        trip_codes = self.column('stop_times', 'trip_id')
+        service_ids = self.column('trips', 'service_id')
+        reach_trips, reach_rows = self._destination_reach(params['destination_stop_ids'])
+
+        found = []
+        days = [(params['service_date'], params['after_secs'], 0),
+                # Trips of the previous service day still run after midnight with times past 24:00.
+                (params['previous_date'], params['after_secs'] + 86400, 86400)]
+        for service_date, after_secs, day_offset in days:
+            active = self._active_service_ids(service_date)
+            if not len(active) or not len(reach_trips):
+                continue
+            start = lo + int(np.searchsorted(departure_secs[lo:hi], after_secs, 'left'))
+            rows = np.asarray(stop_time_rows[start:hi])
+            trips = trip_codes[rows]
+            # stop_times is sorted by stop_sequence within a trip, so later stops follow the row.
+            reach = np.minimum(np.searchsorted(reach_trips, trips), len(reach_trips) - 1)
+            qualifies = (reach_trips[reach] == trips) & (reach_rows[reach] > rows) & \
+                np.isin(service_ids[trips], active)
+            for i in np.flatnonzero(qualifies)[:limit]:
+                found.append((int(departure_secs[start + i]) - day_offset, int(rows[i]), service_date))
+
+        found.sort()
+        found = found[:limit]
+        rows = np.array([row for _, row, _ in found], dtype=np.int64)
+        trip_codes = trip_codes[rows]
+        return stop_departures_result({
+            'trip_id': self.decode('trips', 'trip_id', trip_codes),
+            'route_id': self.decode('trips', 'route_id', self.column('trips', 'route_id')[trip_codes]),
+            'trip_headsign': self.decode('trips', 'trip_headsign', self.column('trips', 'trip_headsign')[trip_codes]),
+            'stop_sequence': self.column('stop_times', 'stop_sequence')[rows],
+            'arrival_secs': self.column('stop_times', 'arrival_secs')[rows],
+            'departure_secs': self.column('stop_times', 'departure_secs')[rows],
+            'service_date': [service_date for _, _, service_date in found],
+        }, as_frame)
@@ -0,0 +1,107 @@
+"""
+Compression of JSON responses, negotiated from the Accept-Encoding header of the request.
+
+Responses of at least COMPRESS_MIN_BYTES are compressed with brotli, when the brotli package is
+installed and the client accepts it, otherwise with gzip. Smaller bodies are sent as they are: below
+about a kilobyte compression saves less than it costs. Streamed responses (NDJSON) are compressed chunk
+by chunk and flushed after every chunk, so the client still receives each chunk as soon as it is produced.
+
+A compressed body is a different representation of the resource, so its strong ETag is made weak, as
+nginx does. If-None-Match is compared weakly (see http_caching.not_modified), so a client holding
+either representation still gets 304 Not Modified. Every JSON response, compressed or not, and every
+304 carry Vary: Accept-Encoding, so a cache stores the 304 under the same key as the 200 it revalidates.
+"""
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from flask import request
+
+# Smallest body compressed, in bytes
+COMPRESS_MIN_BYTES = int(os.environ.get('PUBLIC_TRANSPORT_COMPRESS_MIN_BYTES', '1024'))
+# zlib level of gzip and quality of brotli; higher levels cost much more time for a few percent less
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson'}
+
+
+def supported_encodings():
+    """
+    Returns the content codings this process can produce, the preferred one first.
+    """
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate_encoding(accept_encodings):
+    """
+    Returns the supported content coding the client accepts with the highest quality, preferring brotli
+    on ties, or None if the body has to be sent as it is.
+
+    Parameters:
+    - accept_encodings (werkzeug.datastructures.Accept): The parsed Accept-Encoding header.
+    """
+    return accept_encodings.best_match(supported_encodings())
+
+
+def compress(data, encoding):
+    """
+    Returns data (bytes) compressed with the content coding 'br' or 'gzip'.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def iter_compressed(chunks, encoding):
+    """
+    Yields the chunks (bytes) compressed as one stream with the content coding 'br' or 'gzip', flushing
+    the compressor after every chunk. Closes the chunks iterator when done.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    try:
+        for chunk in chunks:
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    """
+    after_request hook compressing JSON and NDJSON responses with the coding negotiated from the request.
+    """
+    if response.status_code == 304:
+        # A 304 has to carry the Vary of the 200 it stands for (RFC 9110, section 15.4.5).
+        response.vary.add('Accept-Encoding')
+        return response
+    if (response.status_code < 200 or response.status_code in (204, 206) or response.direct_passthrough
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not response.is_streamed and response.calculate_content_length() < COMPRESS_MIN_BYTES:
+        return response
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = iter_compressed(response.response, encoding)
+    else:
+        response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
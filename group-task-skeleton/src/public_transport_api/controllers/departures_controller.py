@@ -1,10 +1,69 @@
-from flask import Blueprint, jsonify
+import sqlite3
+from datetime import datetime
+
+from flask import Blueprint, current_app, jsonify, request, stream_with_context
+from loguru import logger
+
+from public_transport_api.database_utils import feed_last_modified, feed_version
+from public_transport_api.http_caching import add_cache_headers, not_modified, resource_etag
+from public_transport_api.json_stream import iter_ndjson
+from public_transport_api.services.departures_service import (get_closest_departures, get_closest_departures_batch,
+                                                              iter_closest_departures_batch)
+
+SUPPORTED_CITIES = {'wroclaw'}
+# Maximum number of queries in one batch request
+MAX_BATCH_QUERIES = 100
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def wants_ndjson():
+    """
+    Returns True if the Accept header of the request prefers newline-delimited JSON to JSON.
+    """
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def ndjson_response(lines):
+    """
+    Returns a response streaming the objects of the lines iterable as newline-delimited JSON, one line
+    sent as soon as it is produced. The iterable runs within the request context.
+    """
+    return current_app.response_class(stream_with_context(iter_ndjson(lines, chunk_size=1)), mimetype=NDJSON_MIMETYPE)
+
+
+def parse_route_parameters(start_coordinates, end_coordinates, start_time):
+    """
+    Validates the start_coordinates, end_coordinates and start_time parameters of a request.
+    Returns ((start_lat, start_lon), (end_lat, end_lon), start_time as datetime).
+    Raises ValueError with the error message for the client.
+    """
+    missing = []
+    if not start_coordinates:
+        missing.append('start_coordinates')
+    if not end_coordinates:
+        missing.append('end_coordinates')
+    if not start_time:
+        missing.append('start_time')
+    if missing:
+        raise ValueError(f'Missing required parameters: {", ".join(missing)}')
+
+    try:
+        start_lat, start_lon = map(float, start_coordinates.split(','))
+        end_lat, end_lon = map(float, end_coordinates.split(','))
+    except Exception:
+        raise ValueError('Invalid coordinates format. Use lat,lon.')
+
+    try:
+        start_time_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+    except Exception:
+        raise ValueError('Invalid start_time format. Use ISO8601 format.')
+
+    return (start_lat, start_lon), (end_lat, end_lon), start_time_dt
 
-from public_transport_api.services.departures_service import get_closest_departures
 
 departures_bp = Blueprint('departures', __name__, url_prefix='/public_transport/city/<string:city>/closest_departures')
 
-@departures_bp.route("/", methods=["GET"])
+@departures_bp.route("", methods=["GET"])
 def closest_departures(city):
     """
     The endpoint returns the closest departures of lines that bring the user closer to the destination.
@@ -20,6 +79,144 @@ def closest_departures(city):
         - end_coordinates (required): The geolocation coordinates where the user wants to finish the trip.
         - start_time (optional, default: current time): The time at which the us-er starts the trip.
         - limit (optional, default: 5): The maximum number of departures to be returned.
+
+    With "Accept: application/x-ndjson" the response is newline-delimited JSON: the metadata object as
+    the first line, then one line per departure.
+    Responses carry an ETag and Last-Modified derived from the feed version and the parameters;
+    conditional requests that match are answered with 304 Not Modified.
     """
-    # TODO handle request parameters and add the metadata. Include error handling.
-    return jsonify(get_closest_departures())
\ No newline at end of file
+    start_coordinates = request.args.get('start_coordinates')
+    end_coordinates = request.args.get('end_coordinates')
+    start_time = request.args.get('start_time')
+    limit = request.args.get('limit', default=5, type=int)
+
+    try:
+        start, end, start_time_dt = parse_route_parameters(start_coordinates, end_coordinates, start_time)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if city.lower() not in SUPPORTED_CITIES:
+        return jsonify({'error': f'City {city} is not supported.'}), 404
+
+    ndjson = wants_ndjson()
+    try:
+        # The response only depends on the feed, the parameters and the format, so a client's copy can be
+        # validated before any query runs.
+        etag = resource_etag(feed_version(), 'closest_departures', city, start_coordinates, end_coordinates,
+                             start_time, limit, *(['ndjson'] if ndjson else []))
+        last_modified = feed_last_modified()
+        response = not_modified(etag, last_modified)
+        if response is not None:
+            response.vary.add('Accept')
+            return response
+        departures = get_closest_departures(start, end, start_time_dt, limit)
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        return jsonify({'error': 'Internal server error.'}), 500
+
+    metadata = {
+            "self": f"/public_transport/city/{city}/closest_departures?start_coordinates={start_coordinates}&end_coordinates={end_coordinates}&start_time={start_time}&limit={limit}",
+            "city": city,
+            "query_parameters": {
+                "start_coordinates": start_coordinates,
+                "end_coordinates": end_coordinates,
+                "start_time": start_time,
+                "limit": limit
+            }
+        }
+    if ndjson:
+        response = ndjson_response([{"metadata": metadata}, *departures])
+    else:
+        response = jsonify({"metadata": metadata, "departures": departures})
+    response.vary.add('Accept')
+    return add_cache_headers(response, etag, last_modified)
+
+
+@departures_bp.route("/batch", methods=["POST"])
+def closest_departures_batch(city):
+    """
+    The batch variant of closest_departures: answers many queries in one request, sharing the stop
+    lookups and departure scans that the queries have in common.
+
+    Request Parameters:
+        Path Parameters:
+        - city (required): The city for the public transport search. Currently, only "wroclaw" is supported.
+        JSON Body:
+        - queries (required): A list of at most MAX_BATCH_QUERIES objects with the query parameters of
+          closest_departures: start_coordinates, end_coordinates, start_time and optionally limit.
+
+    Returns the departures of every query under "results", in the order of the queries.
+    With "Accept: application/x-ndjson" the response is newline-delimited JSON instead: the metadata
+    object as the first line, then one line per query with its query_parameters and departures, each
+    sent as soon as the query is answered. A database error after the first line ends the stream with an
+    {"error": ...} line.
+    """
+    body = request.get_json(silent=True)
+    queries = body.get('queries') if isinstance(body, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return jsonify({'error': 'Missing required parameters: queries'}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'Too many queries. At most {MAX_BATCH_QUERIES} are allowed.'}), 400
+
+    parsed = []
+    for index, query in enumerate(queries):
+        try:
+            if not isinstance(query, dict):
+                raise ValueError('Every query must be an object.')
+            start, end, start_time_dt = parse_route_parameters(query.get('start_coordinates'),
+                                                               query.get('end_coordinates'), query.get('start_time'))
+            try:
+                limit = int(query.get('limit', 5))
+            except (TypeError, ValueError):
+                raise ValueError('Invalid limit format. Use an integer.')
+        except ValueError as e:
+            return jsonify({'error': f'Query {index}: {e}'}), 400
+        parsed.append((start, end, start_time_dt, limit))
+
+    if city.lower() not in SUPPORTED_CITIES:
+        return jsonify({'error': f'City {city} is not supported.'}), 404
+
+    metadata = {
+        "self": f"/public_transport/city/{city}/closest_departures/batch",
+        "city": city,
+        "query_count": len(queries)
+    }
+    query_parameters = [
+        {
+            "start_coordinates": query['start_coordinates'],
+            "end_coordinates": query['end_coordinates'],
+            "start_time": query['start_time'],
+            "limit": limit
+        }
+        for query, (_, _, _, limit) in zip(queries, parsed)
+    ]
+
+    if wants_ndjson():
+        def lines():
+            yield {"metadata": metadata}
+            try:
+                for parameters, departures in zip(query_parameters, iter_closest_departures_batch(parsed)):
+                    yield {"query_parameters": parameters, "departures": departures}
+            except sqlite3.Error as e:
+                logger.error(f"Database error: {e}")
+                yield {'error': 'Internal server error.'}
+
+        response = ndjson_response(lines())
+        response.vary.add('Accept')
+        return response
+
+    try:
+        results = get_closest_departures_batch(parsed)
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        return jsonify({'error': 'Internal server error.'}), 500
+
+    response = jsonify({
+        "metadata": metadata,
+        "results": [
+            {"query_parameters": parameters, "departures": departures}
+            for parameters, departures in zip(query_parameters, results)
+        ]
+    })
+    response.vary.add('Accept')
+    return response
@@ -0,0 +1,68 @@
+import sqlite3
+
+from flask import Blueprint, jsonify, request
+from loguru import logger
+
+from public_transport_api.controllers.departures_controller import SUPPORTED_CITIES, parse_route_parameters
+from public_transport_api.services.journey_service import plan_journeys
+
+journey_bp = Blueprint('journey', __name__, url_prefix='/public_transport/city/<string:city>/journey')
+# Maximum number of journeys in one request; every journey is another earliest-arrival scan
+MAX_JOURNEYS = 10
+
+@journey_bp.route("", methods=["GET"])
+def journey(city):
+    """
+    The endpoint returns the journeys from start_coordinates to end_coordinates that arrive the earliest,
+    combining walks and rides with transfers, planned with the Connection Scan Algorithm.
+    The first journey arrives the earliest; each following one leaves later than the previous one.
+
+    Request Parameters:
+        Path Parameters:
+        - city (required): The city for the public transport search. Currently, only "wroclaw" is supported.
+        Query Parameters:
+        - start_coordinates (required): The geolocation coordinates where the user wants to start the trip.
+        - end_coordinates (required): The geolocation coordinates where the user wants to finish the trip.
+        - start_time (required): The time at which the user starts the trip.
+        - limit (optional, default: 3): The maximum number of journeys to be returned, from 1 to MAX_JOURNEYS.
+
+    Every journey has its departure_time, arrival_time, duration (seconds), number of transfers and legs.
+    A leg has a mode ("walk" or "transit"), from and to places (stops have an id and a name, the start
+    and end points only coordinates) and departure_time and arrival_time; transit legs also have the
+    trip_id, route_id, trip_headsign and the number of stops ridden (stop_count).
+    """
+    start_coordinates = request.args.get('start_coordinates')
+    end_coordinates = request.args.get('end_coordinates')
+    start_time = request.args.get('start_time')
+    limit = request.args.get('limit', default=3, type=int)
+
+    try:
+        start, end, start_time_dt = parse_route_parameters(start_coordinates, end_coordinates, start_time)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if city.lower() not in SUPPORTED_CITIES:
+        return jsonify({'error': f'City {city} is not supported.'}), 404
+
+    if not 1 <= limit <= MAX_JOURNEYS:
+        return jsonify({'error': f'The limit must be between 1 and {MAX_JOURNEYS}.'}), 400
+
+    try:
+        journeys = plan_journeys(start, end, start_time_dt, limit)
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        return jsonify({'error': 'Internal server error.'}), 500
+
+    return jsonify({
+        "metadata": {
+            "self": f"/public_transport/city/{city}/journey?start_coordinates={start_coordinates}&end_coordinates={end_coordinates}&start_time={start_time}&limit={limit}",
+            "city": city,
+            "query_parameters": {
+                "start_coordinates": start_coordinates,
+                "end_coordinates": end_coordinates,
+                "start_time": start_time,
+                "limit": limit
+            }
+        },
+        "journeys": journeys
+    })
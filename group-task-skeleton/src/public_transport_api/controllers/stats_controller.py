@@ -0,0 +1,37 @@
+import os
+
+from flask import Blueprint, jsonify
+
+from public_transport_api.prefork import memory_report
+from public_transport_api.response_cache import CACHES
+
+stats_bp = Blueprint('stats', __name__, url_prefix='/public_transport/stats')
+# The stats reveal cache contents and process layout, so they are only served when enabled.
+STATS_ENABLED = os.environ.get('PUBLIC_TRANSPORT_STATS', '0') == '1'
+
+@stats_bp.before_request
+def require_stats_enabled():
+    """
+    Answers 404 to every stats request unless PUBLIC_TRANSPORT_STATS=1.
+    """
+    if not STATS_ENABLED:
+        return jsonify({'error': 'Not found.'}), 404
+    return None
+
+
+@stats_bp.route("/caches", methods=["GET"])
+def cache_stats():
+    """
+    Returns the size, limits and hit, miss, eviction and expiration counters of every response cache
+    of this process, by cache name.
+    """
+    return jsonify({name: cache.stats() for name, cache in CACHES.items()})
+
+
+@stats_bp.route("/memory", methods=["GET"])
+def memory_stats():
+    """
+    Returns the RSS, PSS and shared and private memory in MB of the pre-fork master and every worker
+    (of this process only when not served by prefork.py).
+    """
+    return jsonify(memory_report())
@@ -1,7 +1,23 @@
-from flask import Blueprint, jsonify
+import os
+import sqlite3
+from datetime import datetime, time, timedelta, timezone
+
+from flask import Blueprint, current_app, jsonify
+from loguru import logger
 
 # Adjust import path based on your project structure
+from public_transport_api.controllers.departures_controller import SUPPORTED_CITIES
+from public_transport_api.database_utils import feed_last_modified, feed_version
+from public_transport_api.http_caching import HTTP_MAX_AGE_SECS, add_cache_headers, not_modified, resource_etag
+from public_transport_api.response_cache import ResponseCache
 from public_transport_api.services.trips_service import get_trip_details
+from public_transport_api.time_utils import FEED_TIMEZONE
+
+# Serialised trip details responses kept per process (0 disables the cache) and their time to live
+TRIP_CACHE_SIZE = int(os.environ.get('PUBLIC_TRANSPORT_TRIP_CACHE_SIZE', '1024'))
+TRIP_CACHE_TTL_SECS = float(os.environ.get('PUBLIC_TRANSPORT_TRIP_CACHE_TTL', '300'))
+
+trip_details_cache = ResponseCache('trip_details', TRIP_CACHE_SIZE, TRIP_CACHE_TTL_SECS)
 
 trips_bp = Blueprint('trips', __name__, url_prefix='/public_transport/city/<string:city>/trip')
 
@@ -24,8 +40,10 @@ def handle_trip_details(city, trip_id):
         - trip_details: Details of the trip, including trip_id, route_id, trip_headsign, and a list of stops with their names, coordinates, arrival times, and departure times.
 
     Errors:
-        - 400 Bad Request: If the city is not "wroclaw".
-        - 404 Not Found: If the trip with the specified trip_id is not found.
+        - 404 Not Found: If the city is not "wroclaw" or the trip with the specified trip_id is not found.
+
+    Responses are cached per feed version and day (see TRIP_CACHE_SIZE and TRIP_CACHE_TTL_SECS), and
+    carry an ETag and Last-Modified so that conditional requests are answered with 304 Not Modified.
 
     Example Response:
     {
@@ -69,5 +87,41 @@ def handle_trip_details(city, trip_id):
             ]
         }
     """
-    # TODO handle the city and the metadata. Add also error handling (i.e.: 404)
-    return jsonify(get_trip_details(trip_id))
\ No newline at end of file
+    if city.lower() not in SUPPORTED_CITIES:
+        return jsonify({'error': f'City {city} is not supported.'}), 404
+
+    try:
+        # Stop times are given for the next day the trip runs, so the response also depends on the date:
+        # it changes with the feed and at midnight.
+        now = datetime.now(FEED_TIMEZONE)
+        version = feed_version()
+        etag = resource_etag(version, 'trip', city, trip_id, now.date())
+        midnight = datetime.combine(now.date(), time(), FEED_TIMEZONE)
+        last_modified = max(filter(None, [feed_last_modified(), midnight.astimezone(timezone.utc)]))
+        max_age = min(HTTP_MAX_AGE_SECS, int((midnight + timedelta(days=1) - now).total_seconds()))
+        response = not_modified(etag, last_modified, max_age)
+        if response is not None:
+            return response
+        cache_key = (version, city, trip_id, now.date())
+        body = trip_details_cache.get(cache_key)
+        if body is not None:
+            response = current_app.response_class(body, mimetype='application/json')
+            return add_cache_headers(response, etag, last_modified, max_age)
+        trip_details = get_trip_details(trip_id)
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        return jsonify({'error': 'Internal server error.'}), 500
+
+    if trip_details is None:
+        return jsonify({'error': f'Trip {trip_id} not found.'}), 404
+
+    response = jsonify({
+        "metadata": {
+            "self": f"/public_transport/city/{city}/trip/{trip_id}",
+            "city": city,
+            "trip_id": trip_id
+        },
+        "trip_details": trip_details
+    })
+    trip_details_cache.put(cache_key, response.get_data())
+    return add_cache_headers(response, etag, last_modified, max_age)
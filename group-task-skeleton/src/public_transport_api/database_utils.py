@@ -1,41 +1,157 @@
+import hashlib
+import os
 import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import cached_property, lru_cache
+from operator import itemgetter
+from pathlib import Path
+from flask import g, has_app_context
 from loguru import logger
 
 import pandas as pd
 import json
 
-# Example DataFrame
-
-
-def stops_list(group):
-    return [
-        {
-            "name": row['stop_name'],
-            "coordinates": {
-                "latitude": row['stop_lat'],
-                "longitude": row['stop_lon']
-            },
-            "arrival_time": row['arrival_time'],
-            "departure_time": row['departure_time']
-        }
-        for _, row in group.iterrows()
-    ]
-
-def departures_json(df):
-    result = []
-    for (trip_id, route_id, trip_headsign), group in df.groupby(
-            ['trip_id', 'route_id', 'trip_headsign']):
-        trip = {
-            "trip_details": {
-                "trip_id": trip_id,
-                "route_id": route_id,
-                "trip_headsign": trip_headsign,
-                "stops": stops_list(group)
-            }
-        }
-        result.append(trip)
-    json_str = json.dumps(result, indent=4, ensure_ascii=False)
-    return json_str
+from public_transport_api.columnar_store import TRIP_DATA_COLUMNS, ColumnarFeed, current_snapshot
+from public_transport_api.json_stream import iter_json_array, to_native, trips_from_rows
+from public_transport_api.query_registry import QueryRegistry
+from public_transport_api.time_utils import format_service_times
+
+# Timetable database created by tools/database_tool.py
+DB_PATH = os.environ.get('PUBLIC_TRANSPORT_DB', 'trips.sqlite')
+# Folder with the .sql files used by the services
+SQL_DIR = os.environ.get('PUBLIC_TRANSPORT_SQL_DIR', str(Path(__file__).resolve().parents[2] / 'sql'))
+# Columnar snapshot (database_tool.py --columnar-dir); when set it is served instead of DB_PATH
+COLUMNAR_DIR = os.environ.get('PUBLIC_TRANSPORT_COLUMNAR_DIR')
+# Reuse one read-only connection per thread instead of connecting for every request
+POOL_ENABLED = os.environ.get('PUBLIC_TRANSPORT_DB_POOL', '1') == '1'
+# Pragmas of pooled connections: bytes of the database file memory-mapped, and the page cache
+# (negative values are KiB, i.e. 64 MB per connection)
+POOL_PRAGMAS = {
+    'mmap_size': int(os.environ.get('PUBLIC_TRANSPORT_DB_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': int(os.environ.get('PUBLIC_TRANSPORT_DB_CACHE_SIZE', '-65536')),
+}
+# Prepared statements kept per connection (sqlite3 keeps 128 by default)
+CACHED_STATEMENTS = 256
+
+# Columns of the DataFrames serialised by departures_json, the rows of select_trip_data.sql; the first
+# three identify a trip
+DEPARTURE_TRIP_COLUMNS = TRIP_DATA_COLUMNS
+
+
+def _present(value):
+    # None, and NaN which differs from itself, are missing.
+    return value is not None and value == value
+
+
+def departure_trips(df):
+    """
+    Yields the {"trip_details": {...}} objects of a DataFrame with DEPARTURE_TRIP_COLUMNS, one per trip
+    in (trip_id, route_id, trip_headsign) order, with the trip's rows as its stops. Service times are
+    formatted as UTC timestamps on the service_date of their row in one vectorized step. Missing
+    values, e.g. of the one row of a trip without stop times, are None.
+    The rows are read column-wise as Python values instead of one Series per row.
+    """
+    # Like groupby, drop the rows of trips without a key.
+    rows = [row for row in zip(*(df[col].tolist() for col in DEPARTURE_TRIP_COLUMNS))
+            if _present(row[0]) and _present(row[1]) and _present(row[2])]
+    # Stable, and linear when the rows already come ordered by trip
+    rows.sort(key=itemgetter(0, 1, 2))
+    timed = [i for i, row in enumerate(rows) if _present(row[6]) and _present(row[7]) and _present(row[8])]
+    times = format_service_times([rows[i][8] for i in timed] * 2, [rows[i][6] for i in timed] +
+                                 [rows[i][7] for i in timed]) if timed else []
+    formatted = dict(zip(timed, zip(times[:len(timed)], times[len(timed):])))
+    return trips_from_rows((*row[:3], *(value if _present(value) else None for value in row[3:6]),
+                            *formatted.get(i, (None, None))) for i, row in enumerate(rows))
+
+
+def iter_departures_json(df):
+    """
+    Yields the compact JSON array of departure_trips(df) as chunks of UTF-8 bytes.
+    """
+    return iter_json_array(departure_trips(df))
+
+
+def departures_json(df, indent=None):
+    """
+    Returns the compact JSON text of departure_trips(df), the form of iter_departures_json, or with
+    indent (e.g. 4) the pretty-printed text for reading.
+    """
+    if indent is None:
+        return b''.join(iter_departures_json(df)).decode('utf-8')
+    return json.dumps(list(departure_trips(df)), indent=indent, ensure_ascii=False, default=to_native)
+
+
+def connect(db_path=None):
+    """
+    Opens a read-only connection to the timetable database (DB_PATH by default).
+    A missing database raises sqlite3.OperationalError instead of creating an empty file.
+    """
+    uri = Path(db_path or DB_PATH).resolve().as_uri() + '?mode=ro'
+    return sqlite3.connect(uri, uri=True)
+
+
+def connect_immutable(db_path=None):
+    """
+    Opens a read-only connection with the immutable flag and POOL_PRAGMAS. An immutable database is read
+    without any locking or change detection, which is safe because tools/database_tool.py never writes to
+    a published file: it publishes a new file with a rename, and an open connection keeps reading the
+    file it opened.
+    """
+    uri = Path(db_path or DB_PATH).resolve().as_uri() + '?mode=ro&immutable=1'
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=True, cached_statements=CACHED_STATEMENTS)
+    for pragma, value in POOL_PRAGMAS.items():
+        conn.execute(f'PRAGMA {pragma} = {int(value)}')
+    return conn
+
+
+def file_key(path):
+    """
+    Identifies the file published at path: its inode, size and modification time change with every
+    publish. Returns None if there is no file.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return os.path.abspath(path), stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def sql_path(file_name):
+    """
+    Returns the path of a query file in SQL_DIR.
+    """
+    return os.path.join(SQL_DIR, file_name)
+
+
+@lru_cache(maxsize=None)
+def query_registry():
+    """
+    Returns the QueryRegistry of SQL_DIR, read once per process.
+    """
+    return QueryRegistry(SQL_DIR)
+
+
+def read_query(file_name):
+    """
+    Returns the text of a query file in SQL_DIR, read once per process.
+    """
+    return query_registry().sql(file_name)
+
+
+def validate_queries(db_path=None):
+    """
+    Checks every query of SQL_DIR against the schema of the database (DB_PATH by default) and logs the
+    number of validated queries. Raises sqlite3.Error if the database cannot be opened or a query does not compile.
+    """
+    conn = connect(db_path)
+    try:
+        plans = query_registry().validate(conn)
+    finally:
+        conn.close()
+    logger.info(f"Validated {len(plans)} queries of {SQL_DIR}")
+    return plans
 
 
 def execute_query_from_file(conn, query_file_path, params=None):
@@ -68,21 +184,203 @@ def execute_query_from_file(conn, query_file_path, params=None):
         raise
 
 
+class SqliteFeed:
+    """
+    Timetable read backend running the queries of the QueryRegistry of SQL_DIR on a database connection.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @cached_property
+    def version(self):
+        """
+        Identifies the imported feed by the content hashes of its files, as seen by this connection.
+        """
+        rows = query_registry().fetch(self.conn, 'select_feed_version')
+        return hashlib.sha256(''.join(f'{filename}:{sha256};' for filename, sha256 in rows).encode()).hexdigest()
+
+    @cached_property
+    def last_modified(self):
+        """
+        UTC time of the latest import that changed a file of the feed, or None for a database without
+        import metadata.
+        """
+        imported_at = query_registry().fetch(self.conn, 'select_feed_imported_at')[0][0]
+        if imported_at is None:
+            return None
+        # SQLite's CURRENT_TIMESTAMP is UTC
+        return datetime.fromisoformat(imported_at).replace(tzinfo=timezone.utc)
+
+    def all_stops(self):
+        return query_registry().fetch_frame(self.conn, 'select_all_stops')
 
+    def trip_data(self, params):
+        return query_registry().fetch_frame(self.conn, 'select_trip_data', params)
 
-if __name__ == '__main__':
-    db_path = r'C:\Users\kdolata\PycharmProjects\prompt_engineering_group\group-task-skeleton\trips.sqlite'
-    file_path = r'C:\Users\kdolata\PycharmProjects\prompt_engineering_group\group-task-skeleton\sql\select_trip_data.sql'
+    def stop_departures(self, params, as_frame=True):
+        """
+        Returns the rows of select_stop_departures.sql as a DataFrame, or as tuples with as_frame=False.
+        """
+        if as_frame:
+            return query_registry().fetch_frame(self.conn, 'select_stop_departures', params)
+        return query_registry().fetch(self.conn, 'select_stop_departures', params)
 
-    parameters = {'trip_id': '3_14445093'}
 
-    connection = sqlite3.connect(db_path)
+@lru_cache(maxsize=2)
+def columnar_feed(snapshot_dir):
+    """
+    Returns the ColumnarFeed of a snapshot version folder, mapped once per process.
+    """
+    return ColumnarFeed(snapshot_dir)
+
+
+class ConnectionPool:
+    """
+    One SqliteFeed per thread on an immutable read-only connection to DB_PATH (see connect_immutable),
+    reused by the requests the thread serves.
+
+    Connections are replaced when a new database is published at DB_PATH, so every request reads the
+    latest version without connecting again in the common case. The feed's version is computed once per
+    connection. Each thread only ever uses its own connection, as sqlite3 requires.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def feed(self):
+        """
+        Returns the calling thread's SqliteFeed on the database currently published at DB_PATH.
+        """
+        held = getattr(self._local, 'held', None)
+        key = file_key(DB_PATH)
+        if held is not None and key is not None and held[0] == key:
+            return held[1]
+        self.close()
+        while True:
+            conn = connect_immutable()
+            try:
+                # Open the file, then check that it was not replaced since it was stat()ed.
+                conn.execute('PRAGMA schema_version').fetchone()
+            except sqlite3.Error:
+                conn.close()
+                raise
+            opened_key = file_key(DB_PATH)
+            if opened_key == key:
+                break
+            conn.close()
+            key = opened_key
+        feed = SqliteFeed(conn)
+        self._local.held = (key, feed)
+        return feed
+
+    def close(self):
+        """
+        Closes the calling thread's connection.
+        """
+        held = getattr(self._local, 'held', None)
+        if held is not None:
+            held[1].conn.close()
+            self._local.held = None
+
+    def forget(self):
+        """
+        Drops every connection without closing it, in a forked process: they belong to the parent.
+        """
+        self._local = threading.local()
+
+
+connection_pool = ConnectionPool()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: connection_pool.forget())
+
+
+@contextmanager
+def open_feed():
+    """
+    Yields the timetable read backend: the version of the columnar snapshot in COLUMNAR_DIR
+    published at the time of the call if configured, otherwise a SqliteFeed on DB_PATH.
+    With POOL_ENABLED the SqliteFeed is the thread's pooled one, and within a Flask app context all
+    calls get the feed the request opened first (kept in flask.g); otherwise it is a new read-only
+    connection that is closed on exit.
+    The backend is resolved per request, so a feed published by the importer is picked up by the
+    next request while requests in flight finish on the version they opened.
+    """
+    if COLUMNAR_DIR:
+        yield columnar_feed(current_snapshot(COLUMNAR_DIR))
+        return
+    with open_sqlite_feed() as feed:
+        yield feed
 
-    result = execute_query_from_file(
-        conn=connection,
-        query_file_path=file_path,
-        params=parameters
-    )
 
-    json_departures = departures_json(result)
-    print(1)
\ No newline at end of file
+@contextmanager
+def open_sqlite_feed():
+    """
+    Yields the SqliteFeed on DB_PATH that open_feed() serves when no columnar snapshot is configured.
+    """
+    if POOL_ENABLED:
+        if has_app_context():
+            if 'feed' not in g:
+                g.feed = connection_pool.feed()
+            yield g.feed
+        else:
+            yield connection_pool.feed()
+        return
+    conn = connect()
+    try:
+        yield SqliteFeed(conn)
+    finally:
+        conn.close()
+
+
+# (version, last_modified) of the file published at DB_PATH by file_key, shared by the serving threads
+_published_by_file = {}
+_published_lock = threading.Lock()
+
+
+def published_feed():
+    """
+    Returns (version, last_modified) of the feed open_feed() would serve right now, without a query
+    while the published file is unchanged: the importer publishes a new database with a rename, so its
+    file_key identifies the version read from it. For the columnar snapshot the version is the name of
+    the current version folder.
+    """
+    if COLUMNAR_DIR:
+        feed = columnar_feed(current_snapshot(COLUMNAR_DIR))
+        return feed.version, feed.last_modified
+    return published_sqlite_feed()
+
+
+def published_sqlite_feed():
+    """
+    Returns (version, last_modified) of the SQLite database published at DB_PATH, queried once per
+    published file; see published_feed.
+    """
+    key = file_key(DB_PATH)
+    with _published_lock:
+        published = _published_by_file.get(key)
+    if published is None:
+        # Without a file, connecting raises the same sqlite3.OperationalError as a request would.
+        # Queried outside the lock: threads racing on a new file compute the same value.
+        with open_sqlite_feed() as feed:
+            published = feed.version, feed.last_modified
+        if key is not None:
+            with _published_lock:
+                _published_by_file.clear()
+                _published_by_file[key] = published
+    return published
+
+
+def feed_version():
+    """
+    Returns the version of the feed open_feed() would serve right now; see published_feed.
+    """
+    return published_feed()[0]
+
+
+def feed_last_modified():
+    """
+    Returns the UTC time the feed open_feed() would serve right now was imported; see published_feed.
+    """
+    return published_feed()[1]
+
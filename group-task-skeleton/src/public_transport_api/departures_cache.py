@@ -0,0 +1,194 @@
+"""
+Quantised cache of the departure scans behind closest_departures.
+
+Requests carry raw coordinates and start times to the second, so whole responses hardly ever repeat.
+What nearby requests do share is the scan of a stop's departures towards a destination area, and that
+is what is cached: per stop, per cell of a GRID_M grid around the end coordinates and per BUCKET_SECS
+bucket of the start time. The stops around the start coordinates are not quantised: they are looked
+up exactly in the stop index, and every request from anywhere around a busy stop shares its scans.
+
+A stop is scanned once per bucket, from the start of the bucket, towards two sets of destination stops
+around the centre of the end cell: the core, within SEARCH_RADIUS_M minus the margin (the distance from
+the centre to the farthest point of the cell), which are destinations of every point of the cell, and
+the superset, within SEARCH_RADIUS_M plus the margin, which holds the destinations of every point of the
+cell. A request trims the superset departures to its start time. When the first ones it needs all reach
+a core stop too, they are exactly the departures the uncached query returns. Otherwise the stop is
+scanned, again once per bucket, towards the exact destination stops of the request, which repeat for
+requests to the same place.
+
+Cached departures carry their arrival and departure times already formatted (FormattedDeparture), so
+a request answered from the cache skips the formatting step too. Scans are kept in an LRU ResponseCache
+of DEPARTURES_CACHE_SIZE entries (0 disables the cache) keyed by feed version. While a new feed is
+published, requests still served from the previous version keep hitting its scans; once no request
+reads them they are evicted by the new version's scans or expire after DEPARTURES_CACHE_TTL_SECS.
+
+The defaults are chosen for hits rather than precision, because a coarser grid or bucket never changes
+a result, only the work per miss. Kiosk-like traffic (tools/benchmark.py departures-cache: points
+around 8 busy stops towards 24 destinations within an hour) hits 14% of the scans with 100 m cells and
+5-minute buckets, and 32% with 250 m and 15 minutes, the fastest of the settings tried; requests take
+about a third of their uncached time.
+"""
+import json
+import math
+import os
+from collections import namedtuple
+
+from public_transport_api.columnar_store import STOP_DEPARTURES_COLUMNS
+from public_transport_api.geo import haversine_m
+from public_transport_api.response_cache import ResponseCache
+from public_transport_api.spatial_index import METRES_PER_DEGREE
+from public_transport_api.time_utils import format_service_time
+
+# Cached stop scans per process (0 disables the cache) and their time to live
+DEPARTURES_CACHE_SIZE = int(os.environ.get('PUBLIC_TRANSPORT_DEPARTURES_CACHE_SIZE', '4096'))
+DEPARTURES_CACHE_TTL_SECS = float(os.environ.get('PUBLIC_TRANSPORT_DEPARTURES_CACHE_TTL', '900'))
+# Edge of the grid cells the end coordinates are snapped to, in metres
+GRID_M = float(os.environ.get('PUBLIC_TRANSPORT_DEPARTURES_GRID_M', '250'))
+# Length of the start time buckets, in seconds
+BUCKET_SECS = int(os.environ.get('PUBLIC_TRANSPORT_DEPARTURES_BUCKET_SECS', '900'))
+# Departures scanned beyond those a request asks for, to cover the departures between the start of the
+# bucket and the start time
+EXTRA_DEPARTURES = 4
+# Added to the margin of a cell against rounding errors, in metres
+MARGIN_EPSILON_M = 1.0
+
+# A row of select_stop_departures.sql with its formatted arrival and departure times
+FormattedDeparture = namedtuple('FormattedDeparture', STOP_DEPARTURES_COLUMNS + ['arrival_time', 'departure_time'])
+
+
+def grid_cell(coordinates, grid_m=GRID_M):
+    """
+    Returns ((row, column), (centre_lat, centre_lon), margin_m) of the grid cell of coordinates.
+    Cells are grid_m high and grid_m wide at their centre; margin_m is the distance from the centre to
+    the farthest point of the cell.
+    """
+    lat_step = grid_m / METRES_PER_DEGREE
+    row = math.floor(coordinates[0] / lat_step)
+    centre_lat = (row + 0.5) * lat_step
+    lon_step = grid_m / (METRES_PER_DEGREE * max(math.cos(math.radians(centre_lat)), 0.01))
+    column = math.floor(coordinates[1] / lon_step)
+    centre_lon = (column + 0.5) * lon_step
+    corners_lat = [centre_lat - lat_step / 2, centre_lat + lat_step / 2] * 2
+    corners_lon = [centre_lon - lon_step / 2] * 2 + [centre_lon + lon_step / 2] * 2
+    margin_m = float(haversine_m(centre_lat, centre_lon, corners_lat, corners_lon).max()) + MARGIN_EPSILON_M
+    return (row, column), (centre_lat, centre_lon), margin_m
+
+
+class DeparturesCache(ResponseCache):
+    """
+    ResponseCache of the stop departure scans shared by the closest_departures requests towards the same
+    grid cell in the same time bucket; see the module docstring.
+    """
+
+    def __init__(self, max_size=DEPARTURES_CACHE_SIZE, ttl_secs=DEPARTURES_CACHE_TTL_SECS, grid_m=GRID_M,
+                 bucket_secs=BUCKET_SECS):
+        """
+        Parameters:
+        - max_size (int): Maximum number of cached stop scans; 0 disables the cache.
+        - ttl_secs (float): Seconds after which a scan expires.
+        - grid_m (float): Edge of the grid cells of the end coordinates in metres.
+        - bucket_secs (int): Length of the start time buckets in seconds.
+        """
+        super().__init__('closest_departures', max_size, ttl_secs)
+        self.grid_m = grid_m
+        self.bucket_secs = bucket_secs
+        self.exact_scans = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def departures_at(self, version, end_coordinates, destination_stop_ids, service_date, after_secs, radius_m,
+                      stops_within, scan):
+        """
+        Returns a departures_at(stop, count) function for merge_departures answering the request from
+        the cached scans.
+
+        Parameters:
+        - version (str): Version of the feed the request is served from.
+        - end_coordinates (tuple[float, float]): End coordinates of the request.
+        - destination_stop_ids (str): JSON list of the stops within radius_m of end_coordinates.
+        - service_date (date), after_secs (int): Start time of the request as a service time.
+        - radius_m (float): Radius around the end coordinates that destination stops lie within.
+        - stops_within (callable): stops_within(coordinates, radius_m) returns (distance_m, stop) tuples.
+        - scan (callable): scan(stop, destination_stop_ids, after_secs, count) returns at most `count`
+          (time_key, departure) tuples of the stop in time order, of trips calling later at one of the
+          destination_stop_ids.
+        """
+        cell, centre, margin_m = grid_cell(end_coordinates, self.grid_m)
+        bucket_start = after_secs - after_secs % self.bucket_secs
+        cell_destinations = {}
+
+        def cell_stop_ids(radius):
+            if radius not in cell_destinations:
+                cell_destinations[radius] = _stop_ids_json(stops_within(centre, radius) if radius >= 0 else [])
+            return cell_destinations[radius]
+
+        def scan_cell(stop, count):
+            superset = _formatted(scan(stop, cell_stop_ids(radius_m + margin_m), bucket_start, count))
+            core = scan(stop, cell_stop_ids(radius_m - margin_m), bucket_start, count)
+            # Departures later than the last core one may reach a core stop beyond the scan.
+            core_until = core[-1][0] if len(core) == count else math.inf
+            return count, superset, frozenset(_departure_id(row) for _, row in core), core_until
+
+        def scan_destinations(stop, count):
+            return count, _formatted(scan(stop, destination_stop_ids, bucket_start, count))
+
+        def bucket_scan(key, stop, count, scan_bucket):
+            """
+            Returns the cached entry of key and its first `count` departures after the start time, scanning
+            the stop from the start of the bucket with scan_bucket(stop, scanned) when the entry is missing
+            or holds too few of them.
+            """
+            entry = self.get(key)
+            while True:
+                if entry is not None:
+                    scanned, rows = entry[0], entry[1]
+                    later = [(time_key, row) for time_key, row in rows if time_key >= after_secs]
+                    # A scan that found fewer departures than it asked for holds all of them.
+                    if len(later) >= count or len(rows) < scanned:
+                        return entry, later[:count]
+                    scanned *= 2
+                else:
+                    scanned = count + EXTRA_DEPARTURES
+                entry = scan_bucket(stop, scanned)
+                self.put(key, entry)
+
+        def departures_at(stop, count):
+            key = (version, int(stop.stop_id), service_date, bucket_start)
+            (_, _, core_ids, core_until), departures = bucket_scan((*key, cell), stop, count, scan_cell)
+            if all(time_key < core_until and _departure_id(row) in core_ids for time_key, row in departures):
+                return departures
+            # Some of them only reach stops near the edge of the radius: scan towards the exact destinations.
+            with self._lock:
+                self.exact_scans += 1
+            return bucket_scan((*key, destination_stop_ids), stop, count, scan_destinations)[1]
+
+        return departures_at
+
+    def stats(self):
+        """
+        Returns the ResponseCache stats and the number of stops answered from a scan towards the exact
+        destination stops of a request because the scan of its end cell could not answer it.
+        """
+        stats = super().stats()
+        with self._lock:
+            return {**stats, "exact_scans": self.exact_scans}
+
+
+def _formatted(departures):
+    return [(time_key, FormattedDeparture(*row, format_service_time(row.service_date, row.arrival_secs),
+                                          format_service_time(row.service_date, row.departure_secs)))
+            for time_key, row in departures]
+
+
+def _stop_ids_json(stops):
+    return json.dumps([int(stop.stop_id) for _, stop in stops])
+
+
+def _departure_id(row):
+    # A trip may call at a stop more than once.
+    return row.trip_id, row.stop_sequence, row.service_date
+
+
+departures_cache = DeparturesCache()
@@ -0,0 +1,153 @@
+"""
+Array layouts without a Python object per element.
+
+Forked worker processes share the memory of the timetable loaded by the master process until a page is
+written to. Reading a Python object writes its reference count, so structures made of many small
+objects (lists of arrays, object arrays of strings) are copied page by page into every worker that
+serves requests from them. The layouts here keep the elements in a few large NumPy buffers instead.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+
+class RaggedArray:
+    """
+    A list of 1-D arrays stored as one flat array and offsets: row i is values[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, rows, dtype=None):
+        """
+        Parameters:
+        - rows (list of np.ndarray): The rows.
+        - dtype: dtype of the values; that of the rows by default.
+        """
+        lengths = np.array([len(row) for row in rows], dtype=np.int64)
+        self.offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.values = np.concatenate(rows).astype(dtype, copy=False) if len(rows) else np.empty(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        """
+        Returns row as a view of the values.
+        """
+        return self.values[self.offsets[row]:self.offsets[row + 1]]
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    def at(self, row, position):
+        """
+        Returns element position of row.
+        """
+        return self.values[self.offsets[row] + position]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.offsets.nbytes
+
+
+class TextColumn:
+    """
+    A text column as int32 codes into its distinct values, like the dictionary-encoded columns of the
+    columnar snapshot. Rows read the shared string objects of the dictionary, so a column with few
+    distinct values (routes, headsigns) is a few objects however many rows it has. None is kept: it is
+    the last dictionary entry, which code -1 refers to.
+    """
+
+    def __init__(self, values):
+        codes, uniques = pd.factorize(pd.Series(list(values), dtype=object))
+        self.codes = codes.astype(np.int32)
+        self.dictionary = np.append(np.asarray(uniques, dtype=object), None)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        """
+        Returns the value of a row, or an object array of the values of an array of rows.
+        """
+        return self.dictionary[self.codes[index]]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+
+class FlatRecords:
+    """
+    The rows of a DataFrame as one array per column, for tables read per row (stops) in place of a list
+    of row tuples. Numeric columns keep their dtype; text columns become fixed-width unicode arrays and
+    integer columns with missing values int64 arrays, both with a mask of the missing values. Rows are
+    built as namedtuples of Python values when they are read, in the memory of the reading process.
+    """
+
+    def __init__(self, frame, typename='Record'):
+        """
+        Parameters:
+        - frame (pd.DataFrame): The rows.
+        - typename (str): Name of the namedtuple type of the rows.
+        """
+        self.columns = list(frame.columns)
+        self.record = namedtuple(typename, self.columns)
+        self._length = len(frame)
+        self._arrays = {}
+        self._missing = {}
+        for col in self.columns:
+            values = frame[col]
+            if pd.api.types.is_numeric_dtype(values):
+                self._arrays[col] = values.to_numpy()
+                continue
+            missing = values.isna().to_numpy()
+            kind = pd.api.types.infer_dtype(values, skipna=True)
+            if kind in ('string', 'empty'):
+                self._arrays[col] = values.fillna('').to_numpy(dtype=str)
+            elif kind == 'integer':
+                self._arrays[col] = values.fillna(0).to_numpy(dtype=np.int64)
+            else:
+                # Mixed values have no flat layout; they stay Python objects.
+                self._arrays[col] = values.to_numpy(dtype=object)
+                continue
+            if missing.any():
+                self._missing[col] = missing
+
+    def __len__(self):
+        return self._length
+
+    def column(self, col):
+        """
+        Returns the array of a column; missing values are '' or 0.
+        """
+        return self._arrays[col]
+
+    def values(self, col, rows):
+        """
+        Returns the Python values of a column at an array of rows, with None for missing values.
+        """
+        values = self._arrays[col][rows].tolist()
+        missing = self._missing.get(col)
+        if missing is not None:
+            values = [None if is_missing else value for value, is_missing in zip(values, missing[rows].tolist())]
+        return values
+
+    def rows(self, rows):
+        """
+        Returns the records of an array of rows.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        return [self.record._make(values) for values in zip(*(self.values(col, rows) for col in self.columns))]
+
+    def __getitem__(self, row):
+        """
+        Returns the record of a row.
+        """
+        return self.rows([row])[0]
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self._arrays.values()) + \
+            sum(mask.nbytes for mask in self._missing.values())
@@ -0,0 +1,56 @@
+"""
+HTTP validators and Cache-Control for responses that only change when a new feed is published.
+
+A response is identified by the feed version and the request parameters it depends on, both known
+before any query runs: the version is cached per published file (database_utils.published_feed). A
+conditional request whose validators still match is answered with 304 Not Modified without touching
+the database.
+"""
+import hashlib
+import json
+import os
+
+from flask import current_app, request
+
+# Seconds a client or a reverse proxy may reuse a response before revalidating it
+HTTP_MAX_AGE_SECS = int(os.environ.get('PUBLIC_TRANSPORT_HTTP_MAX_AGE', '60'))
+
+
+def resource_etag(version, *parts):
+    """
+    Returns the strong ETag of a response: a hash of the feed version and of the request parameters
+    the response depends on.
+    """
+    return hashlib.sha256(json.dumps([version, *parts], default=str).encode('utf-8')).hexdigest()[:32]
+
+
+def not_modified(etag, last_modified, max_age=HTTP_MAX_AGE_SECS):
+    """
+    Returns a 304 response if the validators of the request match the response identified by etag and
+    last_modified (UTC datetime or None), otherwise None. If-None-Match takes precedence over
+    If-Modified-Since, as RFC 9110 requires.
+    """
+    if request.if_none_match:
+        matches = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        matches = last_modified.replace(microsecond=0) <= request.if_modified_since
+    else:
+        matches = False
+    if not matches:
+        return None
+    return add_cache_headers(current_app.response_class(status=304), etag, last_modified, max_age)
+
+
+def add_cache_headers(response, etag, last_modified, max_age=HTTP_MAX_AGE_SECS):
+    """
+    Sets the ETag, Last-Modified and Cache-Control headers of a response. It may be stored by shared
+    caches for max_age seconds and then has to be revalidated, so a proxy serves a replaced feed for at
+    most max_age seconds.
+    """
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.must_revalidate = True
+    return response
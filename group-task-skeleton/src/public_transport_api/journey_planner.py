@@ -0,0 +1,284 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from public_transport_api.flat_arrays import RaggedArray
+from public_transport_api.geo import haversine_m
+from public_transport_api.spatial_index import StopIndex
+
+# Walking speed on the straight line between two points (~4.3 km/h, allowing for detours)
+WALKING_SPEED_MPS = 1.2
+# Longest walk from the start point to a stop, from a stop to the end point, or straight to the end
+MAX_WALK_M = 1000
+# Longest walk between two stops when changing
+TRANSFER_RADIUS_M = 250
+# Connections departing later than this after the start time are not scanned
+MAX_JOURNEY_SECS = 4 * 3600
+# Connections are converted to Python lists for the scan in windows of this length
+SCAN_WINDOW_SECS = 900
+# Planners kept per process, as for stop indexes
+MAX_CACHED_PLANNERS = 2
+
+_UNREACHED = 1 << 30
+
+
+def walking_secs(distance_m):
+    return max(1, int(np.ceil(distance_m / WALKING_SPEED_MPS)))
+
+
+def _walking_secs_array(distances_m):
+    return np.maximum(1, np.ceil(distances_m / WALKING_SPEED_MPS)).astype(np.int32)
+
+
+class JourneyPlanner:
+    """
+    Earliest-arrival journey planner based on the Connection Scan Algorithm (CSA).
+
+    Every pair of consecutive stop times of a trip is an elementary connection (departure stop and time,
+    arrival stop and time). All connections of the timetable are kept in flat arrays sorted by departure
+    time; connections running after midnight are added a second time, shifted by a day, so that trips
+    of the previous service day are found in the same scan.
+
+    A query scans the connections departing after the start time once, in order, keeping the earliest
+    known arrival at every stop: a connection can be used if its trip was already boarded or if its
+    departure stop is reached in time, and then may improve the arrival at its arrival stop and, by
+    walking, at the stops within TRANSFER_RADIUS_M. The scan stops at the first connection departing
+    after the best arrival at the end point, so a query costs the connections of the time window the
+    journey spans, not of the whole day.
+    """
+
+    def __init__(self, engine):
+        """
+        Parameters:
+        - engine (TimetableEngine): Timetable the connections are derived from.
+        """
+        self.engine = engine
+        self.version = engine.version
+        self.stops = engine.stops
+        self._lats = self.stops.column('stop_lat').astype(float, copy=False)
+        self._lons = self.stops.column('stop_lon').astype(float, copy=False)
+        self.stop_index = StopIndex(self.stops)
+        stop_ids = self.stops.column('stop_id')
+
+        stop_times = [engine.trips.stop_times(trip) for trip in range(len(engine.trip_ids))]
+        lengths = np.array([len(stops) for stops, _, _, _ in stop_times], dtype=np.int64)
+        empty = np.empty(0, dtype=np.int64)
+        row_stops, row_arrivals, row_departures = (
+            np.concatenate([times[column] for times in stop_times] or [empty]) for column in (0, 2, 3))
+        row_trips = np.repeat(np.arange(len(lengths), dtype=np.int32), lengths)
+        row_positions = np.arange(len(row_trips)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        # A connection leaves from every stop time that is not the last of its trip.
+        rows = np.flatnonzero(row_positions < lengths[row_trips] - 1) if len(row_trips) else empty
+        dep_stops = np.searchsorted(stop_ids, row_stops[rows])
+        arr_stops = np.searchsorted(stop_ids, row_stops[rows + 1])
+        known = (dep_stops < len(stop_ids)) & (arr_stops < len(stop_ids))
+        known[known] &= (stop_ids[dep_stops[known]] == row_stops[rows][known]) & \
+            (stop_ids[arr_stops[known]] == row_stops[rows + 1][known])
+        rows, dep_stops, arr_stops = rows[known], dep_stops[known], arr_stops[known]
+        columns = {
+            'dep_secs': row_departures[rows], 'arr_secs': row_arrivals[rows + 1],
+            'dep_stops': dep_stops, 'arr_stops': arr_stops,
+            'trips': row_trips[rows], 'positions': row_positions[rows], 'days': np.zeros(len(rows)),
+        }
+        # Trips of the previous service day still run after midnight with times past 24:00.
+        overnight = columns['dep_secs'] >= 86400
+        for name, values in columns.items():
+            shifted = values[overnight]
+            if name in ('dep_secs', 'arr_secs'):
+                shifted = shifted - 86400
+            elif name == 'days':
+                shifted = np.ones(len(shifted))
+            columns[name] = np.concatenate([values, shifted])
+        order = np.lexsort((columns['arr_secs'], columns['dep_secs']))
+        self._dep_secs = columns['dep_secs'][order].astype(np.int32)
+        self._arr_secs = columns['arr_secs'][order].astype(np.int32)
+        self._dep_stops = columns['dep_stops'][order].astype(np.int32)
+        self._arr_stops = columns['arr_stops'][order].astype(np.int32)
+        self._trips = columns['trips'][order].astype(np.int32)
+        self._positions = columns['positions'][order].astype(np.int32)
+        # 0 for the trips of the queried service day, 1 for the previous day's
+        self._days = columns['days'][order].astype(np.int8)
+
+        # Stops within TRANSFER_RADIUS_M of every stop (row s of both arrays), with the walking time
+        footpath_rows, footpath_secs = [], []
+        for row, coordinates in enumerate(zip(self._lats.tolist(), self._lons.tolist())):
+            others, distances = self.stop_index.within_rows(coordinates, TRANSFER_RADIUS_M)
+            other = others != row
+            footpath_rows.append(others[other])
+            footpath_secs.append(_walking_secs_array(distances[other]))
+        self._footpath_rows = RaggedArray(footpath_rows, dtype=np.int32)
+        self._footpath_secs = RaggedArray(footpath_secs, dtype=np.int32)
+
+    def __len__(self):
+        return len(self._dep_secs)
+
+    @property
+    def nbytes(self):
+        arrays = [self._dep_secs, self._arr_secs, self._dep_stops, self._arr_stops, self._trips, self._positions,
+                  self._days, self._footpath_rows, self._footpath_secs]
+        return sum(array.nbytes for array in arrays)
+
+    def _walks(self, coordinates):
+        """
+        Returns [(stop_row, walking_secs)] of the stops within MAX_WALK_M of coordinates.
+        """
+        rows, distances = self.stop_index.within_rows(coordinates, MAX_WALK_M)
+        return list(zip(rows.tolist(), _walking_secs_array(distances).tolist()))
+
+    def _footpaths(self, stop):
+        """
+        Returns [(stop_row, walking_secs)] of the stops within TRANSFER_RADIUS_M of a stop.
+        """
+        return list(zip(self._footpath_rows[stop].tolist(), self._footpath_secs[stop].tolist()))
+
+    def _windows(self, service_date, previous_date, after_secs):
+        """
+        Yields the connections departing after after_secs of trips running on their service day, as lists
+        (dep_secs, arr_secs, dep_stops, arr_stops, runs, indexes) per SCAN_WINDOW_SECS window. A run is a
+        trip on one of the two service days: trip * 2 + day.
+        """
+        no_service = np.zeros(len(self.engine._service_dates), dtype=bool)
+        active = np.stack([self.engine._active_services.get(service_date, no_service),
+                           self.engine._active_services.get(previous_date, no_service)])
+        lo = int(np.searchsorted(self._dep_secs, after_secs, 'left'))
+        for window_start in range(after_secs, after_secs + MAX_JOURNEY_SECS, SCAN_WINDOW_SECS):
+            window_end = min(window_start + SCAN_WINDOW_SECS, after_secs + MAX_JOURNEY_SECS)
+            hi = int(np.searchsorted(self._dep_secs, window_end, 'left'))
+            trips, days = self._trips[lo:hi], self._days[lo:hi]
+            indexes = lo + np.flatnonzero(active[days, self.engine._trip_services[trips]])
+            lo = hi
+            yield (self._dep_secs[indexes].tolist(), self._arr_secs[indexes].tolist(),
+                   self._dep_stops[indexes].tolist(), self._arr_stops[indexes].tolist(),
+                   (self._trips[indexes].astype(np.int64) * 2 + self._days[indexes]).tolist(), indexes.tolist())
+
+    def earliest_arrival(self, start_coordinates, end_coordinates, service_date, previous_date, after_secs):
+        """
+        Returns the legs of the journey reaching end_coordinates the earliest when leaving start_coordinates
+        at after_secs, or None if it cannot be reached within MAX_JOURNEY_SECS.
+
+        Legs are dicts with the mode ('walk' or 'transit'), from_stop and to_stop (rows of self.stops,
+        None for the start and end points) and departure_secs and arrival_secs on the clock of service_date;
+        transit legs also have the trip (engine index), the day (0 for service_date, 1 for previous_date)
+        and the from and to positions in the trip.
+        """
+        egress = dict(self._walks(end_coordinates))
+        direct_m = float(haversine_m(start_coordinates[0], start_coordinates[1],
+                                     end_coordinates[0], end_coordinates[1]))
+        best = after_secs + walking_secs(direct_m) if direct_m <= MAX_WALK_M else _UNREACHED
+        best_stop = None
+        earliest = [_UNREACHED] * len(self.stops)
+        # Per stop: None (walked to from the start), ('transit', boarding index, alighting index)
+        # or ('walk', from stop, departure_secs)
+        pointers = [None] * len(self.stops)
+        for row, secs in self._walks(start_coordinates):
+            earliest[row] = after_secs + secs
+        entered = {}
+        # Footpaths of the stops reached so far, as Python lists for the scan
+        footpaths = {}
+
+        for dep_secs, arr_secs, dep_stops, arr_stops, runs, indexes in self._windows(service_date, previous_date,
+                                                                                       after_secs):
+            if dep_secs and dep_secs[0] >= best:
+                break
+            for dep, arr, dep_stop, arr_stop, run, index in zip(dep_secs, arr_secs, dep_stops, arr_stops, runs,
+                                                                 indexes):
+                if dep >= best:
+                    break
+                boarded = entered.get(run)
+                if boarded is None:
+                    if earliest[dep_stop] > dep:
+                        continue
+                    entered[run] = boarded = index
+                if arr >= earliest[arr_stop]:
+                    continue
+                earliest[arr_stop] = arr
+                pointers[arr_stop] = ('transit', boarded, index)
+                walk = egress.get(arr_stop)
+                if walk is not None and arr + walk < best:
+                    best, best_stop = arr + walk, arr_stop
+                paths = footpaths.get(arr_stop)
+                if paths is None:
+                    paths = footpaths[arr_stop] = self._footpaths(arr_stop)
+                for other, secs in paths:
+                    if arr + secs < earliest[other]:
+                        earliest[other] = arr + secs
+                        pointers[other] = ('walk', arr_stop, arr)
+                        walk = egress.get(other)
+                        if walk is not None and arr + secs + walk < best:
+                            best, best_stop = arr + secs + walk, other
+            else:
+                continue
+            break
+
+        if best == _UNREACHED:
+            return None
+        if best_stop is None:
+            return [{'mode': 'walk', 'from_stop': None, 'to_stop': None,
+                     'departure_secs': after_secs, 'arrival_secs': best}]
+
+        legs = [{'mode': 'walk', 'from_stop': best_stop, 'to_stop': None,
+                 'departure_secs': best - egress[best_stop], 'arrival_secs': best}]
+        stop = best_stop
+        while pointers[stop] is not None:
+            if pointers[stop][0] == 'walk':
+                _, source, departure_secs = pointers[stop]
+                legs.append({'mode': 'walk', 'from_stop': source, 'to_stop': stop, 'departure_secs': departure_secs,
+                             'arrival_secs': departure_secs + walking_secs(
+                                 self._distance_m(stop, self._coordinates(source)))})
+                stop = source
+            else:
+                _, boarding, alighting = pointers[stop]
+                legs.append({'mode': 'transit', 'from_stop': int(self._dep_stops[boarding]), 'to_stop': stop,
+                             'departure_secs': int(self._dep_secs[boarding]),
+                             'arrival_secs': int(self._arr_secs[alighting]),
+                             'trip': int(self._trips[boarding]), 'day': int(self._days[boarding]),
+                             'from_position': int(self._positions[boarding]),
+                             'to_position': int(self._positions[alighting]) + 1})
+                stop = legs[-1]['from_stop']
+        # Leave the start point just in time for the first leg.
+        access_secs = walking_secs(self._distance_m(stop, start_coordinates))
+        legs.append({'mode': 'walk', 'from_stop': None, 'to_stop': stop,
+                     'departure_secs': legs[-1]['departure_secs'] - access_secs,
+                     'arrival_secs': legs[-1]['departure_secs']})
+        return legs[::-1]
+
+    def _coordinates(self, stop):
+        return float(self._lats[stop]), float(self._lons[stop])
+
+    def _distance_m(self, stop, coordinates):
+        return float(haversine_m(coordinates[0], coordinates[1], *self._coordinates(stop)))
+
+    def plan(self, start_coordinates, end_coordinates, service_date, previous_date, after_secs, limit=3):
+        """
+        Returns up to `limit` journeys (lists of legs, see earliest_arrival): the earliest-arrival journey
+        leaving at after_secs, then the earliest-arrival journey leaving after each previous one left.
+        """
+        journeys = []
+        while len(journeys) < limit:
+            legs = self.earliest_arrival(start_coordinates, end_coordinates, service_date, previous_date, after_secs)
+            if legs is None:
+                break
+            journeys.append(legs)
+            if len(legs) == 1:
+                # Walking all the way; a later departure cannot arrive earlier.
+                break
+            after_secs = legs[0]['departure_secs'] + 1
+        return journeys
+
+
+_planners = OrderedDict()
+_planners_lock = threading.Lock()
+
+
+def journey_planner(engine):
+    """
+    Returns the JourneyPlanner of a TimetableEngine, built on first use for every feed version.
+    """
+    with _planners_lock:
+        planner = _planners.get(engine.version)
+        if planner is None or planner.engine is not engine:
+            planner = _planners[engine.version] = JourneyPlanner(engine)
+            while len(_planners) > MAX_CACHED_PLANNERS:
+                _planners.popitem(last=False)
+        return planner
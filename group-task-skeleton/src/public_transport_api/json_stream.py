@@ -0,0 +1,102 @@
+"""
+JSON serialisation straight from query rows or column arrays, streamed as chunks of bytes.
+
+Values come from tolist() on NumPy arrays or from database cursors, so they are already Python
+scalars; NumPy scalars that slip through are converted by the encoder's default hook instead of
+failing. Output is compact: pretty-printing costs about as much as the encoding itself.
+"""
+import json
+
+import numpy as np
+
+# Bytes buffered before a chunk is yielded
+CHUNK_SIZE = 64 * 1024
+
+
+def to_native(value):
+    """
+    JSONEncoder default hook converting NumPy scalars and arrays to Python values.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=to_native)
+
+
+def dumps(value):
+    """
+    Returns the compact JSON text of a value.
+    """
+    return _encoder.encode(value)
+
+
+def iter_json_array(items, chunk_size=CHUNK_SIZE):
+    """
+    Yields the UTF-8 JSON array of items in chunks of about chunk_size bytes, encoding one item at a time.
+    """
+    buffer = ['[']
+    size = 1
+    for index, item in enumerate(items):
+        text = _encoder.encode(item)
+        buffer.append(text if index == 0 else ',' + text)
+        size += len(text) + 1
+        if size >= chunk_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    buffer.append(']')
+    yield ''.join(buffer).encode('utf-8')
+
+
+def iter_ndjson(items, chunk_size=CHUNK_SIZE):
+    """
+    Yields items as newline-delimited JSON (one compact document per line) in chunks of about chunk_size bytes.
+    """
+    buffer = []
+    size = 0
+    for item in items:
+        text = _encoder.encode(item) + '\n'
+        buffer.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def trips_from_rows(rows):
+    """
+    Yields {"trip_details": {...}} objects from rows of (trip_id, route_id, trip_headsign, stop_name,
+    stop_lat, stop_lon, arrival_time, departure_time), e.g. cursor rows. Consecutive rows of the same
+    trip become the stops of one trip, so rows have to be ordered by trip.
+    """
+    trip = None
+    key = None
+    for trip_id, route_id, trip_headsign, stop_name, stop_lat, stop_lon, arrival_time, departure_time in rows:
+        if (trip_id, route_id, trip_headsign) != key:
+            if trip is not None:
+                yield trip
+            key = (trip_id, route_id, trip_headsign)
+            trip = {
+                "trip_details": {
+                    "trip_id": trip_id,
+                    "route_id": route_id,
+                    "trip_headsign": trip_headsign,
+                    "stops": []
+                }
+            }
+        trip["trip_details"]["stops"].append({
+            "name": stop_name,
+            "coordinates": {
+                "latitude": stop_lat,
+                "longitude": stop_lon
+            },
+            "arrival_time": arrival_time,
+            "departure_time": departure_time
+        })
+    if trip is not None:
+        yield trip
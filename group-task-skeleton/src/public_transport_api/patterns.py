@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+from public_transport_api.flat_arrays import RaggedArray
+
+
+class TripPatterns:
+    """
+    Deduplicated stop patterns of the trips of a feed.
+
+    Trips are grouped by variant_id (shape_id when it is missing), which in the Wrocław feed identifies
+    the ordered list of stops a trip calls at; a trip whose stops differ from its variant's gets a
+    pattern of its own. Every pattern stores its stop order, and an inverted index maps every stop to the
+    (pattern, position) pairs at which it is called.
+
+    "Does the trip call at one of these stops after position p" then becomes, after one
+    last_positions call per request, the constant-time comparison reach[pattern] > p per candidate.
+    """
+
+    def __init__(self, trips, trip_starts, row_stops):
+        """
+        Parameters:
+        - trips (pd.DataFrame): Trips in engine order, with variant_id and shape_id where available.
+        - trip_starts (np.ndarray): len(trips) + 1 offsets; the stops of trip t are
+          row_stops[trip_starts[t]:trip_starts[t + 1]], in stop_sequence order.
+        - row_stops (np.ndarray): Stop ids of all stop times.
+        """
+        keys = pd.Series([None] * len(trips), dtype=object)
+        for col in ('shape_id', 'variant_id'):
+            if col in trips:
+                values = trips[col].reset_index(drop=True)
+                keys = values.where(values.notna(), keys).astype(object)
+
+        stops_of_patterns = []
+        self.keys = []  # variant_id (or shape_id) every pattern was first seen for
+        self.trip_patterns = np.empty(len(trips), dtype=np.int32)
+        by_stops = {}
+        by_key = {}
+        for trip, key in enumerate(keys.tolist()):
+            stops = row_stops[trip_starts[trip]:trip_starts[trip + 1]]
+            pattern = by_key.get(key)
+            if pattern is None or not np.array_equal(stops_of_patterns[pattern], stops):
+                signature = stops.tobytes()
+                pattern = by_stops.get(signature)
+                if pattern is None:
+                    pattern = by_stops[signature] = len(stops_of_patterns)
+                    stops_of_patterns.append(stops)
+                    self.keys.append(key)
+                if key is not None:
+                    by_key.setdefault(key, pattern)
+            self.trip_patterns[trip] = pattern
+
+        # Stop ids of every pattern, in order
+        self.stops = RaggedArray(stops_of_patterns, dtype=row_stops.dtype)
+        lengths = np.diff(self.stops.offsets)
+        all_stops = self.stops.values
+        all_patterns = np.repeat(np.arange(len(self.stops), dtype=np.int32), lengths)
+        all_positions = (np.arange(len(all_stops)) - np.repeat(np.cumsum(lengths) - lengths, lengths)).astype(np.int32)
+        by_stop = np.argsort(all_stops, kind='stable')
+        self._index_stops = all_stops[by_stop]
+        self._index_patterns = all_patterns[by_stop]
+        self._index_positions = all_positions[by_stop]
+
+    def __len__(self):
+        return len(self.stops)
+
+    def positions(self, pattern, stop_id):
+        """
+        Returns the positions at which a pattern calls at a stop (a loop may call at it more than once).
+        """
+        lo = np.searchsorted(self._index_stops, stop_id, 'left')
+        hi = np.searchsorted(self._index_stops, stop_id, 'right')
+        return self._index_positions[lo:hi][self._index_patterns[lo:hi] == pattern]
+
+    def last_positions(self, stop_ids):
+        """
+        Returns, for every pattern, the last position at which it calls at any of stop_ids, or -1.
+        """
+        reach = np.full(len(self.stops), -1, dtype=np.int32)
+        stop_ids = np.unique(np.asarray(list(stop_ids), dtype=self._index_stops.dtype))
+        lo = np.searchsorted(self._index_stops, stop_ids, 'left')
+        hi = np.searchsorted(self._index_stops, stop_ids, 'right')
+        if len(stop_ids):
+            entries = np.concatenate([np.arange(start, end) for start, end in zip(lo, hi)])
+            np.maximum.at(reach, self._index_patterns[entries], self._index_positions[entries])
+        return reach
+
+
+class CompactTrips:
+    """
+    Stop times of all trips, stored once per pattern instead of once per stop time.
+
+    Trips on a pattern mostly run the same timetable shifted in time, so a trip is stored as its pattern,
+    its start time (first arrival) and a timing profile: the stop sequences and the arrival and departure
+    offsets from the start time. Profiles are deduplicated; the first one seen on a pattern is its
+    default and trips whose offsets differ (e.g. longer peak-hour running times) refer to an override.
+    """
+
+    def __init__(self, patterns, trip_starts, row_sequences, row_arrivals, row_departures):
+        """
+        Parameters:
+        - patterns (TripPatterns): Stop patterns of the trips.
+        - trip_starts (np.ndarray): len(trips) + 1 offsets of every trip's rows in the arrays below.
+        - row_sequences, row_arrivals, row_departures (np.ndarray): stop_sequence, arrival_secs and
+          departure_secs of all stop times, in (trip, stop_sequence) order.
+        """
+        self.patterns = patterns
+        trip_count = len(trip_starts) - 1
+        self.start_secs = np.zeros(trip_count, dtype=np.int32)
+        self.trip_timings = np.empty(trip_count, dtype=np.int32)
+        timings = []
+        self.pattern_timings = np.full(len(patterns), -1, dtype=np.int32)
+        by_signature = {}
+        for trip in range(trip_count):
+            lo, hi = trip_starts[trip], trip_starts[trip + 1]
+            if hi > lo:
+                self.start_secs[trip] = row_arrivals[lo]
+            timing = (row_sequences[lo:hi].astype(np.int32),
+                      (row_arrivals[lo:hi] - self.start_secs[trip]).astype(np.int32),
+                      (row_departures[lo:hi] - self.start_secs[trip]).astype(np.int32))
+            signature = b'|'.join(array.tobytes() for array in timing)
+            timing_id = by_signature.get(signature)
+            if timing_id is None:
+                timing_id = by_signature[signature] = len(timings)
+                timings.append(timing)
+            self.trip_timings[trip] = timing_id
+            pattern = patterns.trip_patterns[trip]
+            if self.pattern_timings[pattern] < 0:
+                self.pattern_timings[pattern] = timing_id
+        # Stop sequences, arrival offsets and departure offsets of every profile
+        self.sequences, self.arrival_offsets, self.departure_offsets = (
+            RaggedArray([timing[column] for timing in timings], dtype=np.int32) for column in range(3))
+
+    @property
+    def timings(self):
+        """
+        (stop_sequences, arrival_offsets, departure_offsets) of every profile.
+        """
+        return list(zip(self.sequences, self.arrival_offsets, self.departure_offsets))
+
+    @property
+    def override_count(self):
+        """
+        Number of trips whose timing differs from their pattern's default.
+        """
+        return int(np.count_nonzero(self.trip_timings != self.pattern_timings[self.patterns.trip_patterns]))
+
+    @property
+    def nbytes(self):
+        arrays = [self.start_secs, self.trip_timings, self.pattern_timings, self.patterns.trip_patterns,
+                  self.sequences, self.arrival_offsets, self.departure_offsets, self.patterns.stops]
+        return sum(array.nbytes for array in arrays)
+
+    def stop_sequence(self, trip, position):
+        """
+        Returns the stop_sequence of the stop time at position in trip; trip and position may be arrays.
+        """
+        return self.sequences.at(self.trip_timings[trip], position).astype(np.int64)
+
+    def arrival_secs(self, trip, position):
+        """
+        Returns the arrival_secs of the stop time at position in trip; trip and position may be arrays.
+        """
+        return self.start_secs[trip].astype(np.int64) + self.arrival_offsets.at(self.trip_timings[trip], position)
+
+    def stop_times(self, trip):
+        """
+        Rebuilds the stop times of a trip as (stop_ids, stop_sequences, arrival_secs, departure_secs) arrays.
+        """
+        timing = self.trip_timings[trip]
+        start = self.start_secs[trip]
+        return (self.patterns.stops[self.patterns.trip_patterns[trip]], self.sequences[timing],
+                start + self.arrival_offsets[timing], start + self.departure_offsets[timing])
@@ -0,0 +1,270 @@
+"""
+Pre-fork serving of the API with one timetable shared by all worker processes.
+
+    python -m public_transport_api.prefork --workers 4 --port 5000
+
+The master process loads the TimetableEngine and the JourneyPlanner of the published database once,
+moves every object it holds into the permanent generation (gc.freeze) and forks the workers, which
+serve the Flask app from the master's listening socket. The workers share the timetable's pages with
+the master until they write to them: the timetable is kept in flat arrays (see flat_arrays), which
+reading does not write to, and frozen objects are never scanned by the garbage collector, so adding a
+worker costs little more than its own request handling.
+
+The master checks the published database every RELOAD_INTERVAL_SECS. When a new version is published,
+it loads the new timetable and replaces the workers with a new generation forked from it. The memory
+of the master and its workers is logged on SIGUSR1 and, with PUBLIC_TRANSPORT_STATS=1, returned by
+GET /public_transport/stats/memory.
+Linux only: os.fork and /proc.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import threading
+import time
+
+from loguru import logger
+from werkzeug.serving import make_server
+
+from public_transport_api import database_utils
+from public_transport_api.journey_planner import journey_planner
+from public_transport_api.spatial_index import stop_index
+from public_transport_api.timetable import disable_background_loading, load_timetable
+
+# Seconds between checks for a newly published database
+RELOAD_INTERVAL_SECS = 30
+# Seconds the workers of a replaced generation get to finish their requests
+SHUTDOWN_TIMEOUT_SECS = 10
+# Fields of /proc/<pid>/smaps_rollup in the memory report
+MEMORY_FIELDS = {'Rss': 'rss_mb', 'Pss': 'pss_mb', 'Shared_Clean': 'shared_clean_mb',
+                 'Shared_Dirty': 'shared_dirty_mb', 'Private_Clean': 'private_clean_mb',
+                 'Private_Dirty': 'private_dirty_mb'}
+
+# Pid of the master process, in the master and its workers
+master_pid = None
+
+
+def process_memory(pid):
+    """
+    Returns the MEMORY_FIELDS of a process in MB, or None if they cannot be read.
+    Private_Dirty is the memory only this process uses; Pss splits shared pages between their users.
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', encoding='ascii') as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return None
+    memory = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 3 and parts[0].rstrip(':') in MEMORY_FIELDS:
+            memory[MEMORY_FIELDS[parts[0].rstrip(':')]] = round(int(parts[1]) / 1024, 1)
+    return memory
+
+
+def child_pids(pid):
+    """
+    Returns the pids of the child processes of a process.
+    """
+    children = []
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children', encoding='ascii') as file:
+                children += [int(child) for child in file.read().split()]
+    except OSError:
+        pass
+    return sorted(children)
+
+
+def memory_report():
+    """
+    Returns the memory of the pre-fork master and of every worker by pid, or of this process alone when it
+    is not served by PreforkServer.
+    """
+    if master_pid is None:
+        return {"process": {str(os.getpid()): process_memory(os.getpid())}}
+    return {
+        "master": {str(master_pid): process_memory(master_pid)},
+        "workers": {str(pid): process_memory(pid) for pid in child_pids(master_pid)},
+    }
+
+
+class PreforkServer:
+    """
+    Master process of pre-fork serving: loads and freezes the timetable, forks the workers, replaces the
+    workers that exit and forks a new generation when a new database is published.
+    """
+
+    def __init__(self, app, host, port, workers, reload_interval_secs=RELOAD_INTERVAL_SECS):
+        """
+        Parameters:
+        - app: The WSGI application the workers serve.
+        - host (str), port (int): Address to listen on.
+        - workers (int): Number of worker processes.
+        - reload_interval_secs (float): Seconds between checks for a newly published database.
+        """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.worker_count = workers
+        self.reload_interval_secs = reload_interval_secs
+        self.socket = None
+        self.version = None
+        self.generation = 0
+        self.workers = {}  # pid -> generation
+        self._stopping = False
+        self._report = False
+
+    def preload(self):
+        """
+        Loads the timetable, journey planner and stop index of the published database and freezes every
+        object of the process, so the workers forked afterwards share them. The timetable is loaded here,
+        never by the background loader of PUBLIC_TRANSPORT_TIMETABLE: the workers of a generation serve
+        the version it was forked with, and the next generation is forked once a new version is loaded.
+        """
+        disable_background_loading()
+        gc.unfreeze()
+        self.version = database_utils.feed_version()
+        engine = load_timetable()
+        journey_planner(engine)
+        with database_utils.open_feed() as feed:
+            stop_index(feed)
+        gc.collect()
+        gc.freeze()
+        memory = process_memory(os.getpid()) or {}
+        logger.info(f"Timetable of feed version {engine.version[:12]} preloaded, "
+                    f"master RSS {memory.get('rss_mb')} MB")
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = self.generation
+            return pid
+        try:
+            self._run_worker()
+        finally:
+            os._exit(0)
+
+    def _run_worker(self):
+        for signum in (signal.SIGINT, signal.SIGUSR1, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        server = make_server(self.host, self.port, self.app, threaded=True, fd=self.socket.fileno())
+        # shutdown() waits for serve_forever to return, so it cannot be called from the serving thread.
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        server.serve_forever()
+        server.server_close()
+
+    def serve_forever(self):
+        global master_pid
+        master_pid = os.getpid()
+        self.socket = socket.create_server((self.host, self.port), backlog=128)
+        self.socket.set_inheritable(True)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGUSR1, self._request_report)
+        self.preload()
+        for _ in range(self.worker_count):
+            self.spawn()
+        logger.info(f"Serving on http://{self.host}:{self.port} with {self.worker_count} workers")
+
+        checked_at = time.monotonic()
+        while not self._stopping:
+            time.sleep(0.5)
+            self._reap()
+            if self._report:
+                self._report = False
+                self.log_memory()
+            if time.monotonic() - checked_at >= self.reload_interval_secs:
+                checked_at = time.monotonic()
+                self._reload_if_published()
+        self._stop_workers(list(self.workers))
+        self.socket.close()
+
+    def _reap(self):
+        """
+        Collects exited workers and replaces those of the current generation.
+        """
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            generation = self.workers.pop(pid, None)
+            if generation == self.generation and not self._stopping:
+                logger.warning(f"Worker {pid} exited with status {status}, starting a new one")
+                self.spawn()
+
+    def _reload_if_published(self):
+        try:
+            version = database_utils.feed_version()
+        except Exception as e:
+            logger.warning(f"Checking the published database failed: {e}")
+            return
+        if version == self.version:
+            return
+        try:
+            self.preload()
+        except Exception as e:
+            logger.warning(f"Loading the timetable of feed version {version[:12]} failed: {e}")
+            return
+        old_workers = list(self.workers)
+        self.generation += 1
+        for _ in range(self.worker_count):
+            self.spawn()
+        self._stop_workers(old_workers)
+
+    def _stop_workers(self, pids):
+        """
+        Asks workers to finish their requests and exit, and kills those still running after
+        SHUTDOWN_TIMEOUT_SECS.
+        """
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT_SECS
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                    remaining.discard(pid)
+                    self.workers.pop(pid, None)
+            time.sleep(0.05)
+        for pid in remaining:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.workers.pop(pid, None)
+
+    def log_memory(self):
+        report = memory_report()
+        for role in ('master', 'workers'):
+            for pid, memory in report[role].items():
+                logger.info(f"{role} {pid}: {memory}")
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def _request_report(self, signum, frame):
+        self._report = True
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Serve the API from pre-forked workers sharing one timetable.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=5000, help='Port to listen on.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes.')
+    parser.add_argument('--reload-interval', type=float, default=RELOAD_INTERVAL_SECS,
+                        help='Seconds between checks for a newly published database.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    # Run the server of the imported module, whose master_pid the stats endpoint reads. The app is imported
+    # after disabling the background loader its startup would otherwise start.
+    from public_transport_api import prefork
+    prefork.disable_background_loading()
+    from public_transport_api.main import app
+
+    args = prefork.parse_args()
+    prefork.PreforkServer(app, args.host, args.port, args.workers, args.reload_interval).serve_forever()
@@ -0,0 +1,92 @@
+import os
+import re
+import sqlite3
+
+import pandas as pd
+
+# Named parameters (:name) of a query; "24:00" in a comment is not one
+PARAMETER_PATTERN = re.compile(r'(?<![:\w]):([A-Za-z_]\w*)')
+
+
+class QueryRegistry:
+    """
+    The queries of a folder of .sql files, read once and run by name.
+
+    A query is always passed to sqlite3 as the same string object, so every connection prepares it once
+    and reuses the statement from its statement cache on later calls. Results are lists of tuples (or
+    dicts); fetch_frame builds a DataFrame from the cursor only when one is asked for.
+    """
+
+    def __init__(self, sql_dir):
+        """
+        Parameters:
+        - sql_dir (str): Folder with the .sql files; a query is named after its file without the extension.
+        """
+        self.sql_dir = sql_dir
+        self.queries = {}
+        for file_name in sorted(os.listdir(sql_dir)):
+            if file_name.endswith('.sql'):
+                with open(os.path.join(sql_dir, file_name), 'r') as file:
+                    self.queries[file_name[:-len('.sql')]] = file.read()
+        self.parameters = {name: sorted(set(PARAMETER_PATTERN.findall(sql))) for name, sql in self.queries.items()}
+
+    def __contains__(self, name):
+        return self._name(name) in self.queries
+
+    @staticmethod
+    def _name(name):
+        return name[:-len('.sql')] if name.endswith('.sql') else name
+
+    def sql(self, name):
+        """
+        Returns the text of a query, by name or file name. Raises KeyError for unknown queries.
+        """
+        return self.queries[self._name(name)]
+
+    def validate(self, conn):
+        """
+        Prepares every query with EXPLAIN QUERY PLAN against the schema of the connection, with all
+        parameters bound to NULL, and returns the plan details of every query by name.
+        Raises sqlite3.OperationalError naming every query that does not compile.
+        """
+        plans = {}
+        errors = []
+        for name, sql in self.queries.items():
+            try:
+                rows = conn.execute('EXPLAIN QUERY PLAN ' + sql,
+                                    dict.fromkeys(self.parameters[name])).fetchall()
+            except sqlite3.Error as e:
+                errors.append(f'{name}: {e}')
+                continue
+            plans[name] = [row[-1] for row in rows]
+        if errors:
+            raise sqlite3.OperationalError(f"Invalid queries in {self.sql_dir}: {'; '.join(errors)}")
+        return plans
+
+    def execute(self, conn, name, params=None):
+        """
+        Runs a query and returns its cursor.
+        """
+        return conn.execute(self.sql(name), params if params is not None else {})
+
+    def fetch(self, conn, name, params=None):
+        """
+        Returns the rows of a query as tuples.
+        """
+        return self.execute(conn, name, params).fetchall()
+
+    def fetch_dicts(self, conn, name, params=None):
+        """
+        Returns the rows of a query as dicts by column name.
+        """
+        cursor = self.execute(conn, name, params)
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def fetch_frame(self, conn, name, params=None):
+        """
+        Returns the rows of a query as a DataFrame.
+        """
+        cursor = self.execute(conn, name, params)
+        columns = [description[0] for description in cursor.description]
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Caches by name, for the stats endpoint
+CACHES = {}
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache with a time to live, for serialised responses.
+
+    Entries are evicted least recently used first once max_size is reached, and expire ttl_secs after
+    they were stored. Callers put the feed version into the key, so entries of a replaced feed are never
+    hit again and age out of the cache. A max_size of 0 disables the cache.
+    """
+
+    def __init__(self, name, max_size, ttl_secs, clock=time.monotonic):
+        """
+        Parameters:
+        - name (str): Name under which the cache is listed in CACHES.
+        - max_size (int): Maximum number of entries.
+        - ttl_secs (float): Seconds after which an entry expires.
+        - clock (callable): Returns the current time in seconds.
+        """
+        self.name = name
+        self.max_size = max_size
+        self.ttl_secs = ttl_secs
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        CACHES[name] = self
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Returns the value stored for key, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_secs, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the size, limits and hit, miss, eviction and expiration counters of the cache.
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_secs": self.ttl_secs,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
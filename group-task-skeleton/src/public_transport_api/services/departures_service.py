@@ -1,50 +1,208 @@
-import sqlite3
-
-
-def get_closest_departures():
-    """
-    FIXME this is a mock version. You need to implement the correct logic
-    """
-    conn = None
-    try:
-        conn = sqlite3.connect("trips.sqlite")
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        query = "SELECT stop_id, stop_name, stop_lat, stop_lon FROM stops LIMIT 1;"
-        cursor.execute(query)
-        first_stop_row = cursor.fetchone()
-
-        mock_departures = []
-
-        if first_stop_row:
-            mock_departure = {
-                "trip_id": "mock_trip_001",
-                "route_id": "mock_route_A",
-                "trip_headsign": first_stop_row['stop_name'],
-                "stop": {
-                    "id": first_stop_row['stop_id'],
-                    "name": first_stop_row['stop_name'],
-                    "coordinates": {
-                        "latitude": float(first_stop_row['stop_lat']),
-                        "longitude": float(first_stop_row['stop_lon'])
-                    },
-                    "arrival_time": "10:00:00",
-                    "departure_time": "10:00:30"
+import heapq
+import json
+from collections import namedtuple
+from datetime import timedelta
+
+from public_transport_api.columnar_store import STOP_DEPARTURES_COLUMNS
+from public_transport_api.database_utils import open_feed
+from public_transport_api.departures_cache import FormattedDeparture, departures_cache
+from public_transport_api.geo import haversine_m
+from public_transport_api.spatial_index import stop_index
+from public_transport_api.timetable import current_timetable
+from public_transport_api.time_utils import format_service_times, to_service_time
+
+# Stops farther than this from the start (or the end) point are not considered.
+SEARCH_RADIUS_M = 1000
+
+# A row of select_stop_departures.sql
+Departure = namedtuple('Departure', STOP_DEPARTURES_COLUMNS)
+
+
+def find_stops_within(feed, coordinates, radius_m=SEARCH_RADIUS_M):
+    """
+    Returns the stops within radius_m metres of the coordinates as (distance_m, stop) tuples,
+    the closest first. Every stop is a row of feed.all_stops(), looked up in the feed's StopIndex.
+    """
+    return stop_index(feed).within(coordinates, radius_m)
+
+
+def merge_departures(start_stops, departures_at, limit):
+    """
+    Returns up to `limit` (distance_m, stop, departure) tuples ordered by the stop's distance, then by time.
+
+    A lazy k-way merge over a heap of per-stop departure iterators: stops are opened in distance order,
+    and only while they could still hold the next result, i.e. while they are not farther than the best
+    pending departure. The merge stops as soon as `limit` departures are taken, so the number of stops
+    queried and departures built depends on `limit`, not on the departures within the search radius.
+
+    Parameters:
+    - start_stops (list[tuple[float, stop]]): Stops sorted by distance.
+    - departures_at (callable): departures_at(stop, count) returns at most `count` (time_key, departure)
+      tuples of the stop in time order.
+    - limit (int): Maximum number of departures.
+    """
+    heap = []
+    merged = []
+    next_stop = 0
+    while len(merged) < limit:
+        while next_stop < len(start_stops) and (not heap or start_stops[next_stop][0] <= heap[0][0]):
+            departures = iter(departures_at(start_stops[next_stop][1], limit - len(merged)))
+            first = next(departures, None)
+            if first is not None:
+                heapq.heappush(heap, (start_stops[next_stop][0], first[0], next_stop, first[1], departures))
+            next_stop += 1
+        if not heap:
+            break
+        distance, _, rank, departure, departures = heapq.heappop(heap)
+        merged.append((distance, start_stops[rank][1], departure))
+        following = next(departures, None)
+        if following is not None:
+            heapq.heappush(heap, (distance, following[0], rank, following[1], departures))
+    return merged
+
+
+def get_closest_departures(start_coordinates, end_coordinates, start_time, limit=5):
+    """
+    Returns up to `limit` departures after start_time from the stops around start_coordinates,
+    of trips running on that day (per the service_days table) that later call at a stop around
+    end_coordinates.
+    Departures are sorted by the distance of their stop from start_coordinates, then by time.
+
+    Parameters:
+    - start_coordinates, end_coordinates (tuple[float, float]): (latitude, longitude).
+    - start_time (datetime): Time at which the user starts the trip.
+    - limit (int): Maximum number of departures.
+    """
+    return get_closest_departures_batch([(start_coordinates, end_coordinates, start_time, limit)])[0]
+
+
+def get_closest_departures_batch(queries):
+    """
+    Returns the get_closest_departures results of many queries, in the order of the queries.
+
+    All queries are answered from one feed. Stop lookups around the same coordinates and departure
+    scans of the same stop, time and destination stops are done once for the whole batch, and the
+    departure times of all results are formatted in one step.
+
+    Parameters:
+    - queries (list[tuple]): (start_coordinates, end_coordinates, start_time, limit) of every query.
+    """
+    return _format_departures(list(_merge_batch(queries)), queries)
+
+
+def iter_closest_departures_batch(queries):
+    """
+    Yields the get_closest_departures results of many queries in the order of the queries, so that a
+    streamed response can send the first results before the last are found.
+
+    Lookups and scans are shared like in get_closest_departures_batch. The results are formatted in
+    groups that double in size (1, 2, 4, ... queries): the first one is yielded as soon as it is
+    answered, and a batch of n queries still takes only about log2(n) formatting steps.
+    """
+    merged_results = []
+    formatted = 0
+    for merged in _merge_batch(queries):
+        merged_results.append(merged)
+        answered = formatted + len(merged_results)
+        if len(merged_results) > formatted or answered == len(queries):
+            yield from _format_departures(merged_results, queries[formatted:answered])
+            merged_results = []
+            formatted = answered
+
+
+def _merge_batch(queries):
+    """
+    Yields the merge_departures result of every query, sharing the stop lookups and departure scans
+    of the batch. With the departures_cache enabled, the departure scans are also shared with other
+    requests towards the same area in the same time bucket.
+    """
+    with open_feed() as feed:
+        # The in-memory timetable answers departure lookups when loaded for this feed version.
+        departures_source = current_timetable(feed) or feed
+        stops_around = {}
+        scans = {}
+
+        def find_stops(coordinates):
+            if coordinates not in stops_around:
+                stops_around[coordinates] = find_stops_within(feed, coordinates)
+            return stops_around[coordinates]
+
+        def stop_departures(params):
+            key = (params['stop_id'], params['service_date'], params['after_secs'], params['destination_stop_ids'])
+            scanned = scans.get(key)
+            # A scan that found fewer rows than it asked for holds all of them.
+            if scanned is None or (scanned[0] < params['limit'] and len(scanned[1]) == scanned[0]):
+                scanned = scans[key] = (params['limit'], list(map(
+                    Departure._make, departures_source.stop_departures(params, as_frame=False))))
+            return scanned[1][:params['limit']]
+
+        for start_coordinates, end_coordinates, start_time, limit in queries:
+            service_date, after_secs = to_service_time(start_time)
+            previous_date = (service_date - timedelta(days=1)).isoformat()
+            destination_stop_ids = json.dumps([int(stop.stop_id) for _, stop in find_stops(end_coordinates)])
+
+            def scan(stop, scan_destination_stop_ids, scan_after_secs, count):
+                rows = stop_departures({
+                    'stop_id': int(stop.stop_id),
+                    'service_date': service_date.isoformat(),
+                    'previous_date': previous_date,
+                    'after_secs': scan_after_secs,
+                    'destination_stop_ids': scan_destination_stop_ids,
+                    'limit': count,
+                })
+                # Times of the previous service day are compared on today's clock.
+                return [(row.departure_secs - (86400 if row.service_date == previous_date else 0), row)
+                        for row in rows]
+
+            departures_at = departures_cache.departures_at(
+                feed.version, end_coordinates, destination_stop_ids, service_date, after_secs, SEARCH_RADIUS_M,
+                lambda coordinates, radius_m: find_stops_within(feed, coordinates, radius_m), scan,
+            ) if departures_cache.enabled else lambda stop, count: scan(stop, destination_stop_ids, after_secs, count)
+
+            yield merge_departures(find_stops(start_coordinates), departures_at, limit)
+
+
+def _format_departures(merged_results, queries):
+    """
+    Builds the departures of every query from its merge_departures result, formatting the times of
+    all rows in one step, except for the FormattedDeparture rows of the departures_cache.
+    """
+    rows = [row for merged in merged_results for _, _, row in merged if not isinstance(row, FormattedDeparture)]
+    service_dates = [row.service_date for row in rows]
+    arrival_times = iter(format_service_times(service_dates, [row.arrival_secs for row in rows]) if rows else [])
+    departure_times = iter(format_service_times(service_dates, [row.departure_secs for row in rows]) if rows else [])
+    return [_departures_json(merged, end_coordinates, arrival_times, departure_times)
+            for merged, (_, end_coordinates, _, _) in zip(merged_results, queries)]
+
+
+def _departures_json(merged, end_coordinates, arrival_times, departure_times):
+    """
+    Builds the departures of one query from its merge_departures result, taking the formatted times
+    of its rows from the arrival_times and departure_times iterators, or from FormattedDeparture rows.
+    """
+    times = [(row.arrival_time, row.departure_time) if isinstance(row, FormattedDeparture)
+             else (next(arrival_times), next(departure_times)) for _, _, row in merged]
+    distances_to_end = haversine_m(end_coordinates[0], end_coordinates[1],
+                                   [stop.stop_lat for _, stop, _ in merged],
+                                   [stop.stop_lon for _, stop, _ in merged])
+    return [
+        {
+            "trip_id": row.trip_id,
+            "route_id": row.route_id,
+            "trip_headsign": row.trip_headsign,
+            "stop": {
+                "id": int(stop.stop_id),
+                "name": stop.stop_name,
+                "coordinates": {
+                    "latitude": float(stop.stop_lat),
+                    "longitude": float(stop.stop_lon)
                 },
-                "distance_start_to_stop": 123.45,
-                "debug_dist_stop_to_end": 543.21
-            }
-            mock_departures.append(mock_departure)
-
-        return mock_departures
-
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
-        return []
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        return []
-    finally:
-        if conn:
-            conn.close()
+                "arrival_time": arrival_time,
+                "departure_time": departure_time
+            },
+            "distance_start_to_stop": round(distance, 2),
+            "debug_dist_stop_to_end": round(float(distance_to_end), 2)
+        }
+        for (distance, stop, row), (arrival_time, departure_time), distance_to_end
+        in zip(merged, times, distances_to_end)
+    ]
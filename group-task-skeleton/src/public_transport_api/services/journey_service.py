@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from public_transport_api.journey_planner import journey_planner
+from public_transport_api.timetable import require_timetable
+from public_transport_api.time_utils import format_service_times, to_service_time
+
+
+def plan_journeys(start_coordinates, end_coordinates, start_time, limit=3):
+    """
+    Returns up to `limit` earliest-arrival journeys from start_coordinates to end_coordinates leaving
+    after start_time, each a sequence of walking and transit legs. The first journey arrives the
+    earliest; every next one leaves later than the previous one.
+
+    Parameters:
+    - start_coordinates, end_coordinates (tuple[float, float]): (latitude, longitude).
+    - start_time (datetime): Time at which the user starts the trip.
+    - limit (int): Maximum number of journeys.
+    """
+    service_date, after_secs = to_service_time(start_time)
+    previous_date = (service_date - timedelta(days=1)).isoformat()
+    # Journeys are planned on the in-memory timetable only; it is loaded on the first request if needed.
+    planner = journey_planner(require_timetable())
+    journeys = planner.plan(start_coordinates, end_coordinates, service_date.isoformat(), previous_date,
+                            after_secs, limit)
+
+    legs = [leg for journey in journeys for leg in journey]
+    times = iter(format_service_times(service_date, [secs for leg in legs
+                                                     for secs in (leg['departure_secs'], leg['arrival_secs'])]))
+    engine = planner.engine
+
+    def place(stop, coordinates):
+        if stop is None:
+            return {"coordinates": {"latitude": coordinates[0], "longitude": coordinates[1]}}
+        row = planner.stops[stop]
+        return {
+            "id": int(row.stop_id),
+            "name": row.stop_name,
+            "coordinates": {
+                "latitude": float(row.stop_lat),
+                "longitude": float(row.stop_lon)
+            }
+        }
+
+    def leg_json(leg):
+        details = {
+            "mode": leg['mode'],
+            "from": place(leg['from_stop'], start_coordinates),
+            "to": place(leg['to_stop'], end_coordinates),
+            "departure_time": next(times),
+            "arrival_time": next(times),
+        }
+        if leg['mode'] == 'transit':
+            trip = leg['trip']
+            details.update({
+                "trip_id": str(engine.trip_ids[trip]),
+                "route_id": engine.route_ids[trip],
+                "trip_headsign": engine.trip_headsigns[trip],
+                "stop_count": leg['to_position'] - leg['from_position'],
+            })
+        return details
+
+    results = []
+    for journey in journeys:
+        journey_legs = [leg_json(leg) for leg in journey]
+        results.append({
+            "departure_time": journey_legs[0]['departure_time'],
+            "arrival_time": journey_legs[-1]['arrival_time'],
+            "duration": journey[-1]['arrival_secs'] - journey[0]['departure_secs'],
+            "transfers": max(0, sum(leg['mode'] == 'transit' for leg in journey) - 1),
+            "legs": journey_legs
+        })
+    return results
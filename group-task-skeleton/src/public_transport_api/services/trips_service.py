@@ -1,56 +1,51 @@
-import sqlite3
-
-
-def get_trip_details(trip_id):
-    # FIXME This is a mock implementation and should be replaced with actual database queries.
-    conn = sqlite3.connect('trips.sqlite')
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT route_id, trip_headsign FROM main.trips LIMIT 1
-    """)
-    first_trip_row = cursor.fetchone()
-
-    conn.close()
-
-    if not first_trip_row:
+from datetime import date, datetime
+
+from public_transport_api.database_utils import open_feed
+from public_transport_api.time_utils import FEED_TIMEZONE, format_service_times
+from public_transport_api.timetable import current_timetable
+
+
+def get_trip_details(trip_id, service_date=None):
+    """
+    Returns the route, headsign and ordered stops of a trip, or None if the trip does not exist.
+    Stop times are given for service_date; by default for the next day on which the trip runs
+    according to service_days, starting today in the feed time zone.
+    """
+    today = datetime.now(FEED_TIMEZONE).date()
+    with open_feed() as feed:
+        # The in-memory timetable rebuilds the trip from its pattern when loaded for this feed version.
+        rows = (current_timetable(feed) or feed).trip_data({
+            'trip_id': trip_id,
+            'from_date': today.isoformat(),
+        })
+
+    if rows.empty:
         return None
 
-    route_id, trip_headsign = first_trip_row
+    first_row = rows.iloc[0]
+    if service_date is None:
+        next_service_date = first_row['service_date']
+        service_date = date.fromisoformat(next_service_date) if isinstance(next_service_date, str) else today
+    stops = rows.dropna(subset=['stop_name', 'arrival_secs', 'departure_secs'])
+    arrival_times = format_service_times(service_date, stops['arrival_secs'])
+    departure_times = format_service_times(service_date, stops['departure_secs'])
 
-    mocked_stop_details = [
-        {
-            "name": "Mock Stop A",
-            "coordinates": {
-                "latitude": 40.7128,
-                "longitude": -74.0060
-            },
-            "arrival_time": "2025-04-02T08:00:00Z",
-            "departure_time": "2025-04-02T08:05:00Z"
-        },
-        {
-            "name": "Mock Stop B",
-            "coordinates": {
-                "latitude": 40.7580,
-                "longitude": -73.9855
-            },
-            "arrival_time": "2025-04-02T08:15:00Z",
-            "departure_time": "2025-04-02T08:20:00Z"
-        },
+    stop_details = [
         {
-            "name": "Mock Stop C",
+            "name": stop.stop_name,
             "coordinates": {
-                "latitude": 40.7850,
-                "longitude": -73.9650
+                "latitude": float(stop.stop_lat),
+                "longitude": float(stop.stop_lon)
             },
-            "arrival_time": "2025-04-02T08:30:00Z",
-            "departure_time": "2025-04-02T08:35:00Z"
+            "arrival_time": arrival_time,
+            "departure_time": departure_time
         }
+        for stop, arrival_time, departure_time in zip(stops.itertuples(index=False), arrival_times, departure_times)
     ]
 
     return {
-        "trip_id": trip_id,
-        "route_id": route_id,
-        "trip_headsign": trip_headsign,
-        "stops": mocked_stop_details
+        "trip_id": first_row['trip_id'],
+        "route_id": first_row['route_id'],
+        "trip_headsign": first_row['trip_headsign'],
+        "stops": stop_details
     }
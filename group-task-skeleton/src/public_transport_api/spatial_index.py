@@ -0,0 +1,142 @@
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from public_transport_api.flat_arrays import FlatRecords
+from public_transport_api.geo import EARTH_RADIUS_M, haversine_m
+
+# Length of one degree of latitude on the mean sphere
+METRES_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+# Edge of a grid cell; a 1 km radius query visits at most 5x5 cells
+CELL_SIZE_M = 500
+# Indexes kept per process: the current feed version and the one requests may still be reading
+MAX_CACHED_INDEXES = 2
+
+
+class StopIndex:
+    """
+    Uniform latitude/longitude grid over the stops of a feed, for radius and k-nearest queries in metres.
+
+    Cells are CELL_SIZE_M high, and wide enough to span CELL_SIZE_M even at the stop farthest from the
+    equator, so every stop within r metres of a point lies at most ceil(r / cell_size_m) cells away.
+    A query only measures the stops of the cells around the point, so its cost depends on the local
+    stop density, not on the size of the feed.
+    """
+
+    def __init__(self, stops, cell_size_m=CELL_SIZE_M):
+        """
+        Parameters:
+        - stops (pd.DataFrame or FlatRecords): Rows of select_all_stops.sql.
+        - cell_size_m (float): Edge of a grid cell in metres.
+        """
+        self.stops = stops if isinstance(stops, FlatRecords) else FlatRecords(stops, 'Stop')
+        self.cell_size_m = cell_size_m
+        self._lats = self.stops.column('stop_lat').astype(float, copy=False)
+        self._lons = self.stops.column('stop_lon').astype(float, copy=False)
+        max_abs_lat = min(float(np.abs(self._lats).max()), 89.0) if len(self._lats) else 0.0
+        self._min_cos_lat = math.cos(math.radians(max_abs_lat))
+        self._lat_step = cell_size_m / METRES_PER_DEGREE
+        self._lon_step = cell_size_m / (METRES_PER_DEGREE * self._min_cos_lat)
+
+        cells_x, cells_y = self._cells(self._lats, self._lons)
+        order = np.lexsort((cells_y, cells_x))
+        keys = np.stack([cells_x[order], cells_y[order]], axis=1)
+        starts = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+        self._cells_rows = {(int(x), int(y)): rows
+                            for (x, y), rows in zip(keys[np.r_[0, starts]] if len(order) else [],
+                                                    np.split(order, starts))}
+        self._x_range = (int(cells_x.min()), int(cells_x.max())) if len(order) else (0, 0)
+        self._y_range = (int(cells_y.min()), int(cells_y.max())) if len(order) else (0, 0)
+
+    def _cells(self, lats, lons):
+        return (np.floor(np.asarray(lons) / self._lon_step).astype(np.int64),
+                np.floor(np.asarray(lats) / self._lat_step).astype(np.int64))
+
+    def _cell_span_m(self, lat):
+        """
+        Returns the distance in metres that a ring of cells is guaranteed to span around a point at lat.
+        Cells are narrower than cell_size_m only north (or south) of every stop.
+        """
+        return self.cell_size_m * min(1.0, math.cos(math.radians(min(abs(lat), 89.0))) / self._min_cos_lat)
+
+    def _ring_rows(self, cell_x, cell_y, ring):
+        """
+        Returns the rows of the stops in the cells exactly `ring` cells away from (cell_x, cell_y).
+        """
+        if ring == 0:
+            cells = [(cell_x, cell_y)]
+        else:
+            cells = [(cell_x + dx, cell_y + dy) for dx in range(-ring, ring + 1) for dy in (-ring, ring)]
+            cells += [(cell_x + dx, cell_y + dy) for dx in (-ring, ring) for dy in range(-ring + 1, ring)]
+        found = [self._cells_rows[cell] for cell in cells if cell in self._cells_rows]
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def _distances(self, coordinates, rows):
+        return haversine_m(coordinates[0], coordinates[1], self._lats[rows], self._lons[rows])
+
+    def within_rows(self, coordinates, radius_m):
+        """
+        Returns (rows, distances_m): the rows of self.stops within radius_m metres of coordinates and their
+        distances, the closest first.
+        """
+        cell_x, cell_y = (int(c) for c in self._cells(coordinates[0], coordinates[1]))
+        rings = math.ceil(radius_m / self._cell_span_m(coordinates[0]))
+        rows = np.concatenate([self._ring_rows(cell_x, cell_y, ring) for ring in range(rings + 1)])
+        distances = self._distances(coordinates, rows)
+        inside = np.flatnonzero(distances <= radius_m)
+        order = inside[np.argsort(distances[inside], kind='stable')]
+        return rows[order], distances[order]
+
+    def within(self, coordinates, radius_m):
+        """
+        Returns the stops within radius_m metres of coordinates as (distance_m, stop) tuples, the closest first.
+        """
+        rows, distances = self.within_rows(coordinates, radius_m)
+        return list(zip(distances.tolist(), self.stops.rows(rows)))
+
+    def nearest(self, coordinates, k):
+        """
+        Returns the k stops closest to coordinates as (distance_m, stop) tuples, the closest first.
+        Rings of cells are added until the k-th distance is covered by the searched area.
+        """
+        if not len(self.stops):
+            return []
+        cell_x, cell_y = (int(c) for c in self._cells(coordinates[0], coordinates[1]))
+        last_ring = max(abs(cell_x - self._x_range[0]), abs(cell_x - self._x_range[1]),
+                        abs(cell_y - self._y_range[0]), abs(cell_y - self._y_range[1]))
+        cell_span_m = self._cell_span_m(coordinates[0])
+        found = []
+        for ring in range(last_ring + 1):
+            found.append(self._ring_rows(cell_x, cell_y, ring))
+            rows = np.concatenate(found)
+            if len(rows) == len(self.stops):
+                break
+            if len(rows) < k:
+                continue
+            # Stops outside the searched rings are at least `ring` whole cells away.
+            distances = self._distances(coordinates, rows)
+            if np.partition(distances, k - 1)[k - 1] <= ring * cell_span_m:
+                break
+        rows = np.concatenate(found)
+        distances = self._distances(coordinates, rows)
+        order = np.argsort(distances, kind='stable')[:k]
+        return list(zip(distances[order].tolist(), self.stops.rows(rows[order])))
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def stop_index(feed):
+    """
+    Returns the StopIndex of a feed, built on first use for every feed version.
+    """
+    with _indexes_lock:
+        index = _indexes.get(feed.version)
+        if index is None:
+            index = _indexes[feed.version] = StopIndex(feed.all_stops())
+            while len(_indexes) > MAX_CACHED_INDEXES:
+                _indexes.popitem(last=False)
+        return index
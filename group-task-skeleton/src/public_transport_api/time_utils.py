@@ -0,0 +1,57 @@
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+# Time zone of the Wrocław feed (agency.txt); GTFS times are local service times.
+FEED_TIMEZONE = ZoneInfo('Europe/Warsaw')
+ISO_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def service_day_start(service_date: date) -> datetime:
+    """
+    Returns the UTC instant from which the GTFS times of a service day are counted.
+    GTFS defines it as "noon minus 12h" local time, which is midnight except on DST change days.
+    """
+    noon = datetime.combine(service_date, time(12), tzinfo=FEED_TIMEZONE)
+    return noon.astimezone(timezone.utc) - timedelta(hours=12)
+
+
+def to_service_time(moment: datetime) -> tuple[date, int]:
+    """
+    Converts a datetime to (service_date, seconds after the start of that service day).
+    Naive datetimes are taken as local feed time.
+    """
+    local = moment.astimezone(FEED_TIMEZONE) if moment.tzinfo else moment.replace(tzinfo=FEED_TIMEZONE)
+    service_date = local.date()
+    return service_date, int((local - service_day_start(service_date)).total_seconds())
+
+
+def format_service_times(service_date, seconds) -> list[str]:
+    """
+    Formats integer service times as ISO 8601 UTC timestamps in a single vectorized step.
+    service_date is either one date for all times or a sequence with the service date of every time
+    (as dates or ISO strings).
+    """
+    seconds = pd.Series(seconds, dtype='int64').reset_index(drop=True)
+    if isinstance(service_date, date):
+        start = pd.Timestamp(service_day_start(service_date))
+    else:
+        service_dates = pd.Series(service_date).reset_index(drop=True)
+        starts = {day: service_day_start(date.fromisoformat(str(day))) for day in service_dates.unique()}
+        start = pd.to_datetime(service_dates.map(starts), utc=True)
+    return (start + pd.to_timedelta(seconds, unit='s')).dt.strftime(ISO_FORMAT).tolist()
+
+
+@lru_cache(maxsize=64)
+def _day_start(service_date: str) -> datetime:
+    return service_day_start(date.fromisoformat(service_date))
+
+
+def format_service_time(service_date: str, seconds: int) -> str:
+    """
+    Formats one integer service time of a service date (ISO string) like format_service_times, without
+    the fixed cost of a vectorized step.
+    """
+    return (_day_start(service_date) + timedelta(seconds=int(seconds))).strftime(ISO_FORMAT)
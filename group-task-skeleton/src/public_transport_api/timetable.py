@@ -0,0 +1,272 @@
+import json
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from public_transport_api.columnar_store import STOP_DEPARTURES_COLUMNS, TRIP_DATA_COLUMNS, stop_departures_result
+from public_transport_api.database_utils import SqliteFeed, connect, published_sqlite_feed, query_registry
+from public_transport_api.flat_arrays import FlatRecords, RaggedArray, TextColumn
+from public_transport_api.patterns import CompactTrips, TripPatterns
+
+# Load the timetable engine at startup and reload it in the background when a new feed is published
+TIMETABLE_ENABLED = os.environ.get('PUBLIC_TRANSPORT_TIMETABLE', '0') == '1'
+
+
+class TimetableEngine:
+    """
+    In-process timetable answering "next departures at a stop" and trip lookups without SQL.
+
+    Stop times are kept in a CompactTrips store: every stop pattern once, and per trip its pattern,
+    start time and timing profile. For departure lookups they are additionally grouped by stop in CSR
+    form: the departure times of every stop sorted, with parallel arrays of their trips and positions
+    in the trip's pattern. The next departures at a stop after a time are then a binary search and a
+    slice. Whether a departing trip later calls near the destination is a position comparison in its
+    TripPatterns pattern, so candidates are filtered with array operations instead of per-trip lookups.
+
+    stop_departures and trip_data take the params and return the columns of select_stop_departures.sql
+    and select_trip_data.sql, so the engine can stand in for a feed.
+    """
+
+    def __init__(self, trips, stop_times, service_days, stops, version=None):
+        """
+        Parameters:
+        - trips (pd.DataFrame): trip_id, route_id, trip_headsign, service_id, variant_id, shape_id.
+        - stop_times (pd.DataFrame): trip_id, stop_sequence, stop_id, arrival_secs, departure_secs.
+        - service_days (pd.DataFrame): service_id, date (ISO string).
+        - stops (pd.DataFrame): Rows of select_all_stops.sql.
+        - version: Version of the feed the tables were read from.
+        """
+        self.version = version
+        # Sorted, so a trip is found by binary search
+        order = np.argsort(trips['trip_id'].to_numpy(dtype=str), kind='stable')
+        trips = trips.iloc[order].reset_index(drop=True)
+        self.trip_ids = trips['trip_id'].to_numpy(dtype=str)
+        self.route_ids = TextColumn(trips['route_id'])
+        self.trip_headsigns = TextColumn(trips['trip_headsign'])
+        service_ids, self._trip_services = np.unique(trips['service_id'].to_numpy(), return_inverse=True)
+
+        self.stops = FlatRecords(stops.sort_values('stop_id').reset_index(drop=True), 'Stop')
+
+        stop_times = stop_times.dropna(subset=['arrival_secs', 'departure_secs'])
+        trips_of_rows = pd.Index(trips['trip_id']).get_indexer(stop_times['trip_id'])
+        known = trips_of_rows >= 0
+        trips_of_rows = trips_of_rows[known]
+        row_sequences = stop_times['stop_sequence'].to_numpy()[known]
+        order = np.lexsort((row_sequences, trips_of_rows))
+        row_trips = trips_of_rows[order].astype(np.int32)
+        row_stops = stop_times['stop_id'].to_numpy()[known][order].astype(np.int64)
+        row_departures = stop_times['departure_secs'].to_numpy()[known][order].astype(np.int32)
+        # Rows of trip t are trip_starts[t]:trip_starts[t + 1]
+        trip_starts = np.searchsorted(row_trips, np.arange(len(self.trip_ids) + 1), 'left')
+        self.patterns = TripPatterns(trips, trip_starts, row_stops)
+        self._trip_patterns = self.patterns.trip_patterns
+        self.trips = CompactTrips(self.patterns, trip_starts, row_sequences[order],
+                                  stop_times['arrival_secs'].to_numpy()[known][order], row_departures)
+
+        by_stop = np.lexsort((row_departures, row_stops))
+        self.stop_ids, starts = np.unique(row_stops[by_stop], return_index=True)
+        # Departures of stop s are _stop_offsets[s]:_stop_offsets[s + 1] in the arrays below
+        self._stop_offsets = np.append(starts, len(by_stop))
+        self._departure_secs = row_departures[by_stop]
+        self._departure_trips = row_trips[by_stop]
+        self._departure_positions = (by_stop - trip_starts[row_trips[by_stop]]).astype(np.int32)
+
+        # A request looks up departures at several stops towards the same destination stops.
+        self._destination_reach = lru_cache(maxsize=64)(
+            lambda destination_stop_ids: self.patterns.last_positions(json.loads(destination_stop_ids)))
+
+        # For every date, a mask over service_ids telling which of them run
+        self._active_services = {
+            day: np.isin(service_ids, group['service_id'].to_numpy())
+            for day, group in service_days.groupby('date')
+        }
+        # For every service, the sorted dates on which it runs
+        service_dates = [np.empty(0, dtype='U10')] * len(service_ids)
+        for service_id, group in service_days.groupby('service_id'):
+            code = np.searchsorted(service_ids, service_id)
+            if code < len(service_ids) and service_ids[code] == service_id:
+                service_dates[code] = np.sort(group['date'].to_numpy(dtype=str))
+        self._service_dates = RaggedArray(service_dates, dtype='U10')
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by the engine's arrays, without the trip and stop names.
+        """
+        arrays = [self._stop_offsets, self._departure_secs, self._departure_trips, self._departure_positions,
+                  self.stop_ids, self._trip_services, self.patterns._index_stops, self.patterns._index_patterns,
+                  self.patterns._index_positions, self.route_ids, self.trip_headsigns, self._service_dates]
+        return self.trips.nbytes + sum(array.nbytes for array in arrays)
+
+    def stop_departures(self, params, as_frame=True):
+        """
+        Equivalent of select_stop_departures.sql for the params {stop_id, service_date, previous_date,
+        after_secs, destination_stop_ids (JSON list), limit}; see stop_departures_result for as_frame.
+        """
+        limit = params['limit']
+        position = int(np.searchsorted(self.stop_ids, params['stop_id']))
+        if position == len(self.stop_ids) or self.stop_ids[position] != params['stop_id']:
+            return stop_departures_result({col: [] for col in STOP_DEPARTURES_COLUMNS}, as_frame)
+        lo, hi = self._stop_offsets[position], self._stop_offsets[position + 1]
+        # Last position of every pattern at a destination stop; a departure qualifies if it is earlier.
+        reach = self._destination_reach(params['destination_stop_ids'])
+
+        found = []
+        days = [(params['service_date'], params['after_secs'], 0),
+                # Trips of the previous service day still run after midnight with times past 24:00.
+                (params['previous_date'], params['after_secs'] + 86400, 86400)]
+        for service_date, after_secs, day_offset in days:
+            active = self._active_services.get(service_date)
+            if active is None:
+                continue
+            start = lo + int(np.searchsorted(self._departure_secs[lo:hi], after_secs, 'left'))
+            trips = self._departure_trips[start:hi]
+            qualifies = active[self._trip_services[trips]] & \
+                (reach[self._trip_patterns[trips]] > self._departure_positions[start:hi])
+            for i in np.flatnonzero(qualifies)[:limit] + start:
+                found.append((int(self._departure_secs[i]) - day_offset, int(i), service_date))
+
+        found.sort()
+        found = found[:limit]
+        departures = np.array([i for _, i, _ in found], dtype=np.int64)
+        trips, positions = self._departure_trips[departures], self._departure_positions[departures]
+        return stop_departures_result({
+            'trip_id': self.trip_ids[trips],
+            'route_id': self.route_ids[trips],
+            'trip_headsign': self.trip_headsigns[trips],
+            'stop_sequence': self.trips.stop_sequence(trips, positions),
+            'arrival_secs': self.trips.arrival_secs(trips, positions),
+            'departure_secs': self._departure_secs[departures],
+            'service_date': [service_date for _, _, service_date in found],
+        }, as_frame)
+
+    def trip_data(self, params):
+        """
+        Equivalent of select_trip_data.sql for the params {trip_id, from_date}; the stops of the trip
+        are rebuilt from its pattern.
+        """
+        trip = int(np.searchsorted(self.trip_ids, params['trip_id']))
+        if trip == len(self.trip_ids) or self.trip_ids[trip] != params['trip_id']:
+            return pd.DataFrame(columns=TRIP_DATA_COLUMNS)
+        dates = self._service_dates[self._trip_services[trip]]
+        next_date = np.searchsorted(dates, params['from_date'])
+        stop_ids, _, arrival_secs, departure_secs = self.trips.stop_times(trip)
+        if len(stop_ids):
+            stop_table_ids = self.stops.column('stop_id')
+            stop_rows = np.minimum(np.searchsorted(stop_table_ids, stop_ids), max(len(stop_table_ids) - 1, 0))
+            # LEFT JOIN semantics: a stop missing from stops has no name or coordinates.
+            known = stop_table_ids[stop_rows] == stop_ids if len(stop_table_ids) else np.zeros(len(stop_ids), bool)
+            stop_rows = stop_rows[known]
+            stop_names = np.full(len(stop_ids), None, dtype=object)
+            stop_names[known] = self.stops.values('stop_name', stop_rows)
+            stop_lats, stop_lons = np.full(len(stop_ids), np.nan), np.full(len(stop_ids), np.nan)
+            stop_lats[known] = self.stops.column('stop_lat')[stop_rows]
+            stop_lons[known] = self.stops.column('stop_lon')[stop_rows]
+            stop_columns = {
+                'stop_name': stop_names,
+                'stop_lat': stop_lats,
+                'stop_lon': stop_lons,
+                'arrival_secs': arrival_secs,
+                'departure_secs': departure_secs,
+            }
+        else:
+            # LEFT JOIN semantics: a trip without stop times still yields one row.
+            stop_columns = {col: [None] for col in TRIP_DATA_COLUMNS[3:8]}
+        return pd.DataFrame({
+            'trip_id': str(self.trip_ids[trip]),
+            'route_id': self.route_ids[trip],
+            'trip_headsign': self.trip_headsigns[trip],
+            **stop_columns,
+            'service_date': str(dates[next_date]) if next_date < len(dates) else None,
+        }, columns=TRIP_DATA_COLUMNS)
+
+
+_engine = None
+_loading = threading.Lock()
+_require_lock = threading.Lock()
+# Whether current_timetable may start the background loader, see disable_background_loading
+_background_loading = TIMETABLE_ENABLED
+
+
+def load_timetable(db_path=None):
+    """
+    Loads the TimetableEngine from the database (DB_PATH by default) and makes it the current one.
+    """
+    global _engine
+    conn = connect(db_path)
+    try:
+        # One connection keeps reading the same file even if a new version is published meanwhile.
+        version = SqliteFeed(conn).version
+        queries = query_registry()
+        engine = TimetableEngine(
+            queries.fetch_frame(conn, 'select_timetable_trips'),
+            queries.fetch_frame(conn, 'select_timetable_stop_times'),
+            queries.fetch_frame(conn, 'select_service_days'),
+            queries.fetch_frame(conn, 'select_all_stops'),
+            version=version,
+        )
+    finally:
+        conn.close()
+    _engine = engine
+    logger.info(f"Timetable engine loaded for feed version {version[:12]}: {len(engine.patterns)} patterns, "
+                f"{engine.trips.override_count} timing overrides, {engine.nbytes / 1e6:.1f} MB")
+    return engine
+
+
+def _reload():
+    try:
+        load_timetable()
+    except Exception as e:
+        logger.info(f"Timetable engine reload failed: {e}")
+    finally:
+        _loading.release()
+
+
+def disable_background_loading():
+    """
+    Stops current_timetable from starting the background loader and waits for a running one, for a
+    process that loads the engine itself before forking: a child process only gets the forking thread,
+    so a worker forked during a background load would inherit _loading held by a thread it does not have.
+    """
+    global _background_loading
+    _background_loading = False
+    with _loading:
+        pass
+
+
+def require_timetable():
+    """
+    Returns the TimetableEngine of the database published at DB_PATH, loading it first if it is missing
+    or stale. Unlike current_timetable this blocks, for features that have no SQL fallback.
+    The published version is only queried when the file at DB_PATH changes (see published_sqlite_feed).
+    """
+    engine = _engine
+    version = published_sqlite_feed()[0]
+    if engine is not None and engine.version == version:
+        return engine
+    with _require_lock:
+        engine = _engine
+        if engine is None or engine.version != version:
+            engine = load_timetable()
+        return engine
+
+
+def current_timetable(feed):
+    """
+    Returns the loaded TimetableEngine if it was built from the same feed version as the SQLite feed,
+    otherwise None so the caller falls back to SQL. With TIMETABLE_ENABLED a stale or missing engine
+    is (re)loaded in a background thread meanwhile.
+    The columnar backend already serves departures from arrays and never uses the engine.
+    """
+    if not isinstance(feed, SqliteFeed):
+        return None
+    engine = _engine
+    if engine is not None and engine.version == feed.version:
+        return engine
+    if _background_loading and _loading.acquire(blocking=False):
+        threading.Thread(target=_reload, name='timetable-reload', daemon=True).start()
+    return None
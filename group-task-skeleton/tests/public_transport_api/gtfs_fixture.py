@@ -0,0 +1,84 @@
+"""
+A small GTFS feed imported with tools/database_tool.py, shared by the service tests.
+
+The start point lies south of the destination. Stop 1 is ~110 m north of the start point and
+stop 2 ~350 m east of it; stop 4 is ~110 m from the destination and stop 5 is far south.
+
+- 3_1 and 3_2 (line A) run north 1 -> 3 -> 4 at 08:00 and 09:00.
+- 3_3 (line A) runs south 4 -> 3 -> 1 -> 5, so it is excluded at stop 1.
+- 3_4 (line B) runs 2 -> 4 at 08:20 and 3_5 (line N) at 25:10, i.e. 01:10 the next morning.
+
+All trips belong to service 6, which runs Monday to Thursday from 2025-03-22 to 2025-04-06,
+except on 2025-04-03 (calendar_dates); service 4 is added on that day instead.
+"""
+import os
+import sys
+from datetime import date, datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'tools'))
+
+import database_tool  # noqa: E402
+
+START_COORDINATES = (51.1000, 17.0000)
+END_COORDINATES = (51.1200, 17.0000)
+# 08:00 local time (CEST) on a Wednesday
+START_TIME = datetime(2025, 4, 2, 6, 0, tzinfo=timezone.utc)
+SERVICE_DATE = date(2025, 4, 2)
+
+FEED = {
+    'calendar.txt': [
+        'service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date',
+        '4,0,0,0,0,0,0,1,20250322,20250406',
+        '6,1,1,1,1,0,0,0,20250322,20250406',
+    ],
+    'calendar_dates.txt': [
+        'service_id,date,exception_type',
+        '6,20250403,2',
+        '4,20250403,1',
+    ],
+    'stops.txt': [
+        'stop_id,stop_code,stop_name,stop_lat,stop_lon',
+        '1,101,"Start North",51.1010,17.0000',
+        '2,102,"Start East",51.1000,17.0050',
+        '3,103,"Middle",51.1100,17.0000',
+        '4,104,"End",51.1190,17.0000',
+        '5,105,"Far South",51.0800,17.0000',
+    ],
+    'trips.txt': [
+        'route_id,service_id,trip_id,trip_headsign,direction_id,shape_id,brigade_id,vehicle_id,variant_id',
+        'A,6,3_1,"End",0,10,1,1,10',
+        'A,6,3_2,"End",0,10,1,1,10',
+        'A,6,3_3,"Far South",1,11,2,1,11',
+        'B,6,3_4,"End",0,20,3,1,20',
+        'N,6,3_5,"End",0,20,4,1,20',
+    ],
+    'stop_times.txt': [
+        'trip_id,arrival_time,departure_time,stop_id,stop_sequence,pickup_type,drop_off_type',
+        '3_1,08:00:00,08:00:30,1,0,0,0',
+        '3_1,08:05:00,08:05:30,3,1,0,0',
+        '3_1,08:10:00,08:10:00,4,2,0,0',
+        '3_2,09:00:00,09:00:30,1,0,0,0',
+        '3_2,09:05:00,09:05:30,3,1,0,0',
+        '3_2,09:10:00,09:10:00,4,2,0,0',
+        '3_3,08:30:00,08:30:00,4,0,0,0',
+        '3_3,08:35:00,08:35:30,3,1,0,0',
+        '3_3,08:40:00,08:40:30,1,2,0,0',
+        '3_3,08:50:00,08:50:00,5,3,0,0',
+        '3_4,08:20:00,08:20:30,2,0,0,0',
+        '3_4,08:30:00,08:30:00,4,1,0,0',
+        '3_5,25:10:00,25:10:00,2,0,0,0',
+        '3_5,25:20:00,25:20:00,4,1,0,0',
+    ],
+}
+
+
+def build_feed_database(directory):
+    """
+    Writes FEED as GTFS files into directory, imports it and returns the database path.
+    """
+    for filename, lines in FEED.items():
+        with open(os.path.join(directory, filename), 'w', encoding='utf-8') as f:
+            f.write('﻿' + '\n'.join(lines) + '\n')
+    db_path = os.path.join(directory, 'trips.sqlite')
+    database_tool.infer_and_import_gtfs(directory, db_path, streaming=True)
+    return db_path
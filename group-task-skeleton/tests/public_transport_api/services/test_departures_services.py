@@ -1,13 +1,111 @@
+import tempfile
 import unittest
 from unittest.mock import patch
 
+from public_transport_api.database_utils import SqliteFeed
+from public_transport_api.services.departures_service import get_closest_departures, get_closest_departures_batch, \
+    merge_departures
+from tests.public_transport_api.gtfs_fixture import END_COORDINATES, START_COORDINATES, START_TIME, \
+    build_feed_database
+
 
 class TestDeparturesService(unittest.TestCase):
 
-    # TODO replace with actual tests implementation
-    @patch('public_transport_api.services.departures_service.sqlite3.connect')
-    def test_get_closest_departures_success(self, mock_connect):
-        pass
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db_path = build_feed_database(self.tmp_dir.name)
+        patcher = patch('public_transport_api.database_utils.DB_PATH', db_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_closest_departures_success(self):
+        """
+        Test that departures are sorted by stop distance, then time, and exclude trips
+        going away from the destination.
+        """
+        departures = get_closest_departures(START_COORDINATES, END_COORDINATES, START_TIME, limit=3)
+
+        self.assertEqual([d['trip_id'] for d in departures], ['3_1', '3_2', '3_4'])
+        first = departures[0]
+        self.assertEqual(first['route_id'], 'A')
+        self.assertEqual(first['stop']['name'], 'Start North')
+        self.assertEqual(first['stop']['arrival_time'], '2025-04-02T06:00:00Z')
+        self.assertEqual(first['stop']['departure_time'], '2025-04-02T06:00:30Z')
+        self.assertAlmostEqual(first['distance_start_to_stop'], 111.2, delta=0.5)
+        self.assertLess(departures[0]['distance_start_to_stop'], departures[2]['distance_start_to_stop'])
+
+    def test_get_closest_departures_after_midnight(self):
+        """
+        Test that GTFS times past 24:00 compare after the evening and are formatted on the next day.
+        """
+        departures = get_closest_departures(START_COORDINATES, END_COORDINATES,
+                                            START_TIME.replace(hour=20), limit=5)
+
+        self.assertEqual([d['trip_id'] for d in departures], ['3_5'])
+        self.assertEqual(departures[0]['stop']['departure_time'], '2025-04-02T23:10:00Z')
+
+    def test_get_closest_departures_only_active_services(self):
+        """
+        Test that trips of a service removed by calendar_dates do not run that day, while the
+        previous day's trips past 24:00 still do.
+        """
+        departures = get_closest_departures(START_COORDINATES, END_COORDINATES,
+                                            START_TIME.replace(day=2, hour=22, minute=30), limit=5)
+
+        self.assertEqual([d['trip_id'] for d in departures], ['3_5'])
+        self.assertEqual(departures[0]['stop']['departure_time'], '2025-04-02T23:10:00Z')
+        self.assertEqual(get_closest_departures(START_COORDINATES, END_COORDINATES,
+                                                START_TIME.replace(day=3), limit=5), [])
+
+    def test_get_closest_departures_no_stops_nearby(self):
+        self.assertEqual(get_closest_departures((50.0, 19.0), END_COORDINATES, START_TIME), [])
+
+    def test_batch_matches_single_queries_in_order(self):
+        """
+        Test that a batch returns every query's departures in input order, and that repeated queries
+        scan every stop once for the largest limit.
+        """
+        queries = [
+            (START_COORDINATES, END_COORDINATES, START_TIME, 3),
+            (START_COORDINATES, END_COORDINATES, START_TIME.replace(hour=20), 5),
+            ((50.0, 19.0), END_COORDINATES, START_TIME, 5),
+            (START_COORDINATES, END_COORDINATES, START_TIME, 1),
+            (START_COORDINATES, END_COORDINATES, START_TIME, 3),
+        ]
+        expected = [get_closest_departures(*query) for query in queries]
+
+        scan = SqliteFeed.stop_departures
+        with patch.object(SqliteFeed, 'stop_departures', autospec=True, side_effect=scan) as stop_departures:
+            results = get_closest_departures_batch(queries)
+
+        self.assertEqual(results, expected)
+        self.assertEqual([[d['trip_id'] for d in departures] for departures in results],
+                         [['3_1', '3_2', '3_4'], ['3_5'], [], ['3_1'], ['3_1', '3_2', '3_4']])
+        scanned = [(call.args[1]['stop_id'], call.args[1]['after_secs']) for call in stop_departures.call_args_list]
+        self.assertEqual(len(scanned), len(set(scanned)))
+
+    def test_merge_departures_is_lazy(self):
+        """
+        Test that stops are queried in distance order only until `limit` departures are found, and
+        that stops at the same distance are merged by time.
+        """
+        times = {'a': [10, 20, 30], 'b': [5, 25], 'c': [1], 'd': [2, 3]}
+        start_stops = [(100.0, 'a'), (100.0, 'b'), (200.0, 'c'), (300.0, 'd')]
+        queried = []
+
+        def departures_at(stop, count):
+            queried.append((stop, count))
+            return [(t, f'{stop}{t}') for t in times[stop][:count]]
+
+        merged = merge_departures(start_stops, departures_at, 4)
+
+        self.assertEqual([departure for _, _, departure in merged], ['b5', 'a10', 'a20', 'b25'])
+        self.assertEqual(queried, [('a', 4), ('b', 4)])
+        self.assertEqual(merge_departures(start_stops, departures_at, 0), [])
+        self.assertEqual(len(merge_departures(start_stops, departures_at, 10)), 8)
 
 if __name__ == '__main__':
     unittest.main()
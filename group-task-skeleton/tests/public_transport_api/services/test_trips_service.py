@@ -1,14 +1,44 @@
+import tempfile
 import unittest
 from unittest.mock import patch
 
+from public_transport_api.services.trips_service import get_trip_details
+from tests.public_transport_api.gtfs_fixture import SERVICE_DATE, build_feed_database
+
 
 
 
 class TestGetTripDetails(unittest.TestCase):
-    # TODO replace with actual tests implementation
-    @patch('public_transport_api.services.trips_service.sqlite3.connect')
-    def test_get_trip_details_success(self, mock_connect):
-        pass
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db_path = build_feed_database(self.tmp_dir.name)
+        patcher = patch('public_transport_api.database_utils.DB_PATH', db_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_trip_details_success(self):
+        """
+        Test that the trip's stops are returned in stop_sequence order with ISO 8601 UTC times.
+        """
+        trip = get_trip_details('3_1', SERVICE_DATE)
+
+        self.assertEqual(trip['trip_id'], '3_1')
+        self.assertEqual(trip['route_id'], 'A')
+        self.assertEqual(trip['trip_headsign'], 'End')
+        self.assertEqual([stop['name'] for stop in trip['stops']], ['Start North', 'Middle', 'End'])
+        self.assertEqual(trip['stops'][1], {
+            "name": "Middle",
+            "coordinates": {"latitude": 51.11, "longitude": 17.0},
+            "arrival_time": "2025-04-02T06:05:00Z",
+            "departure_time": "2025-04-02T06:05:30Z"
+        })
+
+    def test_get_trip_details_not_found(self):
+        self.assertIsNone(get_trip_details('unknown'))
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+from public_transport_api import database_utils
+from public_transport_api.asgi import WsgiToAsgi
+from public_transport_api.main import app as flask_app
+from tests.public_transport_api.gtfs_fixture import build_feed_database
+
+
+async def call(asgi_app, method, url, body=b'', headers=()):
+    """
+    Sends one HTTP request to an ASGI application and returns (status, headers, body).
+    """
+    url = urlsplit(url)
+    scope = {'type': 'http', 'method': method, 'path': url.path, 'query_string': url.query.encode(),
+             'headers': [(b'host', b'localhost'), *headers], 'http_version': '1.1', 'scheme': 'http',
+             'server': ('localhost', 8000), 'client': ('127.0.0.1', 50000), 'root_path': ''}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi_app(scope, receive, send)
+    start = sent[0]
+    return start['status'], dict(start['headers']), b''.join(message.get('body', b'') for message in sent[1:])
+
+
+class TestAsgi(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        patcher = patch.object(database_utils, 'DB_PATH', build_feed_database(self.tmp_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.asgi_app = WsgiToAsgi(flask_app, max_threads=2, max_queue=4, queue_timeout_secs=5)
+
+    def tearDown(self):
+        self.asgi_app.executor.shutdown()
+        self.tmp_dir.cleanup()
+
+    def test_responses_match_the_flask_app(self):
+        """
+        Test that requests served through the ASGI app get the responses of the Flask test client.
+        """
+        requests = [
+            ('GET', '/public_transport/city/TestCity/closest_departures', b''),
+            ('GET', '/public_transport/city/TestCity/closest_departures?start_time=2023-05-01T12:00:00Z', b''),
+            ('GET', '/public_transport/city/TestCity/closest_departures?start_coordinates=invalid'
+                    '&end_coordinates=invalid&start_time=2023-05-01T12:00:00Z', b''),
+            ('GET', '/public_transport/city/wroclaw/trip/3_3', b''),
+            ('GET', '/public_transport/city/wroclaw/trip/missing', b''),
+            ('POST', '/public_transport/city/wroclaw/closest_departures/batch', json.dumps({}).encode()),
+        ]
+        with flask_app.test_client() as client:
+            for method, url, body in requests:
+                with self.subTest(url=url):
+                    expected = client.open(url, method=method, data=body, content_type='application/json')
+                    status, headers, data = asyncio.run(call(self.asgi_app, method, url, body,
+                                                              [(b'content-type', b'application/json')]))
+                    self.assertEqual(status, expected.status_code)
+                    self.assertEqual(headers[b'content-type'], expected.headers['Content-Type'].encode())
+                    self.assertEqual(json.loads(data), expected.get_json())
+
+    def test_full_queue_is_rejected(self):
+        """
+        Test that requests beyond the threads and the queue get 503 instead of waiting, and that the
+        queued request is served once a thread is free.
+        """
+        release = threading.Event()
+
+        def slow_app(environ, start_response):
+            release.wait(5)
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'done']
+
+        asgi_app = WsgiToAsgi(slow_app, max_threads=1, max_queue=1, queue_timeout_secs=5)
+
+        async def scenario():
+            running = asyncio.ensure_future(call(asgi_app, 'GET', '/'))
+            queued = asyncio.ensure_future(call(asgi_app, 'GET', '/'))
+            await asyncio.sleep(0.05)
+            self.assertEqual(asgi_app.stats()['waiting'], 1)
+            status, headers, _ = await call(asgi_app, 'GET', '/')
+            release.set()
+            return status, headers, await running, await queued
+
+        status, headers, running, queued = asyncio.run(scenario())
+        asgi_app.executor.shutdown()
+        self.assertEqual((status, headers[b'retry-after']), (503, b'1'))
+        self.assertEqual([running[0], queued[0]], [200, 200])
+        self.assertEqual(queued[2], b'done')
+        self.assertEqual(asgi_app.rejected, 1)
+
+    def test_queue_timeout(self):
+        release = threading.Event()
+
+        def slow_app(environ, start_response):
+            release.wait(5)
+            start_response('200 OK', [])
+            return []
+
+        asgi_app = WsgiToAsgi(slow_app, max_threads=1, max_queue=10, queue_timeout_secs=0.05)
+
+        async def scenario():
+            running = asyncio.ensure_future(call(asgi_app, 'GET', '/'))
+            await asyncio.sleep(0.01)
+            status = (await call(asgi_app, 'GET', '/'))[0]
+            release.set()
+            await running
+            return status
+
+        self.assertEqual(asyncio.run(scenario()), 503)
+        asgi_app.executor.shutdown()
+
+    def test_timeout_after_acquiring_releases_the_thread(self):
+        """
+        Test that a wait for a thread timing out just after the thread was acquired gives it back.
+        """
+        calls = []
+
+        def app(environ, start_response):
+            calls.append(environ['PATH_INFO'])
+            start_response('200 OK', [])
+            return []
+
+        asgi_app = WsgiToAsgi(app, max_threads=1, max_queue=10, queue_timeout_secs=5)
+
+        async def acquired_then_timed_out(awaitable, timeout):
+            await awaitable
+            raise asyncio.TimeoutError
+
+        async def scenario():
+            with patch.object(asyncio, 'wait_for', acquired_then_timed_out):
+                rejected = (await call(asgi_app, 'GET', '/late'))[0]
+            return rejected, (await call(asgi_app, 'GET', '/next'))[0]
+
+        self.assertEqual(asyncio.run(scenario()), (503, 200))
+        asgi_app.executor.shutdown()
+        self.assertEqual(calls, ['/next'])
+        self.assertFalse(asgi_app._slots.locked())
+
+    def test_disconnected_request_is_not_run(self):
+        calls = []
+        sent = []
+
+        def app(environ, start_response):
+            calls.append(environ)
+            start_response('200 OK', [])
+            return []
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        asgi_app = WsgiToAsgi(app, max_threads=1)
+        scope = {'type': 'http', 'method': 'POST', 'path': '/', 'headers': []}
+        asyncio.run(asgi_app(scope, receive, send))
+        asgi_app.executor.shutdown()
+        self.assertEqual((calls, sent), ([], []))
+
+    def test_unsupported_scopes_are_refused(self):
+        messages = [{'type': 'websocket.connect'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.asgi_app({'type': 'websocket', 'path': '/', 'headers': []}, receive, send))
+        asyncio.run(self.asgi_app({'type': 'webtransport'}, receive, send))
+        self.assertEqual(sent, [{'type': 'websocket.close', 'code': 1000}])
+
+    def test_chunks_are_sent_as_they_are_produced(self):
+        """
+        Test that the first NDJSON line is sent before the WSGI iterable produces the next one, and that
+        the thread is released once the iterable is exhausted.
+        """
+        first_line_sent = threading.Event()
+        waited = []
+        sent = []
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'application/x-ndjson')])
+            yield b'{"metadata":{}}\n'
+            waited.append(first_line_sent.wait(5))
+            yield b'{"trip_id":"3_1"}\n'
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+            if message.get('body'):
+                first_line_sent.set()
+
+        asgi_app = WsgiToAsgi(app, max_threads=1)
+        asyncio.run(asgi_app({'type': 'http', 'method': 'GET', 'path': '/', 'headers': []}, receive, send))
+        asgi_app.executor.shutdown()
+        self.assertEqual(waited, [True])
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual([(message['body'], message['more_body']) for message in sent[1:]],
+                         [(b'{"metadata":{}}\n', True), (b'{"trip_id":"3_1"}\n', True), (b'', False)])
+        self.assertEqual(asgi_app.running, 0)
+        self.assertFalse(asgi_app._slots.locked())
+
+    def test_application_error_releases_the_thread(self):
+        def app(environ, start_response):
+            raise RuntimeError('failed')
+
+        asgi_app = WsgiToAsgi(app, max_threads=1)
+        with self.assertRaises(RuntimeError):
+            asyncio.run(call(asgi_app, 'GET', '/'))
+        asgi_app.executor.shutdown()
+        self.assertEqual(asgi_app.running, 0)
+        self.assertFalse(asgi_app._slots.locked())
+
+    def test_lifespan(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.asgi_app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+
+from public_transport_api.columnar_store import ColumnarFeed, current_snapshot
+from public_transport_api.database_utils import SqliteFeed, connect
+from public_transport_api.services.departures_service import get_closest_departures
+from tests.public_transport_api.gtfs_fixture import END_COORDINATES, START_COORDINATES, START_TIME, \
+    build_feed_database, database_tool
+
+
+class TestColumnarFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = build_feed_database(self.tmp_dir.name)
+        self.columnar_dir = os.path.join(self.tmp_dir.name, 'columnar')
+        database_tool.export_columnar(self.db_path, self.columnar_dir)
+        self.conn = connect(self.db_path)
+        self.sqlite_feed = SqliteFeed(self.conn)
+        self.columnar_feed = ColumnarFeed(current_snapshot(self.columnar_dir))
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def assert_same_rows(self, expected, actual):
+        self.assertEqual(list(expected.columns), list(actual.columns))
+        self.assertEqual(expected.astype(object).where(expected.notna(), None).values.tolist(),
+                         actual.astype(object).where(actual.notna(), None).values.tolist())
+
+    def test_snapshot_is_memory_mapped(self):
+        self.assertEqual(sorted(os.listdir(self.columnar_dir)),
+                         sorted(['CURRENT', os.path.basename(self.columnar_feed.directory)]))
+        with open(os.path.join(self.columnar_feed.directory, 'manifest.json'), encoding='utf-8') as file:
+            manifest = json.load(file)
+        self.assertEqual(manifest['tables']['stop_times']['rows'], 14)
+        self.assertIn('dictionary', manifest['tables']['trips']['columns']['trip_id'])
+        self.assertEqual(self.columnar_feed.column('stop_times', 'departure_secs').mode, 'r')
+
+    def test_all_stops_matches_sqlite(self):
+        expected = self.sqlite_feed.all_stops()
+        actual = self.columnar_feed.all_stops()
+        self.assertEqual(list(expected.columns), list(actual.columns))
+        self.assertEqual(expected['stop_name'].tolist(), actual['stop_name'].tolist())
+        pd.testing.assert_series_equal(expected['stop_lat'], actual['stop_lat'])
+
+    def test_trip_data_matches_sqlite(self):
+        for trip_id in ['3_1', '3_3', '3_5', 'missing']:
+            for from_date in ['2025-04-01', '2025-04-03', '2025-05-01']:
+                params = {'trip_id': trip_id, 'from_date': from_date}
+                with self.subTest(**params):
+                    self.assert_same_rows(self.sqlite_feed.trip_data(params), self.columnar_feed.trip_data(params))
+
+    def test_trip_data_of_unknown_stop_matches_sqlite(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO stop_times (trip_id, arrival_time, departure_time, stop_id, stop_sequence, "
+                         "arrival_secs, departure_secs) VALUES ('3_3', '09:40:00', '09:40:00', 6, 4, 34800, 34800)")
+        database_tool.export_columnar(self.db_path, self.columnar_dir)
+        columnar_feed = ColumnarFeed(current_snapshot(self.columnar_dir))
+        params = {'trip_id': '3_3', 'from_date': '2025-04-01'}
+        expected = self.sqlite_feed.trip_data(params)
+        self.assertTrue(expected[['stop_name', 'stop_lat', 'stop_lon']].iloc[-1].isna().all())
+        self.assert_same_rows(expected, columnar_feed.trip_data(params))
+
+    def test_stop_departures_matches_sqlite(self):
+        for stop_id in [1, 2, 4, 99]:
+            for service_date, previous_date, after_secs in [('2025-04-02', '2025-04-01', 28800),
+                                                            ('2025-04-03', '2025-04-02', 0),
+                                                            ('2025-04-02', '2025-04-01', 80000)]:
+                for limit in [1, 5]:
+                    params = {'stop_id': stop_id, 'service_date': service_date, 'previous_date': previous_date,
+                              'after_secs': after_secs, 'destination_stop_ids': json.dumps([3, 4]), 'limit': limit}
+                    with self.subTest(**params):
+                        self.assert_same_rows(self.sqlite_feed.stop_departures(params),
+                                              self.columnar_feed.stop_departures(params))
+
+    def test_services_use_columnar_backend(self):
+        with patch('public_transport_api.database_utils.COLUMNAR_DIR', self.columnar_dir), \
+                patch('public_transport_api.database_utils.DB_PATH', os.path.join(self.tmp_dir.name, 'missing')):
+            departures = get_closest_departures(START_COORDINATES, END_COORDINATES, START_TIME, limit=3)
+
+        self.assertEqual([d['trip_id'] for d in departures], ['3_1', '3_2', '3_4'])
+        self.assertEqual(departures[0]['stop']['departure_time'], '2025-04-02T06:00:30Z')
+
+
+if __name__ == '__main__':
+    unittest.main()
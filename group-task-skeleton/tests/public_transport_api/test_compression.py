@@ -0,0 +1,149 @@
+import gzip
+import json
+import tempfile
+import unittest
+import zlib
+from unittest.mock import patch
+
+from flask import request
+
+from public_transport_api import compression, database_utils
+from public_transport_api.controllers import trips_controller
+from public_transport_api.main import app
+from public_transport_api.response_cache import CACHES, ResponseCache
+from tests.public_transport_api.gtfs_fixture import build_feed_database
+from tests.public_transport_api.test_http_caching import DEPARTURES_URL
+
+BATCH_URL = '/public_transport/city/wroclaw/closest_departures/batch'
+QUERIES = [
+    {'start_coordinates': '51.101,17.0', 'end_coordinates': '51.119,17.0', 'start_time': '2025-04-02T06:00:00Z'},
+    {'start_coordinates': '51.101,17.0', 'end_coordinates': '51.119,17.0', 'start_time': '2025-04-02T07:00:00Z',
+     'limit': 1},
+]
+
+
+def ndjson_lines(data):
+    return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+
+
+class TestIterCompressed(unittest.TestCase):
+
+    def test_every_chunk_can_be_decoded_when_it_arrives(self):
+        chunks = [json.dumps({'line': i}).encode() + b'\n' for i in range(3)]
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        decoded = [decompressor.decompress(data) for data in compression.iter_compressed(iter(chunks), 'gzip')]
+        self.assertEqual(decoded[:3], chunks)
+        self.assertEqual(b''.join(decoded), b''.join(chunks))
+        self.assertTrue(decompressor.eof)
+
+    def test_gzip_round_trip(self):
+        data = b'{"name":"Plac Grunwaldzki"}' * 100
+        self.assertEqual(gzip.decompress(compression.compress(data, 'gzip')), data)
+
+    @unittest.skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        with app.test_request_context(headers={'Accept-Encoding': 'gzip, br'}):
+            self.assertEqual(compression.negotiate_encoding(request.accept_encodings), 'br')
+        data = b'{"name":"Plac Grunwaldzki"}' * 100
+        self.assertEqual(compression.brotli.decompress(compression.compress(data, 'br')), data)
+
+
+class TestCompressedResponses(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.db_path = build_feed_database(self.tmp_dir.name)
+        caches = patch.dict(CACHES)
+        caches.start()
+        self.addCleanup(caches.stop)
+        for patcher in [patch.object(database_utils, 'DB_PATH', self.db_path),
+                        patch.object(trips_controller, 'trip_details_cache', ResponseCache('trip_details', 10, 300)),
+                        patch.object(compression, 'COMPRESS_MIN_BYTES', 256),
+                        patch.object(compression, 'brotli', None)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_gzip_is_negotiated(self):
+        """
+        Test that a trip details response is gzipped for a client accepting gzip, with a weak ETag that
+        still validates, and sent as it is otherwise.
+        """
+        with app.test_client() as client:
+            plain = client.get('/public_transport/city/wroclaw/trip/3_3')
+            self.assertGreaterEqual(len(plain.get_data()), 256)
+            self.assertNotIn('Content-Encoding', plain.headers)
+
+            compressed = client.get('/public_transport/city/wroclaw/trip/3_3', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', compressed.headers['Vary'])
+            self.assertEqual(gzip.decompress(compressed.get_data()), plain.get_data())
+            self.assertLess(len(compressed.get_data()), len(plain.get_data()))
+            self.assertEqual(compressed.headers['ETag'], 'W/' + plain.headers['ETag'])
+
+            revalidated = client.get('/public_transport/city/wroclaw/trip/3_3',
+                                     headers={'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(revalidated.headers['Vary'], compressed.headers['Vary'])
+
+            refused = client.get('/public_transport/city/wroclaw/trip/3_3', headers={'Accept-Encoding': 'gzip;q=0'})
+            self.assertNotIn('Content-Encoding', refused.headers)
+
+    def test_small_responses_are_not_compressed(self):
+        with patch.object(compression, 'COMPRESS_MIN_BYTES', 10 ** 6), app.test_client() as client:
+            response = client.get('/public_transport/city/wroclaw/trip/3_3', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        json.loads(response.get_data())
+
+    def test_not_modified_varies_like_the_response(self):
+        """
+        Test that a 304 carries the same Vary as the 200 it revalidates, for both endpoint families.
+        """
+        with app.test_client() as client:
+            for url in ['/public_transport/city/wroclaw/trip/3_3', DEPARTURES_URL]:
+                with self.subTest(url=url):
+                    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+                    revalidated = client.get(url, headers={'Accept-Encoding': 'gzip',
+                                                           'If-None-Match': response.headers['ETag']})
+                    self.assertEqual(revalidated.status_code, 304)
+                    self.assertEqual(revalidated.headers['Vary'], response.headers['Vary'])
+
+    def test_closest_departures_ndjson(self):
+        """
+        Test that the NDJSON form of closest departures holds the metadata, then the departures of the
+        JSON form one per line, under its own ETag.
+        """
+        with app.test_client() as client:
+            document = client.get(DEPARTURES_URL)
+            streamed = client.get(DEPARTURES_URL, headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(streamed.mimetype, 'application/x-ndjson')
+        self.assertIn('Accept', streamed.headers['Vary'])
+        lines = ndjson_lines(streamed.get_data())
+        self.assertEqual(lines[0], {'metadata': document.get_json()['metadata']})
+        self.assertEqual(lines[1:], document.get_json()['departures'])
+        self.assertGreater(len(lines), 1)
+        self.assertNotEqual(streamed.headers['ETag'], document.headers['ETag'])
+
+    def test_batch_ndjson_is_streamed_compressed(self):
+        """
+        Test that a gzipped NDJSON batch response is sent as a stream with one line per query, in the
+        order of the queries.
+        """
+        with app.test_client() as client:
+            document = client.post(BATCH_URL, json={'queries': QUERIES}).get_json()
+            streamed = client.post(BATCH_URL, json={'queries': QUERIES}, buffered=False,
+                                   headers={'Accept': 'application/x-ndjson', 'Accept-Encoding': 'gzip'})
+            self.assertTrue(streamed.is_streamed)
+            self.assertEqual(streamed.headers['Content-Encoding'], 'gzip')
+            self.assertNotIn('Content-Length', streamed.headers)
+            lines = ndjson_lines(gzip.decompress(b''.join(streamed.response)))
+            streamed.close()
+        self.assertEqual(lines[0], {'metadata': document['metadata']})
+        self.assertEqual(lines[1:], document['results'])
+        self.assertEqual(len(lines[2]['departures']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from public_transport_api import database_utils
+from public_transport_api.database_utils import ConnectionPool, open_feed
+from public_transport_api.main import app
+from tests.public_transport_api.gtfs_fixture import build_feed_database
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = build_feed_database(self.tmp_dir.name)
+        self.pool = ConnectionPool()
+        for patcher in [patch.object(database_utils, 'DB_PATH', self.db_path),
+                        patch.object(database_utils, 'connection_pool', self.pool),
+                        patch.object(database_utils, 'POOL_ENABLED', True)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp_dir.cleanup()
+
+    def test_connection_is_reused_per_thread(self):
+        feed = self.pool.feed()
+        self.assertIs(self.pool.feed(), feed)
+        self.assertEqual(feed.conn.execute('PRAGMA mmap_size').fetchone(),
+                         (database_utils.POOL_PRAGMAS['mmap_size'],))
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.pool.feed()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], feed)
+
+    def test_republished_database_gets_a_new_connection(self):
+        """
+        Test that a database published with a rename is read by the next call, while the feed opened
+        before keeps reading the file it opened.
+        """
+        feed = self.pool.feed()
+        stops = len(feed.all_stops())
+
+        staged = os.path.join(self.tmp_dir.name, 'staged.sqlite')
+        shutil.copyfile(self.db_path, staged)
+        writer = sqlite3.connect(staged)
+        writer.execute('DELETE FROM stops WHERE stop_id = (SELECT MIN(stop_id) FROM stops)')
+        writer.commit()
+        writer.close()
+        os.replace(staged, self.db_path)
+
+        self.assertEqual(len(feed.all_stops()), stops)
+        republished = self.pool.feed()
+        self.assertIsNot(republished, feed)
+        self.assertEqual(len(republished.all_stops()), stops - 1)
+
+    def test_request_shares_one_feed(self):
+        with app.test_request_context():
+            with open_feed() as first, open_feed() as second:
+                self.assertIs(first, second)
+
+    def test_missing_database_raises(self):
+        with patch.object(database_utils, 'DB_PATH', os.path.join(self.tmp_dir.name, 'missing.sqlite')):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.pool.feed()
+
+
+if __name__ == '__main__':
+    unittest.main()
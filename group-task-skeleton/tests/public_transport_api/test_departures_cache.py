@@ -0,0 +1,111 @@
+import random
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest.mock import patch
+
+from public_transport_api import database_utils
+from public_transport_api.departures_cache import DeparturesCache, grid_cell
+from public_transport_api.geo import haversine_m
+from public_transport_api.response_cache import CACHES
+from public_transport_api.services import departures_service
+from public_transport_api.services.departures_service import get_closest_departures
+from public_transport_api.time_utils import format_service_time, format_service_times
+from tests.public_transport_api.gtfs_fixture import END_COORDINATES, START_COORDINATES, START_TIME, \
+    build_feed_database
+
+
+class TestGridCell(unittest.TestCase):
+
+    def test_margin_covers_the_cell(self):
+        rng = random.Random(0)
+        for _ in range(500):
+            point = (rng.uniform(50.9, 51.3), rng.uniform(16.8, 17.2))
+            cell, centre, margin_m = grid_cell(point, 100)
+            self.assertLessEqual(float(haversine_m(*centre, point[0], point[1])), margin_m)
+            self.assertLess(margin_m, 100)
+            nearby = (point[0] + rng.uniform(-1e-7, 1e-7), point[1])
+            if grid_cell(nearby, 100)[0] == cell:
+                self.assertEqual(grid_cell(nearby, 100)[1], centre)
+
+    def test_format_service_time(self):
+        for service_date in ('2025-03-30', '2025-04-02', '2025-10-26'):
+            for seconds in (0, 3599, 7200, 90600):
+                self.assertEqual(format_service_time(service_date, seconds),
+                                 format_service_times([service_date], [seconds])[0])
+
+
+class TestDeparturesCache(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        db_path = build_feed_database(tmp_dir.name)
+        caches = patch.dict(CACHES)
+        caches.start()
+        self.addCleanup(caches.stop)
+        self.cache = DeparturesCache(max_size=100, ttl_secs=300, grid_m=100, bucket_secs=600)
+        for patcher in [patch.object(database_utils, 'DB_PATH', db_path),
+                        patch.object(departures_service, 'departures_cache', self.cache)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def uncached(self, *query):
+        with patch.object(self.cache, 'max_size', 0):
+            return get_closest_departures(*query)
+
+    def test_results_equal_the_uncached_query(self):
+        """
+        Test that cached results equal the uncached ones for end points on both sides of the search
+        radius around stop 4, and start times all over the buckets, so that departures are both trimmed
+        from cached scans and scanned towards the exact destinations.
+        """
+        for end_lat in [END_COORDINATES[0] + 0.0005 * step for step in range(-4, 22)]:
+            for minutes in range(-70, 90, 7):
+                for limit in (1, 3):
+                    query = (START_COORDINATES, (end_lat, END_COORDINATES[1]),
+                             START_TIME + timedelta(minutes=minutes, seconds=13), limit)
+                    with self.subTest(end_lat=end_lat, minutes=minutes, limit=limit):
+                        self.assertEqual(get_closest_departures(*query), self.uncached(*query))
+        stats = self.cache.stats()
+        self.assertGreater(stats['hits'], 0)
+        self.assertGreater(stats['exact_scans'], 0)
+
+    def test_nearby_requests_share_scans(self):
+        query = (START_COORDINATES, END_COORDINATES, START_TIME, 3)
+        expected = get_closest_departures(*query)
+        self.assertEqual(len(expected), 3)
+        misses = self.cache.misses
+
+        nearby = ((START_COORDINATES[0] + 0.0002, START_COORDINATES[1]), END_COORDINATES,
+                  START_TIME + timedelta(seconds=59), 3)
+        self.assertEqual(get_closest_departures(*nearby), self.uncached(*nearby))
+        self.assertEqual(self.cache.misses, misses)
+        self.assertGreater(self.cache.hits, 0)
+
+    def test_scans_are_bounded(self):
+        self.cache.max_size = 2
+        for minutes in range(0, 120, 10):
+            get_closest_departures(START_COORDINATES, END_COORDINATES, START_TIME + timedelta(minutes=minutes), 3)
+        self.assertLessEqual(len(self.cache), 2)
+        self.assertGreater(self.cache.evictions, 0)
+
+    def test_scans_are_kept_per_feed_version(self):
+        """
+        Test that a request served from a republished feed does not drop the scans of the previous
+        version, which requests still reading it during the publish keep hitting.
+        """
+        get_closest_departures(START_COORDINATES, END_COORDINATES, START_TIME, 3)
+        # A new connection reads the version of the republished feed.
+        with patch.object(database_utils, 'POOL_ENABLED', False), \
+                patch.object(database_utils.SqliteFeed, 'version', 'republished'):
+            get_closest_departures(START_COORDINATES, END_COORDINATES, START_TIME, 3)
+        self.assertEqual(len({key[0] for key in self.cache._entries}), 2)
+
+        hits = self.cache.hits
+        get_closest_departures(START_COORDINATES, END_COORDINATES, START_TIME, 3)
+        self.assertGreater(self.cache.hits, hits)
+        self.assertEqual(len({key[0] for key in self.cache._entries}), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from public_transport_api.flat_arrays import FlatRecords, RaggedArray, TextColumn
+
+
+class TestFlatArrays(unittest.TestCase):
+
+    def test_ragged_array(self):
+        ragged = RaggedArray([[1, 2], [], [3]], dtype='int32')
+        self.assertEqual(len(ragged), 3)
+        self.assertEqual([row.tolist() for row in ragged], [[1, 2], [], [3]])
+        self.assertEqual(ragged.at(2, 0), 3)
+        self.assertEqual(ragged.at([0, 0], [1, 0]).tolist(), [2, 1])
+
+    def test_text_column_keeps_none(self):
+        column = TextColumn(['A', None, 'B', 'A'])
+        self.assertEqual(column[[0, 1, 2, 3]].tolist(), ['A', None, 'B', 'A'])
+        self.assertIsNone(column[1])
+        self.assertEqual(len(column.dictionary), 3)
+
+    def test_flat_records_match_itertuples(self):
+        frame = pd.DataFrame({'stop_id': [1, 2, 3], 'stop_code': pd.Series(['100', None, '300'], dtype=object),
+                              'stop_name': pd.Series(['Renoma', 'Dominikański', None], dtype=object),
+                              'stop_lat': [51.1, 51.2, 51.3],
+                              'platform': pd.Series([7, None, 9], dtype=object)})
+        records = FlatRecords(frame, 'Stop')
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records.column('stop_name').dtype.kind, 'U')
+        self.assertEqual(records.column('platform').dtype, np.int64)
+        expected = list(frame.itertuples(index=False))
+        self.assertEqual(records.rows(np.array([2, 0, 1])), [expected[2], expected[0], expected[1]])
+        self.assertEqual(records[1], expected[1])
+        self.assertEqual(records[1].stop_code, None)
+        self.assertIsInstance(records[0].stop_id, int)
+
+
+if __name__ == '__main__':
+    unittest.main()
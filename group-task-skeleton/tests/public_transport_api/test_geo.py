@@ -0,0 +1,57 @@
+import unittest
+
+import numpy as np
+from geopy.distance import geodesic
+
+from public_transport_api.geo import distance_matrix_m, equirectangular_m, haversine_m
+
+
+class TestGeo(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Stops around Wrocław and query points up to ~20 km away
+        self.lats = rng.uniform(51.0, 51.2, 500)
+        self.lons = rng.uniform(16.8, 17.2, 500)
+        self.points = [(51.1079, 17.0385), (51.05, 16.9), (51.2, 17.25)]
+
+    def geodesic_m(self, point):
+        return np.array([geodesic(point, (lat, lon)).meters for lat, lon in zip(self.lats, self.lons)])
+
+    def test_haversine_within_half_percent_of_geodesic(self):
+        for point in self.points:
+            with self.subTest(point=point):
+                expected = self.geodesic_m(point)
+                actual = haversine_m(point[0], point[1], self.lats, self.lons)
+                self.assertEqual(actual.shape, (500,))
+                self.assertLess(np.max(np.abs(actual - expected) / expected), 0.005)
+
+    def test_equirectangular_matches_haversine_at_city_scale(self):
+        point = self.points[0]
+        expected = haversine_m(point[0], point[1], self.lats, self.lons)
+        actual = equirectangular_m(point[0], point[1], self.lats, self.lons)
+        near = expected < 10_000
+        self.assertLess(np.max(np.abs(actual[near] - expected[near]) / expected[near]), 1e-4)
+
+    def test_long_distances(self):
+        # Wrocław - Warsaw and Wrocław - Lisbon
+        for end in [(52.2297, 21.0122), (38.7223, -9.1393)]:
+            with self.subTest(end=end):
+                expected = geodesic(self.points[0], end).meters
+                self.assertAlmostEqual(float(haversine_m(*self.points[0], *end)), expected, delta=expected * 0.005)
+
+    def test_distance_matrix(self):
+        matrix = distance_matrix_m(self.points, self.lats, self.lons)
+        self.assertEqual(matrix.shape, (3, 500))
+        for row, point in zip(matrix, self.points):
+            np.testing.assert_allclose(row, haversine_m(point[0], point[1], self.lats, self.lons))
+        self.assertEqual(distance_matrix_m(self.points[0], self.lats[:2], self.lons[:2],
+                                           distance=equirectangular_m).shape, (1, 2))
+
+    def test_zero_distance(self):
+        self.assertEqual(float(haversine_m(51.1, 17.0, 51.1, 17.0)), 0.0)
+        self.assertEqual(float(equirectangular_m(51.1, 17.0, 51.1, 17.0)), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
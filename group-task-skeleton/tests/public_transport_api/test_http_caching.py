@@ -0,0 +1,88 @@
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from public_transport_api import database_utils
+from public_transport_api.controllers import departures_controller, trips_controller
+from public_transport_api.main import app
+from public_transport_api.response_cache import CACHES, ResponseCache
+from tests.public_transport_api.gtfs_fixture import build_feed_database
+
+DEPARTURES_URL = ('/public_transport/city/wroclaw/closest_departures?start_coordinates=51.101,17.0'
+                  '&end_coordinates=51.119,17.0&start_time=2025-04-02T06:00:00Z')
+
+
+class TestConditionalRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = build_feed_database(self.tmp_dir.name)
+        caches = patch.dict(CACHES)
+        caches.start()
+        self.addCleanup(caches.stop)
+        for patcher in [patch.object(database_utils, 'DB_PATH', self.db_path),
+                        patch.object(trips_controller, 'trip_details_cache', ResponseCache('trip_details', 10, 300))]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_trip_details_not_modified(self):
+        """
+        Test that a trip details response carries validators, and that a request repeating them gets 304
+        without the service being called.
+        """
+        with app.test_client() as client:
+            response = client.get('/public_transport/city/wroclaw/trip/3_3')
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+            self.assertFalse(etag.startswith('W/'))
+            self.assertIn('public', response.headers['Cache-Control'])
+            self.assertIsNotNone(response.last_modified)
+
+            with patch.object(trips_controller, 'get_trip_details') as service:
+                revalidated = client.get('/public_transport/city/wroclaw/trip/3_3', headers={'If-None-Match': etag})
+                self.assertEqual(revalidated.status_code, 304)
+                self.assertEqual(revalidated.headers['ETag'], etag)
+                self.assertEqual(revalidated.get_data(), b'')
+
+                since = client.get('/public_transport/city/wroclaw/trip/3_3',
+                                   headers={'If-Modified-Since': response.headers['Last-Modified']})
+                self.assertEqual(since.status_code, 304)
+                service.assert_not_called()
+
+            # If-None-Match takes precedence over If-Modified-Since.
+            stale = client.get('/public_transport/city/wroclaw/trip/3_3',
+                               headers={'If-None-Match': '"other"',
+                                        'If-Modified-Since': response.headers['Last-Modified']})
+            self.assertEqual(stale.status_code, 200)
+            self.assertNotEqual(client.get('/public_transport/city/wroclaw/trip/3_4').headers.get('ETag'), etag)
+
+            with patch.object(trips_controller, 'feed_version', return_value='republished'):
+                republished = client.get('/public_transport/city/wroclaw/trip/3_3', headers={'If-None-Match': etag})
+            self.assertEqual(republished.status_code, 200)
+            self.assertNotEqual(republished.headers['ETag'], etag)
+
+    def test_closest_departures_not_modified(self):
+        with app.test_client() as client:
+            response = client.get(DEPARTURES_URL)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+            with patch.object(departures_controller, 'get_closest_departures') as service:
+                self.assertEqual(client.get(DEPARTURES_URL, headers={'If-None-Match': etag}).status_code, 304)
+                self.assertEqual(client.get(DEPARTURES_URL, headers={'If-None-Match': '*'}).status_code, 304)
+                service.assert_not_called()
+            self.assertNotEqual(client.get(DEPARTURES_URL + '&limit=2').headers['ETag'], etag)
+
+    def test_last_modified_is_the_import_time(self):
+        with database_utils.open_feed() as feed:
+            imported_at = feed.last_modified
+        self.assertEqual(imported_at.tzinfo, timezone.utc)
+        self.assertLessEqual(imported_at, datetime.now(timezone.utc))
+        self.assertEqual(database_utils.feed_last_modified(), imported_at)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from public_transport_api import database_utils, timetable
+from public_transport_api.controllers.journey_controller import MAX_JOURNEYS
+from public_transport_api.journey_planner import JourneyPlanner, journey_planner
+from public_transport_api.main import app
+from public_transport_api.services.journey_service import plan_journeys
+from tests.public_transport_api.gtfs_fixture import END_COORDINATES, START_COORDINATES, START_TIME, \
+    build_feed_database
+
+# ~200 m east of stop 2 and ~570 m from stop 1
+EAST_COORDINATES = (51.1000, 17.0080)
+FAR_SOUTH_COORDINATES = (51.0800, 17.0000)
+
+
+class TestJourneyPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = build_feed_database(self.tmp_dir.name)
+        for patcher in [patch('public_transport_api.database_utils.DB_PATH', self.db_path),
+                        patch.object(timetable, '_engine', None)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.planner = JourneyPlanner(timetable.load_timetable())
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def trip_ids(self, legs):
+        return [self.planner.engine.trip_ids[leg['trip']] for leg in legs if leg['mode'] == 'transit']
+
+    def test_connections(self):
+        # 2 + 2 + 3 + 1 + 1 connections, and 3_5 once more on the clock of the next day
+        self.assertEqual(len(self.planner), 10)
+        self.assertEqual(self.planner._dep_secs.tolist(), sorted(self.planner._dep_secs.tolist()))
+
+    def test_earliest_arrival(self):
+        """
+        Test that the 08:00:30 departure at stop 1 is missed when walking there from 08:00, so line B from
+        stop 2 arrives first, and that the journey ends with the walk from stop 4.
+        """
+        legs = self.planner.earliest_arrival(START_COORDINATES, END_COORDINATES, '2025-04-02', '2025-04-01', 28800)
+        self.assertEqual([leg['mode'] for leg in legs], ['walk', 'transit', 'walk'])
+        self.assertEqual(self.trip_ids(legs), ['3_4'])
+        self.assertEqual(legs[1]['departure_secs'], 30030)
+        self.assertEqual(legs[1]['arrival_secs'], 30600)
+        self.assertEqual(legs[0]['arrival_secs'], 30030)
+        self.assertEqual(legs[2]['departure_secs'], 30600)
+        for leg, following in zip(legs, legs[1:]):
+            self.assertLessEqual(leg['arrival_secs'], following['departure_secs'])
+
+    def test_transfer(self):
+        """
+        Test that the far south is reached by changing from line B to line A at stop 4.
+        """
+        legs = self.planner.earliest_arrival(EAST_COORDINATES, FAR_SOUTH_COORDINATES, '2025-04-02', '2025-04-01',
+                                             28800)
+        self.assertEqual(self.trip_ids(legs), ['3_4', '3_3'])
+        transit = [leg for leg in legs if leg['mode'] == 'transit']
+        self.assertEqual(transit[0]['to_stop'], transit[1]['from_stop'])
+        self.assertEqual((transit[1]['from_position'], transit[1]['to_position']), (0, 3))
+        self.assertEqual(transit[1]['arrival_secs'], 31800)
+
+    def test_previous_service_day(self):
+        """
+        Test that 3_5 of the previous service day is taken at 01:10.
+        """
+        legs = self.planner.earliest_arrival(EAST_COORDINATES, END_COORDINATES, '2025-04-02', '2025-04-01', 3600)
+        self.assertEqual(self.trip_ids(legs), ['3_5'])
+        self.assertEqual(legs[1]['day'], 1)
+        self.assertEqual(legs[1]['departure_secs'], 4200)
+
+    def test_walk_and_unreachable(self):
+        nearby = (START_COORDINATES[0] + 0.002, START_COORDINATES[1])
+        legs = self.planner.earliest_arrival(START_COORDINATES, nearby, '2025-04-02', '2025-04-01', 28800)
+        self.assertEqual([leg['mode'] for leg in legs], ['walk'])
+        # No service on a Friday
+        self.assertIsNone(self.planner.earliest_arrival(START_COORDINATES, END_COORDINATES, '2025-04-04',
+                                                        '2025-04-03', 28800))
+
+    def test_plan_leaves_later_each_time(self):
+        journeys = self.planner.plan(START_COORDINATES, END_COORDINATES, '2025-04-02', '2025-04-01', 28800, limit=3)
+        self.assertEqual([self.trip_ids(legs) for legs in journeys], [['3_4'], ['3_2']])
+
+    def test_planner_is_cached_per_engine(self):
+        engine = self.planner.engine
+        self.assertIs(journey_planner(engine), journey_planner(engine))
+
+
+class TestJourneyEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = build_feed_database(self.tmp_dir.name)
+        for patcher in [patch('public_transport_api.database_utils.DB_PATH', self.db_path),
+                        patch.object(timetable, '_engine', None)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_plan_journeys_loads_timetable(self):
+        journeys = plan_journeys(START_COORDINATES, END_COORDINATES, START_TIME, limit=1)
+        self.assertIsNotNone(timetable._engine)
+        self.assertEqual(len(journeys), 1)
+        journey = journeys[0]
+        self.assertEqual(journey['transfers'], 0)
+        self.assertEqual(journey['arrival_time'], '2025-04-02T06:31:33Z')
+        ride = journey['legs'][1]
+        self.assertEqual((ride['trip_id'], ride['route_id'], ride['stop_count']), ('3_4', 'B', 1))
+        self.assertEqual(ride['from']['name'], 'Start East')
+        self.assertEqual(ride['departure_time'], '2025-04-02T06:20:30Z')
+        self.assertEqual(journey['legs'][0]['from'], {'coordinates': {'latitude': 51.1, 'longitude': 17.0}})
+        # Leaves just in time to walk the ~350 m to stop 2
+        self.assertEqual(journey['departure_time'], '2025-04-02T06:15:39Z')
+        self.assertEqual(journey['duration'], 954)
+
+    def test_loaded_timetable_is_checked_without_connecting(self):
+        """
+        Test that once the timetable is loaded, a journey request does not connect to SQLite to check
+        that it is still the published version.
+        """
+        with patch.dict(database_utils._published_by_file, clear=True):
+            plan_journeys(START_COORDINATES, END_COORDINATES, START_TIME, limit=1)
+            with patch.object(database_utils, 'connect', side_effect=AssertionError('connected')), \
+                    patch.object(database_utils, 'connect_immutable', side_effect=AssertionError('connected')), \
+                    patch.object(timetable, 'connect', side_effect=AssertionError('connected')), \
+                    patch.object(timetable, 'load_timetable', side_effect=AssertionError('reloaded')):
+                self.assertEqual(len(plan_journeys(START_COORDINATES, END_COORDINATES, START_TIME, limit=1)), 1)
+
+    def test_endpoint(self):
+        with app.test_client() as client:
+            response = client.get('/public_transport/city/wroclaw/journey?start_coordinates=51.1,17.0'
+                                  '&end_coordinates=51.12,17.0&start_time=2025-04-02T06:00:00Z&limit=2')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.get_json()['journeys']), 2)
+
+            response = client.get('/public_transport/city/wroclaw/journey?start_coordinates=51.1,17.0')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json(), {'error': 'Missing required parameters: end_coordinates, start_time'})
+
+            response = client.get('/public_transport/city/gdansk/journey?start_coordinates=51.1,17.0'
+                                  '&end_coordinates=51.12,17.0&start_time=2025-04-02T06:00:00Z')
+            self.assertEqual(response.status_code, 404)
+
+            for limit in [0, -1, MAX_JOURNEYS + 1]:
+                with self.subTest(limit=limit):
+                    response = client.get('/public_transport/city/wroclaw/journey?start_coordinates=51.1,17.0'
+                                          f'&end_coordinates=51.12,17.0&start_time=2025-04-02T06:00:00Z&limit={limit}')
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.get_json(),
+                                     {'error': f'The limit must be between 1 and {MAX_JOURNEYS}.'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from public_transport_api.database_utils import DEPARTURE_TRIP_COLUMNS, departures_json, iter_departures_json
+from public_transport_api.json_stream import dumps, iter_json_array, iter_ndjson, trips_from_rows
+
+
+def stop(name, lat, lon, arrival, departure):
+    return {"name": name, "coordinates": {"latitude": lat, "longitude": lon},
+            "arrival_time": arrival, "departure_time": departure}
+
+
+class TestJsonStream(unittest.TestCase):
+
+    def test_numpy_scalars_are_converted(self):
+        self.assertEqual(dumps({'a': np.int64(3), 'b': np.float32(0.5), 'c': np.arange(2), 'ł': 'ó'}),
+                         '{"a":3,"b":0.5,"c":[0,1],"ł":"ó"}')
+        with self.assertRaises(TypeError):
+            dumps({'a': object()})
+
+    def test_chunks_join_to_the_document(self):
+        items = [{'i': i, 'name': 'Plac Grunwaldzki'} for i in range(100)]
+        chunks = list(iter_json_array(items, chunk_size=256))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(json.loads(b''.join(chunks)), items)
+        self.assertEqual(b''.join(iter_json_array([])), b'[]')
+
+        lines = b''.join(iter_ndjson(items, chunk_size=256)).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], items)
+        self.assertEqual(list(iter_ndjson([])), [])
+
+    def test_trips_from_rows_groups_consecutive_rows(self):
+        rows = [
+            ('3_1', 'A', 'KRZYKI', 'Renoma', 51.104, 17.028, 'T1', 'T2'),
+            ('3_1', 'A', 'KRZYKI', 'Dominikański', 51.1099, 17.0335, 'T3', 'T4'),
+            ('3_2', 'A', 'KRZYKI', 'Renoma', 51.104, 17.028, 'T5', 'T6'),
+        ]
+        trips = list(trips_from_rows(rows))
+        self.assertEqual([trip['trip_details']['trip_id'] for trip in trips], ['3_1', '3_2'])
+        self.assertEqual(trips[0]['trip_details']['stops'][1], stop('Dominikański', 51.1099, 17.0335, 'T3', 'T4'))
+
+
+class TestDeparturesJson(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'trip_id': ['3_2', '3_1', '3_1', None, '3_3'],
+            'route_id': ['A', 'A', 'A', 'A', 'B'],
+            'trip_headsign': ['KRZYKI', 'KRZYKI', 'KRZYKI', 'KRZYKI', 'Klecina'],
+            'stop_name': ['Renoma', 'Plac Grunwaldzki', 'Renoma', 'Nowhere', None],
+            'stop_lat': [51.104, 51.1092, 51.104, 0.0, None],
+            'stop_lon': [17.028, 17.0415, 17.028, 0.0, None],
+            # 3_3 has no stop times (LEFT JOIN), 3_2 runs past midnight of the previous service day
+            'arrival_secs': [90000, 28800, 28920, 0, None],
+            'departure_secs': [90030, 28830, 28950, 0, None],
+            'service_date': ['2025-04-01', '2025-04-02', '2025-04-02', '2025-04-02', '2025-04-02'],
+        }, columns=DEPARTURE_TRIP_COLUMNS)
+        self.expected = [
+            {"trip_details": {"trip_id": "3_1", "route_id": "A", "trip_headsign": "KRZYKI",
+                              "stops": [stop('Plac Grunwaldzki', 51.1092, 17.0415, '2025-04-02T06:00:00Z',
+                                             '2025-04-02T06:00:30Z'),
+                                        stop('Renoma', 51.104, 17.028, '2025-04-02T06:02:00Z',
+                                             '2025-04-02T06:02:30Z')]}},
+            {"trip_details": {"trip_id": "3_2", "route_id": "A", "trip_headsign": "KRZYKI",
+                              "stops": [stop('Renoma', 51.104, 17.028, '2025-04-01T23:00:00Z',
+                                             '2025-04-01T23:00:30Z')]}},
+            {"trip_details": {"trip_id": "3_3", "route_id": "B", "trip_headsign": "Klecina",
+                              "stops": [stop(None, None, None, None, None)]}},
+        ]
+
+    def test_departures_json(self):
+        """
+        Test that trips are ordered by key, keep the order of their rows, that rows without a trip are
+        dropped like DataFrame.groupby did, and that service times are formatted on their service date.
+        """
+        self.assertEqual(json.loads(departures_json(self.df)), self.expected)
+        self.assertNotIn('\n', departures_json(self.df))
+        self.assertEqual(json.loads(departures_json(self.df, indent=4)), self.expected)
+        self.assertIn('\n    ', departures_json(self.df, indent=4))
+
+    def test_iter_departures_json(self):
+        self.assertEqual(json.loads(b''.join(iter_departures_json(self.df))), self.expected)
+        self.assertEqual(b''.join(iter_departures_json(self.df.iloc[:0])), b'[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -107,6 +107,64 @@ class TestMain:
             assert response.status_code == 400
             assert response.get_json() == {'error': 'Missing required parameters: start_coordinates, start_time'}
 
+    def test_closest_departures_batch_invalid_query(self):
+        """
+        Test that a batch is rejected with the index of the first invalid query before any lookup.
+        """
+        queries = [
+            {'start_coordinates': '51.1,17.0', 'end_coordinates': '51.12,17.0', 'start_time': '2025-04-02T06:00:00Z'},
+            {'start_coordinates': '51.1,17.0', 'start_time': '2025-04-02T06:00:00Z'},
+        ]
+        with patch('public_transport_api.controllers.departures_controller.get_closest_departures_batch') as batch:
+            with app.test_client() as client:
+                response = client.post('/public_transport/city/wroclaw/closest_departures/batch', json={'queries': queries})
+                assert response.status_code == 400
+                assert response.get_json() == {'error': 'Query 1: Missing required parameters: end_coordinates'}
+
+                response = client.post('/public_transport/city/wroclaw/closest_departures/batch', json={})
+                assert response.status_code == 400
+                assert response.get_json() == {'error': 'Missing required parameters: queries'}
+            batch.assert_not_called()
+
+    def test_closest_departures_batch(self):
+        """
+        Test that a batch passes the parsed queries to the service and returns the results in order.
+        """
+        queries = [
+            {'start_coordinates': '51.1,17.0', 'end_coordinates': '51.12,17.0', 'start_time': '2025-04-02T06:00:00Z'},
+            {'start_coordinates': '51.2,17.1', 'end_coordinates': '51.1,17.0', 'start_time': '2025-04-02T07:00:00Z',
+             'limit': 2},
+        ]
+        with patch('public_transport_api.controllers.departures_controller.get_closest_departures_batch',
+                   return_value=[[{'trip_id': 'a'}], []]) as batch:
+            with app.test_client() as client:
+                response = client.post('/public_transport/city/wroclaw/closest_departures/batch', json={'queries': queries})
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['metadata']['query_count'] == 2
+        assert [result['departures'] for result in data['results']] == [[{'trip_id': 'a'}], []]
+        assert data['results'][1]['query_parameters']['limit'] == 2
+        parsed = batch.call_args.args[0]
+        assert [(start, end, limit) for start, end, _, limit in parsed] == [((51.1, 17.0), (51.12, 17.0), 5),
+                                                                            ((51.2, 17.1), (51.1, 17.0), 2)]
+
+    def test_unsupported_city_is_not_found(self):
+        """
+        Test that every endpoint answers a request for an unsupported city with the same 404 Not Found.
+        """
+        query = 'start_coordinates=51.1,17.0&end_coordinates=51.12,17.0&start_time=2025-04-02T06:00:00Z'
+        batch = {'queries': [{'start_coordinates': '51.1,17.0', 'end_coordinates': '51.12,17.0',
+                              'start_time': '2025-04-02T06:00:00Z'}]}
+        with app.test_client() as client:
+            responses = [client.get(f'/public_transport/city/krakow/closest_departures?{query}'),
+                         client.post('/public_transport/city/krakow/closest_departures/batch', json=batch),
+                         client.get(f'/public_transport/city/krakow/journey?{query}'),
+                         client.get('/public_transport/city/krakow/trip/3_3')]
+        for response in responses:
+            assert response.status_code == 404
+            assert response.get_json() == {'error': 'City krakow is not supported.'}
+
     def test_trip_details_1(self):
         """
         Test that trip_details function returns correct JSON response for a given city and trip_id.
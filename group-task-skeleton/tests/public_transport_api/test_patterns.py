@@ -0,0 +1,82 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from public_transport_api.patterns import CompactTrips, TripPatterns
+
+
+class TestTripPatterns(unittest.TestCase):
+
+    def setUp(self):
+        # Trips 0 and 1 share variant 10, trip 2 runs the other way, trip 3 is a short working of
+        # variant 10 and trip 4 is a loop without a variant.
+        trip_stops = [[1, 3, 4], [1, 3, 4], [4, 3, 1, 5], [1, 3], [2, 6, 7, 2]]
+        self.trips = pd.DataFrame({
+            'trip_id': ['a', 'b', 'c', 'd', 'e'],
+            'variant_id': [10, 10, 11, 10, None],
+            'shape_id': [10, 10, 11, 10, 99],
+        })
+        self.trip_starts = np.cumsum([0] + [len(stops) for stops in trip_stops])
+        self.patterns = TripPatterns(self.trips, self.trip_starts, np.concatenate(trip_stops))
+
+    def test_trips_are_deduplicated_by_variant_and_stops(self):
+        self.assertEqual(len(self.patterns), 4)
+        self.assertEqual(self.patterns.trip_patterns[0], self.patterns.trip_patterns[1])
+        self.assertEqual(len(set(self.patterns.trip_patterns[[0, 2, 3, 4]])), 4)
+        self.assertEqual(self.patterns.keys, [10, 11, 10, 99])
+        self.assertEqual(self.patterns.stops[self.patterns.trip_patterns[2]].tolist(), [4, 3, 1, 5])
+
+    def test_positions(self):
+        loop = self.patterns.trip_patterns[4]
+        self.assertEqual(self.patterns.positions(loop, 2).tolist(), [0, 3])
+        self.assertEqual(self.patterns.positions(loop, 4).tolist(), [])
+
+    def test_last_positions(self):
+        """
+        Test that a trip boarded at a position reaches a destination stop if the pattern's last
+        position at one of them is greater.
+        """
+        reach = self.patterns.last_positions([4, 5])
+        forward, backward, short, loop = (self.patterns.trip_patterns[t] for t in [0, 2, 3, 4])
+        self.assertEqual(reach[forward], 2)
+        self.assertEqual(reach[backward], 3)
+        self.assertEqual(reach[short], -1)
+        self.assertEqual(reach[loop], -1)
+        # Boarding the loop at its first call at stop 2 reaches stop 2 again, boarding at the last does not.
+        reach = self.patterns.last_positions([2])
+        self.assertTrue(reach[loop] > 0)
+        self.assertFalse(reach[loop] > 3)
+        self.assertEqual(self.patterns.last_positions([]).tolist(), [-1] * 4)
+
+
+class TestCompactTrips(unittest.TestCase):
+
+    def test_trips_share_pattern_timings(self):
+        """
+        Test that trips running a pattern at shifted times share its timing profile, that a trip with
+        other running times gets an override, and that every trip's stop times are rebuilt exactly.
+        """
+        trips = pd.DataFrame({'trip_id': ['a', 'b', 'c'], 'variant_id': [10, 10, 10]})
+        stops = np.array([1, 3, 4] * 3)
+        sequences = np.array([0, 1, 2] * 3)
+        arrivals = np.array([28800, 29100, 29400, 32400, 32700, 33000, 36000, 36400, 36800])
+        departures = arrivals + np.array([30, 30, 0] * 3)
+        trip_starts = np.array([0, 3, 6, 9])
+        compact = CompactTrips(TripPatterns(trips, trip_starts, stops), trip_starts, sequences, arrivals,
+                               departures)
+
+        self.assertEqual(len(compact.timings), 2)
+        self.assertEqual(compact.start_secs.tolist(), [28800, 32400, 36000])
+        self.assertEqual(compact.override_count, 1)
+        for trip in range(3):
+            rows = slice(trip_starts[trip], trip_starts[trip + 1])
+            rebuilt = compact.stop_times(trip)
+            for actual, expected in zip(rebuilt, [stops, sequences, arrivals, departures]):
+                self.assertEqual(actual.tolist(), expected[rows].tolist())
+        self.assertEqual(compact.arrival_secs(2, 1), 36400)
+        self.assertEqual(compact.stop_sequence(2, 1), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import gc
+import json
+import os
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.request
+from unittest.mock import patch
+
+from public_transport_api import database_utils, prefork, timetable
+from tests.public_transport_api.gtfs_fixture import build_feed_database
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'src')
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'pre-fork serving reads /proc')
+class TestPrefork(unittest.TestCase):
+
+    def test_memory_report_of_a_single_process(self):
+        report = prefork.memory_report()
+        memory = report['process'][str(os.getpid())]
+        self.assertGreater(memory['rss_mb'], 0)
+        self.assertIn('private_dirty_mb', memory)
+
+    def test_child_pids(self):
+        pid = os.fork()
+        if pid == 0:
+            time.sleep(5)
+            os._exit(0)
+        try:
+            self.assertIn(pid, prefork.child_pids(os.getpid()))
+        finally:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+
+    def test_preload_leaves_no_background_loader(self):
+        """
+        Test that preloading waits for a background load started by the app and that no loader thread is
+        started afterwards, so that no worker is forked while one holds the loading lock.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch.object(database_utils, 'DB_PATH', build_feed_database(tmp_dir)), \
+                patch.object(timetable, '_engine', None), patch.object(timetable, '_background_loading', True):
+            with database_utils.open_feed() as feed:
+                self.assertIsNone(timetable.current_timetable(feed))
+                try:
+                    prefork.PreforkServer(None, '127.0.0.1', 0, 1).preload()
+                finally:
+                    gc.unfreeze()
+                with patch.object(timetable, '_engine', None):
+                    self.assertIsNone(timetable.current_timetable(feed))
+            self.assertFalse(timetable._loading.locked())
+            self.assertEqual([thread for thread in threading.enumerate() if thread.name == 'timetable-reload'], [])
+
+    def test_workers_are_replaced_when_a_feed_is_published(self):
+        """
+        Test that the workers serve requests, report their memory, and that a new generation of workers
+        serves a newly published database.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = build_feed_database(tmp_dir)
+            with socket.socket() as probe:
+                probe.bind(('127.0.0.1', 0))
+                port = probe.getsockname()[1]
+            env = dict(os.environ, PUBLIC_TRANSPORT_DB=db_path, PUBLIC_TRANSPORT_STATS='1',
+                       PYTHONPATH=os.pathsep.join([SRC_DIR, os.environ.get('PYTHONPATH', '')]))
+            server = subprocess.Popen([sys.executable, '-m', 'public_transport_api.prefork', '--port', str(port),
+                                       '--workers', '2', '--reload-interval', '0.5'],
+                                      env=env, cwd=tmp_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                base_url = f'http://127.0.0.1:{port}/public_transport'
+                trip = self.get_json(f'{base_url}/city/wroclaw/trip/3_3')
+                self.assertEqual(trip['trip_details']['trip_id'], '3_3')
+                workers = set(self.get_json(f'{base_url}/stats/memory')['workers'])
+                self.assertEqual(len(workers), 2)
+
+                staged = os.path.join(tmp_dir, 'staged.sqlite')
+                shutil.copyfile(db_path, staged)
+                with sqlite3.connect(staged) as conn:
+                    conn.execute("UPDATE gtfs_import_metadata SET sha256 = 'republished'")
+                os.replace(staged, db_path)
+
+                deadline = time.monotonic() + 30
+                while time.monotonic() < deadline:
+                    replaced = set(self.get_json(f'{base_url}/stats/memory')['workers'])
+                    if len(replaced) == 2 and not replaced & workers:
+                        break
+                    time.sleep(0.2)
+                self.assertEqual(len(replaced), 2)
+                self.assertFalse(replaced & workers)
+                self.assertEqual(self.get_json(f'{base_url}/city/wroclaw/trip/3_3')['trip_details']['trip_id'], '3_3')
+            finally:
+                server.terminate()
+                self.assertEqual(server.wait(timeout=30), 0)
+
+    @staticmethod
+    def get_json(url):
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                with urllib.request.urlopen(url, timeout=10) as response:
+                    return json.loads(response.read())
+            except (ConnectionError, urllib.error.URLError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from public_transport_api.database_utils import SQL_DIR, connect, validate_queries
+from public_transport_api.query_registry import QueryRegistry
+from tests.public_transport_api.gtfs_fixture import build_feed_database
+
+
+class TestQueryRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = build_feed_database(self.tmp_dir.name)
+        self.conn = connect(self.db_path)
+        self.registry = QueryRegistry(SQL_DIR)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def test_queries_are_loaded_by_name(self):
+        self.assertIn('select_trip_data', self.registry)
+        self.assertIs(self.registry.sql('select_trip_data.sql'), self.registry.sql('select_trip_data'))
+        self.assertEqual(self.registry.parameters['select_stop_departures'],
+                         ['after_secs', 'destination_stop_ids', 'limit', 'previous_date', 'service_date', 'stop_id'])
+        with self.assertRaises(KeyError):
+            self.registry.sql('missing')
+
+    def test_validate_against_schema(self):
+        plans = validate_queries(self.db_path)
+        self.assertEqual(set(plans), {file_name[:-4] for file_name in os.listdir(SQL_DIR)
+                                      if file_name.endswith('.sql')})
+        self.assertTrue(all(plans.values()))
+
+    def test_validate_names_invalid_queries(self):
+        with tempfile.TemporaryDirectory() as sql_dir:
+            for name, sql in [('ok', 'SELECT * FROM stops WHERE stop_id = :stop_id'),
+                              ('missing_table', 'SELECT * FROM nothing'), ('syntax', 'SELEC 1')]:
+                with open(os.path.join(sql_dir, f'{name}.sql'), 'w') as f:
+                    f.write(sql)
+            with self.assertRaises(sqlite3.OperationalError) as raised:
+                QueryRegistry(sql_dir).validate(self.conn)
+        self.assertIn('missing_table', str(raised.exception))
+        self.assertIn('syntax', str(raised.exception))
+        self.assertNotIn('ok:', str(raised.exception))
+
+    def test_fetch(self):
+        params = {'trip_id': '3_1', 'from_date': '2025-04-01'}
+        rows = self.registry.fetch(self.conn, 'select_trip_data', params)
+        self.assertEqual([row[3] for row in rows], ['Start North', 'Middle', 'End'])
+        self.assertIsInstance(rows[0], tuple)
+        dicts = self.registry.fetch_dicts(self.conn, 'select_trip_data', params)
+        self.assertEqual(dicts[0]['stop_name'], 'Start North')
+        self.assertEqual(dicts[0]['service_date'], '2025-04-01')
+        frame = self.registry.fetch_frame(self.conn, 'select_trip_data', params)
+        self.assertEqual(frame.values.tolist(), [list(row) for row in rows])
+        self.assertEqual(list(frame.columns), list(dicts[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from public_transport_api import database_utils
+from public_transport_api.controllers import stats_controller, trips_controller
+from public_transport_api.main import app
+from public_transport_api.response_cache import CACHES, ResponseCache
+from tests.public_transport_api.gtfs_fixture import build_feed_database
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        caches = patch.dict(CACHES)
+        caches.start()
+        self.addCleanup(caches.stop)
+        self.clock = FakeClock()
+        self.cache = ResponseCache('test', max_size=2, ttl_secs=10, clock=self.clock)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.put('a', b'1')
+        self.cache.put('b', b'2')
+        self.assertEqual(self.cache.get('a'), b'1')
+        self.cache.put('c', b'3')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), b'1')
+        self.assertEqual(self.cache.get('c'), b'3')
+        self.assertEqual(self.cache.stats(), {'size': 2, 'max_size': 2, 'ttl_secs': 10, 'hits': 3, 'misses': 1,
+                                              'evictions': 1, 'expirations': 0})
+
+    def test_entries_expire(self):
+        self.cache.put('a', b'1')
+        self.clock.now = 9.9
+        self.assertEqual(self.cache.get('a'), b'1')
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual((self.cache.misses, self.cache.expirations), (1, 1))
+
+    def test_size_zero_disables_cache(self):
+        cache = ResponseCache('disabled', max_size=0, ttl_secs=10)
+        cache.put('a', b'1')
+        self.assertIsNone(cache.get('a'))
+
+
+class TestTripDetailsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = build_feed_database(self.tmp_dir.name)
+        caches = patch.dict(CACHES)
+        caches.start()
+        self.addCleanup(caches.stop)
+        self.cache = ResponseCache('trip_details', max_size=10, ttl_secs=300)
+        for patcher in [patch.object(database_utils, 'DB_PATH', self.db_path),
+                        patch.object(trips_controller, 'trip_details_cache', self.cache)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_hit_skips_the_service(self):
+        """
+        Test that a repeated request is answered from the cache, and that another feed version
+        misses it.
+        """
+        with patch.object(trips_controller, 'get_trip_details', wraps=trips_controller.get_trip_details) as service:
+            with app.test_client() as client:
+                first = client.get('/public_transport/city/wroclaw/trip/3_3')
+                second = client.get('/public_transport/city/wroclaw/trip/3_3')
+                self.assertEqual(service.call_count, 1)
+                self.assertEqual(first.status_code, 200)
+                self.assertEqual(second.get_data(), first.get_data())
+                self.assertEqual(second.mimetype, 'application/json')
+                self.assertEqual(self.cache.stats()['hits'], 1)
+
+                # A missing trip is not cached.
+                self.assertEqual(client.get('/public_transport/city/wroclaw/trip/missing').status_code, 404)
+                self.assertEqual(client.get('/public_transport/city/wroclaw/trip/missing').status_code, 404)
+                self.assertEqual(service.call_count, 3)
+
+                with patch.object(trips_controller, 'feed_version', return_value='republished'):
+                    client.get('/public_transport/city/wroclaw/trip/3_3')
+                self.assertEqual(service.call_count, 4)
+
+                self.assertEqual(client.get('/public_transport/stats/caches').status_code, 404)
+                with patch.object(stats_controller, 'STATS_ENABLED', True):
+                    stats = client.get('/public_transport/stats/caches').get_json()
+                self.assertEqual(stats['trip_details']['hits'], 1)
+
+    def test_feed_version_follows_published_file(self):
+        with database_utils.open_feed() as feed:
+            self.assertEqual(database_utils.feed_version(), feed.version)
+        with patch.object(database_utils.SqliteFeed, 'version', new='unused'):
+            # Unchanged file: no query
+            self.assertNotEqual(database_utils.feed_version(), 'unused')
+
+
+if __name__ == '__main__':
+    unittest.main()
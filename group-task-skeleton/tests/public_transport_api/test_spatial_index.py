@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from geopy.distance import geodesic
+
+from public_transport_api.spatial_index import StopIndex, stop_index
+
+
+def random_stops(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'stop_id': np.arange(count),
+        'stop_name': [f'Stop {i}' for i in range(count)],
+        'stop_lat': rng.uniform(51.0, 51.2, count),
+        'stop_lon': rng.uniform(16.9, 17.2, count),
+    })
+
+
+class TestStopIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.stops = random_stops(2_000)
+        self.index = StopIndex(self.stops)
+        self.points = [(51.1, 17.03), (51.0, 16.9), (51.2, 17.2), (51.15, 17.1)]
+
+    def geodesic_distances(self, point):
+        return np.array([geodesic(point, (lat, lon)).meters
+                         for lat, lon in zip(self.stops['stop_lat'], self.stops['stop_lon'])])
+
+    def test_within_matches_brute_force(self):
+        """
+        Test that a radius query finds the stops within the radius, closest first, with distances
+        close to geopy's.
+        """
+        for point in self.points:
+            with self.subTest(point=point):
+                distances = self.geodesic_distances(point)
+                found = self.index.within(point, 1000)
+                found_ids = [stop.stop_id for _, stop in found]
+                # Haversine and geodesic distances may disagree about stops right at the radius.
+                self.assertTrue(set(np.flatnonzero(distances <= 995)) <= set(found_ids) <=
+                                set(np.flatnonzero(distances <= 1005)))
+                self.assertEqual([d for d, _ in found], sorted(d for d, _ in found))
+                for distance, stop in found:
+                    self.assertAlmostEqual(distance, distances[stop.stop_id], delta=distance * 0.005)
+
+    def test_nearest_matches_brute_force(self):
+        for point in self.points + [(52.0, 18.0)]:
+            with self.subTest(point=point):
+                expected = np.argsort(self.geodesic_distances(point))[:5]
+                self.assertEqual([stop.stop_id for _, stop in self.index.nearest(point, 5)], expected.tolist())
+
+    def test_empty_results(self):
+        self.assertEqual(self.index.within((50.0, 19.0), 1000), [])
+        self.assertEqual(StopIndex(self.stops.iloc[:0]).nearest((51.1, 17.0), 3), [])
+        self.assertEqual(len(self.index.nearest((51.1, 17.0), 5_000)), 2_000)
+
+    def test_stop_index_is_cached_per_feed_version(self):
+        class Feed:
+            def __init__(self, version, stops):
+                self.version, self.stops, self.calls = version, stops, 0
+
+            def all_stops(self):
+                self.calls += 1
+                return self.stops
+
+        first, second = Feed('v1', self.stops), Feed('v1', self.stops)
+        self.assertIs(stop_index(first), stop_index(second))
+        self.assertEqual(first.calls + second.calls, 1)
+        self.assertIsNot(stop_index(Feed('v2', self.stops)), stop_index(first))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+
+from public_transport_api import timetable
+from public_transport_api.database_utils import SqliteFeed, connect
+from public_transport_api.services.departures_service import get_closest_departures
+from public_transport_api.services.trips_service import get_trip_details
+from tests.public_transport_api.gtfs_fixture import END_COORDINATES, START_COORDINATES, START_TIME, \
+    SERVICE_DATE, build_feed_database
+
+
+class TestTimetableEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = build_feed_database(self.tmp_dir.name)
+        for patcher in [patch('public_transport_api.database_utils.DB_PATH', self.db_path),
+                        patch.object(timetable, '_engine', None)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.conn = connect(self.db_path)
+        self.feed = SqliteFeed(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def test_stop_departures_matches_sql(self):
+        engine = timetable.load_timetable()
+        for stop_id in [1, 2, 4, 99]:
+            for service_date, previous_date, after_secs in [('2025-04-02', '2025-04-01', 28800),
+                                                            ('2025-04-03', '2025-04-02', 0),
+                                                            ('2025-04-02', '2025-04-01', 80000),
+                                                            ('2030-01-02', '2030-01-01', 0)]:
+                for limit in [1, 5]:
+                    params = {'stop_id': stop_id, 'service_date': service_date, 'previous_date': previous_date,
+                              'after_secs': after_secs, 'destination_stop_ids': json.dumps([3, 4]), 'limit': limit}
+                    with self.subTest(**params):
+                        self.assertEqual(engine.stop_departures(params).values.tolist(),
+                                         self.feed.stop_departures(params).values.tolist())
+
+    def test_trip_data_matches_sql(self):
+        engine = timetable.load_timetable()
+        self.assertEqual(len(engine.patterns), 3)
+        for trip_id in ['3_1', '3_3', '3_5', 'missing']:
+            for from_date in ['2025-04-01', '2025-04-03', '2030-01-01']:
+                params = {'trip_id': trip_id, 'from_date': from_date}
+                with self.subTest(**params):
+                    self.assertEqual(engine.trip_data(params).values.tolist(),
+                                     self.feed.trip_data(params).values.tolist())
+
+    def test_trip_data_of_unknown_stop_is_null(self):
+        """
+        Test that a stop time at a stop_id missing from stops gets no stop name or coordinates, like the
+        LEFT JOIN of select_trip_data.sql, instead of those of a neighbouring stop.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO stop_times (trip_id, arrival_time, departure_time, stop_id, stop_sequence, "
+                         "arrival_secs, departure_secs) VALUES ('3_3', '09:40:00', '09:40:00', 6, 4, 34800, 34800)")
+        engine = timetable.load_timetable()
+        params = {'trip_id': '3_3', 'from_date': '2025-04-01'}
+        expected, actual = self.feed.trip_data(params), engine.trip_data(params)
+        self.assertTrue(expected[['stop_name', 'stop_lat', 'stop_lon']].iloc[-1].isna().all())
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+    def test_trips_service_uses_loaded_engine(self):
+        expected = get_trip_details('3_3', SERVICE_DATE)
+        timetable.load_timetable()
+        with patch.object(SqliteFeed, 'trip_data', side_effect=AssertionError('SQL used')):
+            self.assertEqual(get_trip_details('3_3', SERVICE_DATE), expected)
+
+    def test_departures_service_uses_loaded_engine(self):
+        self.assertIsNone(timetable.current_timetable(self.feed))
+        engine = timetable.load_timetable()
+        self.assertIs(timetable.current_timetable(self.feed), engine)
+
+        with patch.object(SqliteFeed, 'stop_departures', side_effect=AssertionError('SQL used')):
+            departures = get_closest_departures(START_COORDINATES, END_COORDINATES, START_TIME, limit=3)
+        self.assertEqual([d['trip_id'] for d in departures], ['3_1', '3_2', '3_4'])
+
+    def test_stale_engine_is_not_used(self):
+        """
+        Test that an engine loaded from another feed version falls back to SQL.
+        """
+        engine = timetable.load_timetable()
+        engine.version = 'previous'
+        self.assertIsNone(timetable.current_timetable(self.feed))
+        self.assertEqual(len(get_closest_departures(START_COORDINATES, END_COORDINATES, START_TIME, limit=3)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
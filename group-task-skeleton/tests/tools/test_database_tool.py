@@ -0,0 +1,245 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'tools'))
+
+import database_tool  # noqa: E402
+
+STOPS_TXT = '﻿stop_id,stop_code,stop_name,stop_lat,stop_lon\n' \
+            '1,100,"Renoma",51.1040,17.0280\n' \
+            '2,200,"Dominikański",51.1099,17.0335\n' \
+            '3,,"Plac Grunwaldzki",51.1092,17.0415\n'
+TRIPS_TXT = '﻿route_id,service_id,trip_id,trip_headsign\n' \
+            'A,3,3_1,"KRZYKI"\n' \
+            '100,3,3_2,"Klecina"\n'
+STOP_TIMES_TXT = '﻿trip_id,arrival_time,departure_time,stop_id,stop_sequence\n' \
+                 '3_1,08:00:00,08:00:30,1,0\n' \
+                 '3_1,08:02:00,08:02:30,2,1\n' \
+                 '3_2,25:10:00,25:10:00,3,0\n'
+
+
+class TestStreamingImport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.feed_dir = self.tmp_dir.name
+        self.db_path = os.path.join(self.feed_dir, 'trips.sqlite')
+        for filename, content in [('stops.txt', STOPS_TXT), ('trips.txt', TRIPS_TXT),
+                                  ('stop_times.txt', STOP_TIMES_TXT)]:
+            with open(os.path.join(self.feed_dir, filename), 'w', encoding='utf-8') as f:
+                f.write(content)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def import_stops(self, **kwargs):
+        database_tool.infer_and_import_gtfs(self.feed_dir, self.db_path, **kwargs)
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute('SELECT * FROM stops ORDER BY 1').fetchall()
+
+    def test_streaming_import_matches_pandas_import(self):
+        """
+        Test that the chunked importer stores the same rows and types as the DataFrame importer,
+        including NULL for empty fields, even when the chunk is smaller than the file.
+        """
+        expected = self.import_stops()
+        rows = self.import_stops(streaming=True, chunk_size=2)
+        self.assertEqual(rows, expected)
+        self.assertEqual(rows[2], (3, None, 'Plac Grunwaldzki', 51.1092, 17.0415))
+
+    def test_parallel_import_matches_serial_import(self):
+        """
+        Test that parsing the files in worker processes with a single writer imports the same data.
+        """
+        expected = self.import_stops(streaming=True)
+        with sqlite3.connect(self.db_path) as conn:
+            expected_stop_times = conn.execute('SELECT * FROM stop_times ORDER BY 1, 5').fetchall()
+        os.remove(self.db_path)
+
+        self.assertEqual(self.import_stops(workers=2, chunk_size=1), expected)
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute('SELECT * FROM stop_times ORDER BY 1, 5').fetchall(), expected_stop_times)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM gtfs_import_metadata').fetchone(), (3,))
+
+    def test_failed_parallel_import_is_not_recorded(self):
+        """
+        Test that a file whose worker fails is not recorded in the import metadata, so the next
+        incremental run does not take it for imported.
+        """
+        with open(os.path.join(self.feed_dir, 'stop_times.txt'), 'a', encoding='utf-8') as f:
+            f.write('3_2,25:20,25:20:00,1,1\n')
+        conn = sqlite3.connect(os.path.join(self.feed_dir, 'partial.sqlite'), isolation_level=None)
+        try:
+            cursor = conn.cursor()
+            with self.assertRaises(ValueError):
+                database_tool.parallel_import_gtfs(cursor, self.feed_dir, ['stops.txt', 'stop_times.txt'],
+                                                   workers=2, chunk_size=1)
+            self.assertIsNone(database_tool.imported_sha256(cursor, 'stop_times.txt'))
+            self.assertIsNone(database_tool.imported_sha256(cursor, 'stops.txt'))
+        finally:
+            conn.close()
+
+    def test_schema_is_typed_and_indexed(self):
+        """
+        Test that the BOM is stripped from column names, identifiers keep their declared TEXT type
+        and the trip lookup of select_trip_data.sql is an index search, not a table scan.
+        """
+        self.import_stops(streaming=True)
+        with sqlite3.connect(self.db_path) as conn:
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(trips)')]
+            self.assertEqual(columns[0], 'route_id')
+            self.assertEqual(conn.execute("SELECT typeof(route_id) FROM trips WHERE trip_id = '3_2'").fetchone(),
+                             ('text',))
+            indexes = [row[1] for row in conn.execute('PRAGMA index_list(stop_times)')]
+            self.assertIn('idx_stop_times_stop_id_departure_secs', indexes)
+            self.assertEqual(
+                conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone(), (1,))
+            sql_path = os.path.join(os.path.dirname(__file__), '..', '..', 'sql', 'select_trip_data.sql')
+            with open(sql_path) as f:
+                plan = conn.execute('EXPLAIN QUERY PLAN ' + f.read(),
+                                    {'trip_id': '3_1', 'from_date': '2025-04-02'}).fetchall()
+        details = [row[3] for row in plan]
+        self.assertFalse(any(detail.startswith('SCAN') for detail in details), details)
+        self.assertIn('SEARCH st USING INDEX sqlite_autoindex_stop_times_1 (trip_id=?) LEFT-JOIN', details)
+
+    def test_incremental_reload_applies_row_diffs(self):
+        """
+        Test that an incremental reload skips unchanged files and applies inserts, updates and
+        deletes of a changed file keyed on the primary key, without rebuilding the table.
+        """
+        self.import_stops(streaming=True)
+        with open(os.path.join(self.feed_dir, 'trips.txt'), 'w', encoding='utf-8') as f:
+            f.write('﻿route_id,service_id,trip_id,trip_headsign\n'
+                    'A,3,3_1,"KRZYKI (Zajezdnia)"\n'
+                    '101,4,3_3,"Leśnica"\n')
+        with sqlite3.connect(self.db_path) as conn:
+            stops_imported_at = conn.execute(
+                "SELECT imported_at, row_count FROM gtfs_import_metadata WHERE filename = 'stops.txt'").fetchone()
+
+        self.import_stops(incremental=True)
+
+        with sqlite3.connect(self.db_path) as conn:
+            trips = conn.execute('SELECT trip_id, route_id, trip_headsign FROM trips ORDER BY trip_id').fetchall()
+            self.assertEqual(trips, [('3_1', 'A', 'KRZYKI (Zajezdnia)'), ('3_3', '101', 'Leśnica')])
+            self.assertEqual(conn.execute(
+                "SELECT imported_at, row_count FROM gtfs_import_metadata WHERE filename = 'stops.txt'"
+            ).fetchone(), stops_imported_at)
+            self.assertEqual(conn.execute(
+                "SELECT row_count FROM gtfs_import_metadata WHERE filename = 'trips.txt'").fetchone(), (2,))
+            indexes = [row[1] for row in conn.execute('PRAGMA index_list(trips)')]
+            self.assertIn('idx_trips_route_id', indexes)
+
+    def test_reimport_publishes_new_version_atomically(self):
+        """
+        Test that a re-import replaces the published file while a connection opened before it keeps
+        reading the old version, and that no temporary files are left behind.
+        """
+        self.import_stops(streaming=True)
+        old_reader = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)
+        with open(os.path.join(self.feed_dir, 'stops.txt'), 'a', encoding='utf-8') as f:
+            f.write('4,400,"Galeria Dominikańska",51.1080,17.0390\n')
+
+        self.assertEqual(len(self.import_stops(streaming=True)), 4)
+
+        self.assertEqual(old_reader.execute('SELECT COUNT(*) FROM stops').fetchone(), (3,))
+        old_reader.close()
+        self.assertEqual([name for name in os.listdir(self.feed_dir) if 'sqlite' in name], ['trips.sqlite'])
+
+    def test_invalid_import_is_not_published(self):
+        """
+        Test that a new version failing validation raises and leaves the published database untouched.
+        """
+        expected = self.import_stops(streaming=True)
+        with open(os.path.join(self.feed_dir, 'stop_times.txt'), 'w', encoding='utf-8') as f:
+            f.write('trip_id,arrival_time,departure_time,stop_id,stop_sequence\n')
+        os.remove(os.path.join(self.feed_dir, 'stops.txt'))
+
+        with self.assertRaises(ValueError):
+            database_tool.infer_and_import_gtfs(self.feed_dir, self.db_path, streaming=True)
+
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute('SELECT * FROM stops ORDER BY 1').fetchall(), expected)
+        self.assertEqual([name for name in os.listdir(self.feed_dir) if 'sqlite' in name], ['trips.sqlite'])
+
+    def test_locked_database_is_reported(self):
+        """
+        Test that a published file that cannot be replaced, as on Windows while the API holds it open,
+        raises a PermissionError naming it and leaves no temporary files behind.
+        """
+        expected = self.import_stops(streaming=True)
+        with patch.object(database_tool.os, 'replace', side_effect=PermissionError(13, 'Access is denied')):
+            with self.assertRaisesRegex(PermissionError, 'Cannot replace .*trips.sqlite while it is open'):
+                database_tool.infer_and_import_gtfs(self.feed_dir, self.db_path, streaming=True)
+
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute('SELECT * FROM stops ORDER BY 1').fetchall(), expected)
+        self.assertEqual([name for name in os.listdir(self.feed_dir) if 'sqlite' in name], ['trips.sqlite'])
+
+    def test_feed_without_stop_times_is_published(self):
+        """
+        Test that a feed shipping without stop_times.txt, like the bundled one, is imported and
+        published, but does not replace a published database that has stop times.
+        """
+        stop_times_path = os.path.join(self.feed_dir, 'stop_times.txt')
+        os.rename(stop_times_path, stop_times_path + '.bak')
+        self.assertEqual(len(self.import_stops(streaming=True)), 3)
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM trips').fetchone(), (2,))
+        os.remove(self.db_path)
+
+        os.rename(stop_times_path + '.bak', stop_times_path)
+        expected = self.import_stops(streaming=True)
+        os.remove(stop_times_path)
+        with self.assertRaisesRegex(ValueError, 'stop_times'):
+            database_tool.infer_and_import_gtfs(self.feed_dir, self.db_path, streaming=True)
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute('SELECT * FROM stops ORDER BY 1').fetchall(), expected)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM stop_times').fetchone(), (3,))
+
+    def test_columnar_export_keeps_previous_version(self):
+        """
+        Test that every columnar export is published as a new version while the previous one stays
+        readable, and that older versions are removed.
+        """
+        self.import_stops(streaming=True)
+        columnar_dir = os.path.join(self.feed_dir, 'columnar')
+        versions = []
+        for _ in range(3):
+            database_tool.export_columnar(self.db_path, columnar_dir)
+            with open(os.path.join(columnar_dir, 'CURRENT'), encoding='utf-8') as f:
+                versions.append(f.read())
+
+        self.assertEqual(len(set(versions)), 3)
+        self.assertEqual(sorted(os.listdir(columnar_dir)), sorted(['CURRENT'] + versions[1:]))
+
+    def test_stop_times_have_integer_service_times(self):
+        """
+        Test that stop_times gets integer seconds-after-midnight columns, including times past 24:00.
+        """
+        self.import_stops(streaming=True)
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute('SELECT trip_id, arrival_secs, departure_secs FROM stop_times '
+                                'ORDER BY departure_secs').fetchall()
+        self.assertEqual(rows, [('3_1', 28800, 28830), ('3_1', 28920, 28950), ('3_2', 90600, 90600)])
+
+    def test_expand_service_days(self):
+        """
+        Test that calendar weekday patterns are expanded to dates and calendar_dates exceptions applied.
+        """
+        calendar = [(6, '20250331', '20250406', 1, 1, 1, 1, 0, 0, 0)]
+        calendar_dates = [(6, '20250401', 2), (6, '20250405', 1)]
+        self.assertEqual(sorted(database_tool.expand_service_days(calendar, calendar_dates)),
+                         [(6, '2025-03-31'), (6, '2025-04-02'), (6, '2025-04-03'), (6, '2025-04-05')])
+
+    def test_iter_csv_chunks_bounds_chunk_size(self):
+        chunks = list(database_tool.iter_csv_chunks(os.path.join(self.feed_dir, 'stops.txt'), 2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
@@ -0,0 +1,454 @@
+"""
+Microbenchmarks of the public_transport_api hot paths on a database built by database_tool.py.
+
+    python tools/benchmark.py journey --db-path trips.sqlite --queries 500
+    python tools/benchmark.py batch --db-path trips.sqlite --batch-size 50
+    python tools/benchmark.py departures-json --db-path trips.sqlite --trips 20
+    python tools/benchmark.py connections --db-path trips.sqlite --threads 4
+    python tools/benchmark.py prefork --db-path trips.sqlite --workers 4
+    python tools/benchmark.py responses --db-path trips.sqlite --batch-size 50
+    python tools/benchmark.py departures-cache --db-path trips.sqlite --timetable --queries 20000
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from urllib.request import urlopen
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from public_transport_api import compression, database_utils  # noqa: E402
+from public_transport_api.database_utils import departures_json, iter_departures_json  # noqa: E402
+from public_transport_api.departures_cache import departures_cache  # noqa: E402
+from public_transport_api.journey_planner import JourneyPlanner  # noqa: E402
+from public_transport_api.main import app  # noqa: E402
+from public_transport_api.services.departures_service import get_closest_departures, \
+    get_closest_departures_batch  # noqa: E402
+from public_transport_api.timetable import load_timetable  # noqa: E402
+from public_transport_api.time_utils import FEED_TIMEZONE, format_service_time  # noqa: E402
+
+# Path to the SQLite database
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'trips.sqlite')
+
+
+def report(name, seconds):
+    """
+    Prints the mean, median, 95th percentile and maximum of the timings in milliseconds.
+    """
+    millis = np.asarray(seconds) * 1000
+    print(f"{name}: {len(millis)} runs, mean {millis.mean():.2f} ms, p50 {np.percentile(millis, 50):.2f} ms, "
+          f"p95 {np.percentile(millis, 95):.2f} ms, max {millis.max():.2f} ms")
+
+
+def busiest_date(engine):
+    """
+    Returns the date on which the most services run.
+    """
+    return max(engine._active_services, key=lambda day: int(engine._active_services[day].sum()))
+
+
+def benchmark_journey(args):
+    """
+    Plans journeys between random pairs of stops at random times of the busiest day, the way the
+    journey endpoint does, and reports the time per earliest-arrival query.
+    """
+    engine = load_timetable(args.db_path)
+    started = time.perf_counter()
+    planner = JourneyPlanner(engine)
+    print(f"Planner built in {time.perf_counter() - started:.2f}s: {len(planner)} connections, "
+          f"{planner.nbytes / 1e6:.1f} MB")
+
+    service_date = args.date or busiest_date(engine)
+    previous_date = (date.fromisoformat(service_date) - timedelta(days=1)).isoformat()
+    rng = random.Random(args.seed)
+    coordinates = list(zip(planner.stops.column('stop_lat').tolist(), planner.stops.column('stop_lon').tolist()))
+    timings, transfers, reached = [], [], 0
+    for _ in range(args.queries):
+        start, end = rng.sample(coordinates, 2)
+        after_secs = rng.randrange(6 * 3600, 22 * 3600)
+        started = time.perf_counter()
+        legs = planner.earliest_arrival(start, end, service_date, previous_date, after_secs)
+        timings.append(time.perf_counter() - started)
+        if legs is not None:
+            reached += 1
+            transfers.append(max(0, sum(leg['mode'] == 'transit' for leg in legs) - 1))
+    print(f"Service date {service_date}: {reached}/{args.queries} destinations reached, "
+          f"{np.mean(transfers) if transfers else 0:.2f} transfers on average")
+    report('earliest_arrival', timings)
+
+
+def benchmark_batch(args):
+    """
+    Answers batches of closest_departures queries between a fixed set of points (kiosks and screens)
+    around a few busy stops, once query by query and once as a batch, and reports the time per batch.
+    With --timetable the departures are looked up in the in-memory timetable instead of SQLite.
+    """
+    database_utils.DB_PATH = args.db_path
+    if args.timetable:
+        load_timetable()
+    with database_utils.open_feed() as feed:
+        stops = feed.all_stops()
+    service_date = date.fromisoformat(args.date) if args.date else date.today()
+    rng = random.Random(args.seed)
+    centres = stops.sample(n=min(args.centres, len(stops)), random_state=args.seed)
+    centres = list(zip(centres['stop_lat'].tolist(), centres['stop_lon'].tolist()))
+    points = [(lat + rng.uniform(-0.003, 0.003), lon + rng.uniform(-0.005, 0.005))
+              for lat, lon in (rng.choice(centres) for _ in range(args.points))]
+
+    single, batched = [], []
+    for _ in range(args.runs):
+        start_time = datetime.combine(service_date, datetime.min.time(), FEED_TIMEZONE).replace(
+            hour=rng.randrange(6, 22), minute=rng.randrange(60))
+        queries = [(*rng.sample(points, 2), start_time, 5) for _ in range(args.batch_size)]
+        started = time.perf_counter()
+        expected = [get_closest_departures(*query) for query in queries]
+        single.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        results = get_closest_departures_batch(queries)
+        batched.append(time.perf_counter() - started)
+        assert results == expected
+    report(f'{args.batch_size} single queries', single)
+    report(f'batch of {args.batch_size}', batched)
+
+
+def legacy_departures_json(df):
+    """
+    The groupby/iterrows implementation of database_utils.departures_json, reading the service times of
+    select_trip_data.sql and formatting them row by row, for comparison.
+    """
+    def time_of(row, col):
+        if pd.isna(row[col]) or pd.isna(row['service_date']):
+            return None
+        return format_service_time(row['service_date'], int(row[col]))
+
+    def stops_list(group):
+        return [
+            {
+                "name": None if pd.isna(row['stop_name']) else row['stop_name'],
+                "coordinates": {
+                    "latitude": None if pd.isna(row['stop_lat']) else row['stop_lat'],
+                    "longitude": None if pd.isna(row['stop_lon']) else row['stop_lon']
+                },
+                "arrival_time": time_of(row, 'arrival_secs'),
+                "departure_time": time_of(row, 'departure_secs')
+            }
+            for _, row in group.iterrows()
+        ]
+
+    result = []
+    for (trip_id, route_id, trip_headsign), group in df.groupby(['trip_id', 'route_id', 'trip_headsign']):
+        result.append({
+            "trip_details": {
+                "trip_id": trip_id,
+                "route_id": route_id,
+                "trip_headsign": trip_headsign,
+                "stops": stops_list(group)
+            }
+        })
+    return json.dumps(result, indent=4, ensure_ascii=False)
+
+
+def benchmark_departures_json(args):
+    """
+    Serialises the select_trip_data.sql rows of random trips of the database with the legacy
+    departures_json, the compact and pretty-printed departures_json and the streaming
+    iter_departures_json, and reports the time per call and the time until the first chunk of the stream.
+    """
+    database_utils.DB_PATH = args.db_path
+    with database_utils.open_feed() as feed:
+        trip_ids = feed.conn.execute('SELECT trip_id FROM trips').fetchall()
+        trip_ids = random.Random(args.seed).sample([trip_id for trip_id, in trip_ids], min(args.trips, len(trip_ids)))
+        df = pd.concat([feed.trip_data({'trip_id': trip_id, 'from_date': args.date or ''}) for trip_id in trip_ids],
+                       ignore_index=True)
+    assert json.loads(departures_json(df)) == json.loads(legacy_departures_json(df))
+    assert json.loads(b''.join(iter_departures_json(df))) == json.loads(legacy_departures_json(df))
+
+    def timed(function):
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    print(f"{len(trip_ids)} trips, {len(df)} rows")
+    report('legacy departures_json', timed(lambda: legacy_departures_json(df)))
+    report('departures_json', timed(lambda: departures_json(df)))
+    report('departures_json(indent=4)', timed(lambda: departures_json(df, indent=4)))
+    report('iter_departures_json', timed(lambda: b''.join(iter_departures_json(df))))
+    report('iter_departures_json first chunk', timed(lambda: next(iter(iter_departures_json(df)))))
+
+
+def benchmark_connections(args):
+    """
+    Serves closest_departures requests through the Flask app from several threads, with a pooled
+    connection per thread and with a new connection per request, and reports the latency per request.
+    """
+    database_utils.DB_PATH = args.db_path
+    with database_utils.open_feed() as feed:
+        stops = feed.all_stops()
+    service_date = date.fromisoformat(args.date) if args.date else date.today()
+    rng = random.Random(args.seed)
+    sampled = stops.sample(n=min(2 * args.requests, len(stops)), replace=len(stops) < 2 * args.requests,
+                           random_state=args.seed)
+    points = [f'{lat},{lon}' for lat, lon in zip(sampled['stop_lat'].tolist(), sampled['stop_lon'].tolist())]
+    urls = [f'/public_transport/city/wroclaw/closest_departures?start_coordinates={points[2 * i]}'
+            f'&end_coordinates={points[2 * i + 1]}'
+            f'&start_time={service_date.isoformat()}T{rng.randrange(5, 22):02d}:{rng.randrange(60):02d}:00Z'
+            for i in range(args.requests)]
+
+    for pooled in (False, True):
+        database_utils.POOL_ENABLED = pooled
+        timings = []
+
+        def serve(chunk):
+            with app.test_client() as client:
+                for url in chunk:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append(time.perf_counter() - started)
+                    assert response.status_code == 200, response.get_data(as_text=True)
+            database_utils.connection_pool.close()
+
+        threads = [threading.Thread(target=serve, args=(urls[i::args.threads],)) for i in range(args.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        report(f"{'pooled' if pooled else 'per-request'} connections, {args.threads} threads", timings)
+        print(f"  {len(timings) / elapsed:.0f} requests/s")
+
+
+def benchmark_prefork(args):
+    """
+    Starts prefork.py on the database, sends closest_departures, trip and journey requests that the
+    workers share out, and prints the memory of the master and of every worker.
+    """
+    database_utils.DB_PATH = args.db_path
+    with database_utils.open_feed() as feed:
+        stops = feed.all_stops()
+        trip_ids = [row[0] for row in feed.conn.execute('SELECT trip_id FROM trips LIMIT 1000')]
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+    env = dict(os.environ, PUBLIC_TRANSPORT_DB=os.path.abspath(args.db_path), PUBLIC_TRANSPORT_STATS='1',
+               PYTHONPATH=src_dir)
+    server = subprocess.Popen([sys.executable, '-m', 'public_transport_api.prefork', '--port', str(port),
+                               '--workers', str(args.workers)], env=env, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}/public_transport'
+    try:
+        started = time.monotonic()
+        while True:
+            try:
+                urlopen(f'{base_url}/stats/memory').read()
+                break
+            except OSError:
+                if time.monotonic() - started > 300:
+                    raise
+                time.sleep(0.5)
+        print(f"Workers ready after {time.monotonic() - started:.1f} s")
+
+        service_date = date.fromisoformat(args.date) if args.date else date.today()
+        rng = random.Random(args.seed)
+        points = [f'{lat},{lon}' for lat, lon in zip(stops['stop_lat'].tolist(), stops['stop_lon'].tolist())]
+        timings = []
+        for _ in range(args.requests):
+            start_time = f'{service_date.isoformat()}T{rng.randrange(5, 22):02d}:{rng.randrange(60):02d}:00Z'
+            start, end = rng.sample(points, 2)
+            for url in (f'{base_url}/city/wroclaw/closest_departures?start_coordinates={start}'
+                        f'&end_coordinates={end}&start_time={start_time}',
+                        f'{base_url}/city/wroclaw/trip/{rng.choice(trip_ids)}',
+                        f'{base_url}/city/wroclaw/journey?start_coordinates={start}'
+                        f'&end_coordinates={end}&start_time={start_time}'):
+                request_started = time.perf_counter()
+                urlopen(url).read()
+                timings.append(time.perf_counter() - request_started)
+        report('requests', timings)
+
+        memory = json.loads(urlopen(f'{base_url}/stats/memory').read())
+        for role in ('master', 'workers'):
+            for pid, values in memory[role].items():
+                print(f"{role} {pid}: RSS {values['rss_mb']} MB, PSS {values['pss_mb']} MB, "
+                      f"private {values['private_dirty_mb'] + values['private_clean_mb']:.1f} MB")
+        private = [values['private_dirty_mb'] + values['private_clean_mb'] for values in memory['workers'].values()]
+        print(f"Mean private memory per worker: {np.mean(private):.1f} MB")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def benchmark_responses(args):
+    """
+    Requests trip details and closest_departures batches through the Flask app with every content coding,
+    and batches as JSON and as NDJSON, and reports the bytes sent and the time to the first byte.
+    """
+    database_utils.DB_PATH = args.db_path
+    load_timetable()
+    with database_utils.open_feed() as feed:
+        stops = feed.all_stops()
+        trip_ids = [row[0] for row in feed.conn.execute('SELECT trip_id FROM trips LIMIT 1000')]
+    service_date = date.fromisoformat(args.date) if args.date else date.today()
+    rng = random.Random(args.seed)
+    points = [f'{lat},{lon}' for lat, lon in zip(stops['stop_lat'].tolist(), stops['stop_lon'].tolist())]
+
+    def timed(client, method, url, headers, **kwargs):
+        """
+        Returns the seconds to the first byte, the seconds to the last byte and the bytes of a response.
+        """
+        started = time.perf_counter()
+        response = client.open(url, method=method, headers=headers, buffered=False, **kwargs)
+        chunks = iter(response.response)
+        size = len(next(chunks, b''))
+        first_byte = time.perf_counter() - started
+        size += sum(len(chunk) for chunk in chunks)
+        response.close()
+        return first_byte, time.perf_counter() - started, size
+
+    with app.test_client() as client:
+        for encoding in ['identity', *reversed(compression.supported_encodings())]:
+            sizes, timings = [], []
+            for trip_id in rng.sample(trip_ids, min(args.trips, len(trip_ids))):
+                _, elapsed, size = timed(client, 'GET', f'/public_transport/city/wroclaw/trip/{trip_id}',
+                                         {'Accept-Encoding': encoding})
+                sizes.append(size)
+                timings.append(elapsed)
+            report(f'trip details, {encoding}', timings)
+            print(f"  {np.mean(sizes) / 1024:.1f} KB per response")
+
+        batches = []
+        for _ in range(args.runs):
+            start_time = f'{service_date.isoformat()}T{rng.randrange(5, 22):02d}:{rng.randrange(60):02d}:00Z'
+            batches.append([{'start_coordinates': start, 'end_coordinates': end, 'start_time': start_time}
+                            for start, end in (rng.sample(points, 2) for _ in range(args.batch_size))])
+        for accept in ('application/json', 'application/x-ndjson'):
+            for encoding in ('identity', 'gzip'):
+                first_bytes, timings, sizes = [], [], []
+                for queries in batches:
+                    first_byte, elapsed, size = timed(
+                        client, 'POST', '/public_transport/city/wroclaw/closest_departures/batch',
+                        {'Accept': accept, 'Accept-Encoding': encoding}, json={'queries': queries})
+                    first_bytes.append(first_byte)
+                    timings.append(elapsed)
+                    sizes.append(size)
+                report(f'batch of {args.batch_size}, {accept}, {encoding}, first byte', first_bytes)
+                report(f'batch of {args.batch_size}, {accept}, {encoding}, last byte', timings)
+                print(f"  {np.mean(sizes) / 1024:.1f} KB per response")
+
+
+def benchmark_departures_cache(args):
+    """
+    Answers closest_departures queries from points around a few busy stops towards a fixed set of
+    destinations (kiosks and screens), within one hour of the day, without and with the quantised
+    departures cache, checks that the results are equal and reports the time per query and the cache stats.
+    """
+    database_utils.DB_PATH = args.db_path
+    if args.timetable:
+        load_timetable()
+    with database_utils.open_feed() as feed:
+        stops = feed.all_stops()
+    service_date = date.fromisoformat(args.date) if args.date else date.today()
+    rng = random.Random(args.seed)
+    centres = stops.sample(n=min(args.centres, len(stops)), random_state=args.seed)
+    centres = list(zip(centres['stop_lat'].tolist(), centres['stop_lon'].tolist()))
+    destinations = [(lat + rng.uniform(-0.003, 0.003), lon + rng.uniform(-0.005, 0.005))
+                    for lat, lon in (rng.choice(centres) for _ in range(args.points))]
+    start = datetime.combine(service_date, datetime.min.time(), FEED_TIMEZONE).replace(hour=args.hour)
+    queries = [((lat + rng.uniform(-0.004, 0.004), lon + rng.uniform(-0.006, 0.006)), rng.choice(destinations),
+                start + timedelta(seconds=rng.randrange(3600)), 5)
+               for lat, lon in (rng.choice(centres) for _ in range(args.queries))]
+
+    results = {}
+    for enabled in (False, True):
+        departures_cache.max_size = args.cache_size if enabled else 0
+        departures_cache.clear()
+        timings = []
+        results[enabled] = []
+        for query in queries:
+            started = time.perf_counter()
+            results[enabled].append(get_closest_departures(*query))
+            timings.append(time.perf_counter() - started)
+        report('cached' if enabled else 'uncached', timings)
+    assert results[True] == results[False]
+    stats = departures_cache.stats()
+    print(f"Scans: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, "
+          f"{stats['exact_scans']} towards exact destinations")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark the public transport API on a GTFS database.')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    journey = subparsers.add_parser('journey', help='Earliest-arrival journey planning (Connection Scan).')
+    journey.add_argument('--db-path', default=DB_PATH, help='SQLite database built by database_tool.py.')
+    journey.add_argument('--queries', type=int, default=500, help='Number of random queries.')
+    journey.add_argument('--date', help='Service date (YYYY-MM-DD); the busiest date by default.')
+    journey.add_argument('--seed', type=int, default=0, help='Seed of the random queries.')
+    journey.set_defaults(run=benchmark_journey)
+    batch = subparsers.add_parser('batch', help='closest_departures queries one by one and as a batch.')
+    batch.add_argument('--db-path', default=DB_PATH, help='SQLite database built by database_tool.py.')
+    batch.add_argument('--batch-size', type=int, default=50, help='Number of queries per batch.')
+    batch.add_argument('--centres', type=int, default=5, help='Number of stops the query points are drawn around.')
+    batch.add_argument('--points', type=int, default=20, help='Number of points the queries start and end at.')
+    batch.add_argument('--timetable', action='store_true', help='Look departures up in the in-memory timetable.')
+    batch.add_argument('--runs', type=int, default=10, help='Number of batches.')
+    batch.add_argument('--date', help='Service date (YYYY-MM-DD); today by default.')
+    batch.add_argument('--seed', type=int, default=0, help='Seed of the random queries.')
+    batch.set_defaults(run=benchmark_batch)
+    serialise = subparsers.add_parser('departures-json', help='departures_json serialisation of trips.')
+    serialise.add_argument('--db-path', default=DB_PATH, help='SQLite database built by database_tool.py.')
+    serialise.add_argument('--trips', type=int, default=20, help='Number of random trips.')
+    serialise.add_argument('--runs', type=int, default=50, help='Number of runs.')
+    serialise.add_argument('--date', help='Stop times are given for the first service date from this one (YYYY-MM-DD).')
+    serialise.add_argument('--seed', type=int, default=0, help='Seed of the random trips.')
+    serialise.set_defaults(run=benchmark_departures_json)
+    connections = subparsers.add_parser('connections', help='Pooled against per-request SQLite connections.')
+    connections.add_argument('--db-path', default=DB_PATH, help='SQLite database built by database_tool.py.')
+    connections.add_argument('--requests', type=int, default=400, help='Number of closest_departures requests.')
+    connections.add_argument('--threads', type=int, default=4, help='Number of threads serving requests.')
+    connections.add_argument('--date', help='Service date (YYYY-MM-DD); today by default.')
+    connections.add_argument('--seed', type=int, default=0, help='Seed of the random queries.')
+    connections.set_defaults(run=benchmark_connections)
+    forked = subparsers.add_parser('prefork', help='Memory of pre-forked workers sharing one timetable.')
+    forked.add_argument('--db-path', default=DB_PATH, help='SQLite database built by database_tool.py.')
+    forked.add_argument('--workers', type=int, default=4, help='Number of worker processes.')
+    forked.add_argument('--requests', type=int, default=200, help='Number of request triples.')
+    forked.add_argument('--date', help='Service date (YYYY-MM-DD); today by default.')
+    forked.add_argument('--seed', type=int, default=0, help='Seed of the random queries.')
+    forked.set_defaults(run=benchmark_prefork)
+    responses = subparsers.add_parser('responses', help='Compressed and streamed responses.')
+    responses.add_argument('--db-path', default=DB_PATH, help='SQLite database built by database_tool.py.')
+    responses.add_argument('--trips', type=int, default=200, help='Number of trip details requests.')
+    responses.add_argument('--batch-size', type=int, default=50, help='Number of queries per batch.')
+    responses.add_argument('--runs', type=int, default=10, help='Number of batches.')
+    responses.add_argument('--date', help='Service date (YYYY-MM-DD); today by default.')
+    responses.add_argument('--seed', type=int, default=0, help='Seed of the random queries.')
+    responses.set_defaults(run=benchmark_responses)
+    cached = subparsers.add_parser('departures-cache', help='closest_departures with and without the quantised cache.')
+    cached.add_argument('--db-path', default=DB_PATH, help='SQLite database built by database_tool.py.')
+    cached.add_argument('--queries', type=int, default=5000, help='Number of queries.')
+    cached.add_argument('--centres', type=int, default=8, help='Number of stops the queries start around.')
+    cached.add_argument('--points', type=int, default=24, help='Number of destinations.')
+    cached.add_argument('--hour', type=int, default=7, help='Hour of the day the queries start in.')
+    cached.add_argument('--cache-size', type=int, default=departures_cache.max_size or 4096,
+                        help='Maximum number of cached stop scans.')
+    cached.add_argument('--timetable', action='store_true', help='Look departures up in the in-memory timetable.')
+    cached.add_argument('--date', help='Service date (YYYY-MM-DD); today by default.')
+    cached.add_argument('--seed', type=int, default=0, help='Seed of the random queries.')
+    cached.set_defaults(run=benchmark_departures_cache)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    args.run(args)
@@ -1,5 +1,20 @@
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
 import os
+import shutil
 import sqlite3
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, contextmanager
+from itertools import islice
+from queue import Empty
+from typing import Iterator, Optional
+
+import numpy as np
 import pandas as pd
 
 # Path to the GTFS files folder
@@ -7,6 +22,154 @@ GTFS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'OtwartyWroc
 # Path to the target SQLite database
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'trips.sqlite')
 
+# Number of CSV rows read and inserted at once by the streaming importer
+CHUNK_SIZE = 50_000
+# Parsed chunks buffered per parse worker in parallel mode; bounds the memory held in the queue
+QUEUE_CHUNKS_PER_WORKER = 2
+# Number of leading rows used to infer column types in streaming mode
+SAMPLE_ROWS = 1_000
+# Pragmas applied for the duration of a bulk load. Durability is traded for speed:
+# an interrupted import leaves a database that has to be rebuilt from scratch.
+BULK_LOAD_PRAGMAS = {
+    'journal_mode': 'OFF',
+    'synchronous': 'OFF',
+    'cache_size': -256_000,  # negative values are KiB, i.e. ~250 MB
+    'temp_store': 'MEMORY',
+}
+# Declared schema of the imported GTFS tables: primary key and the column types that must not be
+# left to inference (identifiers such as route_id look numeric for most rows but are text).
+# Columns that are not listed get the type inferred from the data.
+GTFS_SCHEMA = {
+    'agency': {
+        'primary_key': ['agency_id'],
+        'types': {'agency_id': 'INTEGER', 'agency_phone': 'TEXT'},
+    },
+    'calendar': {
+        'primary_key': ['service_id'],
+        'types': {'service_id': 'INTEGER', 'start_date': 'TEXT', 'end_date': 'TEXT'},
+    },
+    'calendar_dates': {
+        'primary_key': ['service_id', 'date'],
+        'types': {'service_id': 'INTEGER', 'date': 'TEXT', 'exception_type': 'INTEGER'},
+    },
+    'contracts_ext': {
+        'primary_key': ['contract_id'],
+        'types': {'contract_id': 'TEXT', 'contract_conclusion_date': 'TEXT', 'contract_start_date': 'TEXT',
+                  'contract_end_date': 'TEXT', 'contract_number': 'TEXT', 'contract_op_id': 'TEXT'},
+    },
+    # control_stops.txt repeats some (variant_id, stop_id) pairs, so it has no primary key.
+    'control_stops': {
+        'types': {'variant_id': 'INTEGER', 'stop_id': 'INTEGER'},
+    },
+    'feed_info': {
+        'types': {'feed_start_date': 'TEXT', 'feed_end_date': 'TEXT'},
+    },
+    'routes': {
+        'primary_key': ['route_id'],
+        'types': {'route_id': 'TEXT', 'agency_id': 'INTEGER', 'route_short_name': 'TEXT', 'route_long_name': 'TEXT',
+                  'route_desc': 'TEXT', 'route_type': 'INTEGER', 'route_type2_id': 'INTEGER',
+                  'valid_from': 'TEXT', 'valid_until': 'TEXT'},
+    },
+    'route_types': {
+        'primary_key': ['route_type2_id'],
+        'types': {'route_type2_id': 'INTEGER', 'route_type2_name': 'TEXT'},
+    },
+    'stops': {
+        'primary_key': ['stop_id'],
+        'types': {'stop_id': 'INTEGER', 'stop_code': 'TEXT', 'stop_name': 'TEXT',
+                  'stop_lat': 'REAL', 'stop_lon': 'REAL'},
+    },
+    'trips': {
+        'primary_key': ['trip_id'],
+        'types': {'trip_id': 'TEXT', 'route_id': 'TEXT', 'service_id': 'INTEGER', 'trip_headsign': 'TEXT',
+                  'direction_id': 'INTEGER', 'shape_id': 'INTEGER', 'variant_id': 'INTEGER'},
+    },
+    'stop_times': {
+        'primary_key': ['trip_id', 'stop_sequence'],
+        'types': {'trip_id': 'TEXT', 'arrival_time': 'TEXT', 'departure_time': 'TEXT',
+                  'stop_id': 'INTEGER', 'stop_sequence': 'INTEGER'},
+    },
+    'variants': {
+        'primary_key': ['variant_id'],
+        'types': {'variant_id': 'INTEGER', 'is_main': 'INTEGER', 'equiv_main_variant_id': 'INTEGER',
+                  'join_stop_id': 'INTEGER', 'disjoin_stop_id': 'INTEGER'},
+    },
+    'vehicle_types': {
+        'primary_key': ['vehicle_type_id'],
+        'types': {'vehicle_type_id': 'INTEGER', 'vehicle_type_symbol': 'TEXT'},
+    },
+}
+# INTEGER columns computed at import time and appended to the table: name -> source GTFS time column,
+# converted with gtfs_time_to_seconds. Services filter and sort on these instead of parsing time strings.
+DERIVED_COLUMNS = {
+    'stop_times': {
+        'arrival_secs': 'arrival_time',
+        'departure_secs': 'departure_time',
+    },
+}
+# Bookkeeping table with the content hash and row count of every imported source file
+METADATA_TABLE = 'gtfs_import_metadata'
+# Secondary indexes used by the service queries, created once the table is loaded.
+# Lookups by primary key (trips.trip_id, stop_times(trip_id, stop_sequence)) use the key's own index.
+GTFS_INDEXES = {
+    'stop_times': [('stop_id', 'departure_secs')],
+    'trips': [('route_id',), ('service_id',)],
+    'control_stops': [('variant_id',)],
+}
+# Table with one (service_id, date) row for every day on which a service runs, built from
+# calendar and calendar_dates after the import so requests never evaluate calendar rules.
+SERVICE_DAYS_TABLE = 'service_days'
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+# Version of the columnar snapshot layout, checked by public_transport_api.columnar_store
+COLUMNAR_FORMAT_VERSION = 1
+# Pointer file naming the published version folder of a columnar snapshot
+COLUMNAR_CURRENT_FILE = 'CURRENT'
+# Tables a new database must contain, with at least one row, before it is published: when the feed
+# holds their source file, or when the published database has rows in them
+REQUIRED_TABLES = ['stops', 'trips', 'stop_times']
+# Tables of the columnar snapshot: the query reading them and the columns the rows are sorted by.
+# Text columns are dictionary-encoded; 'shared_dictionaries' reuses the dictionary of another column,
+# so stop_times.trip_id codes are the positions of the trips.
+COLUMNAR_TABLES = {
+    'stops': {
+        'query': 'SELECT stop_id, stop_code, stop_name, stop_lat, stop_lon FROM stops',
+        'sort_by': ['stop_id'],
+    },
+    'trips': {
+        'query': 'SELECT trip_id, route_id, trip_headsign, service_id FROM trips',
+        'sort_by': ['trip_id'],
+    },
+    'stop_times': {
+        'query': 'SELECT trip_id, stop_sequence, stop_id, arrival_secs, departure_secs FROM stop_times',
+        'sort_by': ['trip_id', 'stop_sequence'],
+        'shared_dictionaries': {'trip_id': ('trips', 'trip_id')},
+    },
+    'service_days': {
+        'query': f'SELECT service_id, date FROM {SERVICE_DAYS_TABLE}',
+        'sort_by': ['service_id', 'date'],
+    },
+}
+
+def gtfs_time_to_seconds(value: Optional[str]) -> Optional[int]:
+    """
+    Converts a GTFS time such as "25:10:00" to seconds after the start of the service day.
+    Hours past 24 are kept, so trips running after midnight still sort after the evening ones.
+    """
+    if value is None or value != value:  # None or NaN
+        return None
+    hours, minutes, seconds = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+def read_gtfs_csv(file_path: str, **kwargs) -> pd.DataFrame:
+    """
+    Reads a GTFS file with pd.read_csv, dropping the UTF-8 BOM from the header and
+    keeping the columns declared as TEXT in GTFS_SCHEMA as strings.
+    """
+    table_name = os.path.splitext(os.path.basename(file_path))[0]
+    types = GTFS_SCHEMA.get(table_name, {}).get('types', {})
+    text_columns = {col: str for col, ctype in types.items() if ctype == 'TEXT'}
+    return pd.read_csv(file_path, encoding='utf-8-sig', dtype=text_columns, **kwargs)
+
 def infer_column_types(df: pd.DataFrame) -> list[tuple[str, str]]:
     """
     Infers SQLite column types for each column in the DataFrame.
@@ -25,39 +188,628 @@ def infer_column_types(df: pd.DataFrame) -> list[tuple[str, str]]:
             col_types.append((col, 'TEXT'))
     return col_types
 
+def table_column_types(table_name: str, df: pd.DataFrame) -> list[tuple[str, str]]:
+    """
+    Returns the column types of a table: the types declared in GTFS_SCHEMA, inferred from df otherwise,
+    followed by the DERIVED_COLUMNS of the table.
+    """
+    declared = GTFS_SCHEMA.get(table_name, {}).get('types', {})
+    col_types = [(col, declared.get(col, ctype)) for col, ctype in infer_column_types(df)]
+    return col_types + [(col, 'INTEGER') for col in DERIVED_COLUMNS.get(table_name, {})]
+
+def add_derived_columns(table_name: str, header: list[str], chunk: list[tuple]) -> list[tuple]:
+    """
+    Appends the values of the table's DERIVED_COLUMNS to every row of a chunk read from the CSV file.
+    """
+    derived = DERIVED_COLUMNS.get(table_name)
+    if not derived:
+        return chunk
+    sources = [header.index(source) for source in derived.values()]
+    return [row + tuple(gtfs_time_to_seconds(row[index]) for index in sources) for row in chunk]
+
 def create_table(cursor: sqlite3.Cursor, table_name: str, col_types: list[tuple[str, str]]) -> None:
     """
-    Drops the table if it exists and creates a new one with inferred column types.
+    Drops the table if it exists and creates a new one with the given column types
+    and the primary key declared in GTFS_SCHEMA.
     """
     cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
     columns_sql = ', '.join([f'"{col}" {ctype}' for col, ctype in col_types])
+    primary_key = GTFS_SCHEMA.get(table_name, {}).get('primary_key')
+    if primary_key:
+        columns_sql += ', PRIMARY KEY (' + ', '.join(f'"{col}"' for col in primary_key) + ')'
     cursor.execute(f'CREATE TABLE "{table_name}" ({columns_sql})')
 
+def create_indexes(cursor: sqlite3.Cursor, table_name: str) -> None:
+    """
+    Creates the secondary indexes declared in GTFS_INDEXES for a loaded table.
+    """
+    for columns in GTFS_INDEXES.get(table_name, []):
+        index_name = f'idx_{table_name}_' + '_'.join(columns)
+        columns_sql = ', '.join(f'"{col}"' for col in columns)
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({columns_sql})')
+
+def table_exists(cursor: sqlite3.Cursor, table_name: str) -> bool:
+    """
+    Returns True if the table exists in the main database.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+    return cursor.fetchone() is not None
+
+def file_sha256(file_path: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a file, read in 1 MiB blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def ensure_metadata_table(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the METADATA_TABLE if it does not exist yet.
+    """
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS "{METADATA_TABLE}" (
+            filename TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            imported_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def record_import(cursor: sqlite3.Cursor, file_path: str, table_name: str, row_count: int,
+                  sha256: Optional[str] = None) -> None:
+    """
+    Stores the content hash and row count of an imported file in METADATA_TABLE.
+    """
+    ensure_metadata_table(cursor)
+    cursor.execute(
+        f'INSERT OR REPLACE INTO "{METADATA_TABLE}" (filename, table_name, sha256, row_count) VALUES (?, ?, ?, ?)',
+        (os.path.basename(file_path), table_name, sha256 or file_sha256(file_path), row_count))
+
+def imported_sha256(cursor: sqlite3.Cursor, filename: str) -> Optional[str]:
+    """
+    Returns the hash recorded for a file by the last import, or None if it was never imported.
+    """
+    if not table_exists(cursor, METADATA_TABLE):
+        return None
+    cursor.execute(f'SELECT sha256 FROM "{METADATA_TABLE}" WHERE filename = ?', (filename,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def expand_service_days(calendar: list[tuple], calendar_dates: list[tuple]) -> set[tuple[int, str]]:
+    """
+    Expands calendar rows (service_id, start_date, end_date, monday, ..., sunday) and calendar_dates
+    rows (service_id, date, exception_type) into the set of (service_id, ISO date) pairs on which
+    each service runs. Exception type 1 adds a date, exception type 2 removes it.
+    """
+    service_days = set()
+    for service_id, start_date, end_date, *weekdays in calendar:
+        day = datetime.strptime(str(start_date), '%Y%m%d').date()
+        last_day = datetime.strptime(str(end_date), '%Y%m%d').date()
+        while day <= last_day:
+            if weekdays[day.weekday()]:
+                service_days.add((service_id, day.isoformat()))
+            day += timedelta(days=1)
+    for service_id, date, exception_type in calendar_dates:
+        service_day = (service_id, datetime.strptime(str(date), '%Y%m%d').date().isoformat())
+        if exception_type == 1:
+            service_days.add(service_day)
+        elif exception_type == 2:
+            service_days.discard(service_day)
+    return service_days
+
+def build_service_days(cursor: sqlite3.Cursor) -> None:
+    """
+    (Re)creates SERVICE_DAYS_TABLE from the imported calendar and calendar_dates tables.
+    """
+    calendar, calendar_dates = [], []
+    if table_exists(cursor, 'calendar'):
+        weekdays_sql = ', '.join(WEEKDAYS)
+        calendar = cursor.execute(f'SELECT service_id, start_date, end_date, {weekdays_sql} FROM calendar').fetchall()
+    if table_exists(cursor, 'calendar_dates'):
+        calendar_dates = cursor.execute('SELECT service_id, date, exception_type FROM calendar_dates').fetchall()
+    service_days = expand_service_days(calendar, calendar_dates)
+    cursor.execute(f'DROP TABLE IF EXISTS "{SERVICE_DAYS_TABLE}"')
+    cursor.execute(f'''
+        CREATE TABLE "{SERVICE_DAYS_TABLE}" (
+            service_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            PRIMARY KEY (service_id, date)
+        ) WITHOUT ROWID
+    ''')
+    cursor.executemany(f'INSERT INTO "{SERVICE_DAYS_TABLE}" VALUES (?, ?)', sorted(service_days))
+    print(f'Built table {SERVICE_DAYS_TABLE}: {len(service_days)} service days')
+
+def gtfs_files(gtfs_dir: str) -> list[str]:
+    """
+    Returns the names of all GTFS files (*.txt) in the folder.
+    """
+    return sorted(name for name in os.listdir(gtfs_dir) if name.endswith('.txt'))
+
+def print_import_stats(filename: str, table_name: str, rows: int, elapsed: float) -> None:
+    """
+    Prints the number of imported rows and the import throughput for a single file.
+    """
+    rate = rows / elapsed if elapsed > 0 else float(rows)
+    print(f'Imported {filename} into table {table_name}: {rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)')
+
 def import_gtfs_file(cursor: sqlite3.Cursor, conn: sqlite3.Connection, gtfs_dir: str, filename: str) -> None:
     """
-    Imports a single GTFS file into the SQLite database.
+    Imports a single GTFS file into the SQLite database and records it in METADATA_TABLE.
     """
     file_path = os.path.join(gtfs_dir, filename)
     if not os.path.exists(file_path):
         print(f'File {filename} not found, skipping.')
         return
+    started = time.perf_counter()
     table_name = os.path.splitext(filename)[0]
-    df = pd.read_csv(file_path)
-    col_types = infer_column_types(df)
+    df = read_gtfs_csv(file_path)
+    col_types = table_column_types(table_name, df)
+    for col, source in DERIVED_COLUMNS.get(table_name, {}).items():
+        df[col] = df[source].map(gtfs_time_to_seconds).astype('Int64')
     create_table(cursor, table_name, col_types)
     df.to_sql(table_name, conn, if_exists='append', index=False)
-    print(f'Imported {filename} into table {table_name}')
+    create_indexes(cursor, table_name)
+    record_import(cursor, file_path, table_name, len(df))
+    print_import_stats(filename, table_name, len(df), time.perf_counter() - started)
 
-def infer_and_import_gtfs(gtfs_dir: str = GTFS_DIR, db_path: str = DB_PATH) -> None:
+def iter_csv_chunks(file_path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[list[tuple[Optional[str], ...]]]:
     """
-    Imports selected GTFS files into a SQLite database with inferred column types.
+    Yields the data rows of a CSV file in lists of at most chunk_size tuples.
+    Empty fields are returned as None so they are stored as NULL, like pandas' NaN.
+    The header row is skipped.
     """
-    selected_files = ['stops.txt', 'stop_times.txt', 'trips.txt']
+    with open(file_path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        while True:
+            chunk = [tuple(value or None for value in row) for row in islice(reader, chunk_size)]
+            if not chunk:
+                return
+            yield chunk
+
+@contextmanager
+def bulk_load_pragmas(conn: sqlite3.Connection) -> Iterator[None]:
+    """
+    Applies BULK_LOAD_PRAGMAS to the connection and restores the previous values on exit.
+    """
+    previous = {name: conn.execute(f'PRAGMA {name}').fetchone()[0] for name in BULK_LOAD_PRAGMAS}
+    for name, value in BULK_LOAD_PRAGMAS.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+
+def csv_header(file_path: str) -> list[str]:
+    """
+    Returns the column names of a GTFS file, without the UTF-8 BOM.
+    """
+    with open(file_path, newline='', encoding='utf-8-sig') as file:
+        return next(csv.reader(file), [])
+
+def insert_csv_chunks(cursor: sqlite3.Cursor, target: str, file_path: str, column_count: int,
+                      chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Inserts the rows of a GTFS file, with its derived columns, into an existing target table
+    chunk by chunk and returns the row count.
+    """
+    table_name = os.path.splitext(os.path.basename(file_path))[0]
+    header = csv_header(file_path)
+    placeholders = ', '.join('?' * column_count)
+    insert_sql = f'INSERT INTO {target} VALUES ({placeholders})'
+    rows = 0
+    for chunk in iter_csv_chunks(file_path, chunk_size):
+        cursor.executemany(insert_sql, add_derived_columns(table_name, header, chunk))
+        rows += len(chunk)
+    return rows
+
+def stream_gtfs_file(cursor: sqlite3.Cursor, conn: sqlite3.Connection, gtfs_dir: str, filename: str,
+                     chunk_size: int = CHUNK_SIZE) -> None:
+    """
+    Imports a single GTFS file chunk by chunk, so memory use does not depend on the file size.
+    Column types are inferred from the first SAMPLE_ROWS rows and every chunk is inserted
+    with executemany inside a single transaction.
+    """
+    file_path = os.path.join(gtfs_dir, filename)
+    if not os.path.exists(file_path):
+        print(f'File {filename} not found, skipping.')
+        return
+    started = time.perf_counter()
+    table_name = os.path.splitext(filename)[0]
+    col_types = table_column_types(table_name, read_gtfs_csv(file_path, nrows=SAMPLE_ROWS))
+    # No ROLLBACK on failure: with journal_mode=OFF it is undefined, the file has to be re-imported.
+    cursor.execute('BEGIN')
+    create_table(cursor, table_name, col_types)
+    rows = insert_csv_chunks(cursor, f'"{table_name}"', file_path, len(col_types), chunk_size)
+    create_indexes(cursor, table_name)
+    record_import(cursor, file_path, table_name, rows)
+    cursor.execute('COMMIT')
+    print_import_stats(filename, table_name, rows, time.perf_counter() - started)
+
+# Queue shared with the parse workers, set by init_parse_worker in every worker process.
+_batch_queue = None
+
+def init_parse_worker(queue: multiprocessing.Queue) -> None:
+    global _batch_queue
+    _batch_queue = queue
+
+def parse_worker(file_path: str, chunk_size: int) -> None:
+    """
+    Runs in a worker process: parses a GTFS file, adds its derived columns and puts
+    (file_path, chunk) batches on the shared queue, followed by (file_path, None) once the file is done.
+    """
+    table_name = os.path.splitext(os.path.basename(file_path))[0]
+    try:
+        header = csv_header(file_path)
+        for chunk in iter_csv_chunks(file_path, chunk_size):
+            _batch_queue.put((file_path, add_derived_columns(table_name, header, chunk)))
+    finally:
+        _batch_queue.put((file_path, None))
+
+def parallel_import_gtfs(cursor: sqlite3.Cursor, gtfs_dir: str, filenames: list[str], workers: int,
+                         chunk_size: int = CHUNK_SIZE) -> None:
+    """
+    Imports several GTFS files at once: worker processes parse the files in parallel, while this
+    process is the single writer inserting their chunks as they arrive, in one transaction.
+    The files are recorded in METADATA_TABLE only once every worker has finished and all their
+    chunks have been written, so a failed import is never taken for a complete one.
+    """
+    tables = {}
+    sha256s = {}
+    for filename in filenames:
+        file_path = os.path.join(gtfs_dir, filename)
+        if not os.path.exists(file_path):
+            print(f'File {filename} not found, skipping.')
+            continue
+        table_name = os.path.splitext(filename)[0]
+        tables[file_path] = (table_name, table_column_types(table_name, read_gtfs_csv(file_path, nrows=SAMPLE_ROWS)))
+        # Hashed before parsing, so the recorded hash is that of the content imported.
+        sha256s[file_path] = file_sha256(file_path)
+    if not tables:
+        return
+
+    started = time.perf_counter()
+    rows = dict.fromkeys(tables, 0)
+    # No ROLLBACK on failure: with journal_mode=OFF it is undefined, the files have to be re-imported.
+    cursor.execute('BEGIN')
+    for table_name, col_types in tables.values():
+        create_table(cursor, table_name, col_types)
+
+    queue = multiprocessing.Queue(maxsize=workers * QUEUE_CHUNKS_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_parse_worker, initargs=(queue,)) as pool:
+        futures = [pool.submit(parse_worker, file_path, chunk_size) for file_path in tables]
+        pending = len(tables)
+        while pending:
+            try:
+                file_path, chunk = queue.get(timeout=1)
+            except Empty:
+                for future in futures:
+                    if future.done() and future.exception():
+                        raise future.exception()
+                continue
+            table_name, col_types = tables[file_path]
+            if chunk is None:
+                # Also sent by a failed worker: its exception is raised by future.result() below.
+                pending -= 1
+                create_indexes(cursor, table_name)
+                print_import_stats(os.path.basename(file_path), table_name, rows[file_path],
+                                   time.perf_counter() - started)
+                continue
+            placeholders = ', '.join('?' * len(col_types))
+            cursor.executemany(f'INSERT INTO "{table_name}" VALUES ({placeholders})', chunk)
+            rows[file_path] += len(chunk)
+        for future in futures:
+            future.result()
+    for file_path, (table_name, _) in tables.items():
+        record_import(cursor, file_path, table_name, rows[file_path], sha256s[file_path])
+    cursor.execute('COMMIT')
+
+def apply_file_diff(cursor: sqlite3.Cursor, table_name: str, file_path: str,
+                    chunk_size: int = CHUNK_SIZE) -> tuple[int, int, int, int]:
+    """
+    Loads a GTFS file into a temporary staging table and applies it to the existing table as
+    row-level changes keyed on the GTFS primary key, instead of truncating the table.
+    Returns (rows, inserted, updated, deleted).
+    """
+    primary_key = GTFS_SCHEMA[table_name]['primary_key']
+    staging = f'temp."staging_{table_name}"'
+    cursor.execute(f'DROP TABLE IF EXISTS {staging}')
+    # Copies the declared column types, so staged values get the same affinity as the target.
+    cursor.execute(f'CREATE TABLE {staging} AS SELECT * FROM main."{table_name}" WHERE 0')
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info("{table_name}")').fetchall()]
+    rows = insert_csv_chunks(cursor, staging, file_path, len(columns), chunk_size)
+    key_sql = ', '.join(f'"{col}"' for col in primary_key)
+    cursor.execute(f'CREATE INDEX temp."staging_{table_name}_key" ON "staging_{table_name}" ({key_sql})')
+
+    key_match = ' AND '.join(f's."{col}" = t."{col}"' for col in primary_key)
+    columns_sql = ', '.join(f'"{col}"' for col in columns)
+    cursor.execute(f'DELETE FROM main."{table_name}" AS t WHERE NOT EXISTS (SELECT 1 FROM {staging} AS s WHERE {key_match})')
+    deleted = cursor.rowcount
+    count_before = cursor.execute(f'SELECT COUNT(*) FROM main."{table_name}"').fetchone()[0]
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO main."{table_name}" ({columns_sql})
+        SELECT {columns_sql} FROM {staging}
+        EXCEPT
+        SELECT {columns_sql} FROM main."{table_name}"
+    ''')
+    changed = cursor.rowcount
+    inserted = cursor.execute(f'SELECT COUNT(*) FROM main."{table_name}"').fetchone()[0] - count_before
+    cursor.execute(f'DROP TABLE {staging}')
+    return rows, inserted, changed - inserted, deleted
+
+def reload_gtfs_file(cursor: sqlite3.Cursor, conn: sqlite3.Connection, gtfs_dir: str, filename: str,
+                     chunk_size: int = CHUNK_SIZE) -> bool:
+    """
+    Re-imports a GTFS file only if its content hash differs from the one recorded by the last import.
+    A table with a declared primary key and unchanged columns is updated in place with apply_file_diff,
+    any other table is rebuilt. Returns True if the database was changed.
+    """
+    file_path = os.path.join(gtfs_dir, filename)
+    if not os.path.exists(file_path):
+        print(f'File {filename} not found, skipping.')
+        return False
+    table_name = os.path.splitext(filename)[0]
+    sha256 = file_sha256(file_path)
+    exists = table_exists(cursor, table_name)
+    if exists and imported_sha256(cursor, filename) == sha256:
+        print(f'{filename} unchanged, skipping.')
+        return False
+
+    header = csv_header(file_path) + list(DERIVED_COLUMNS.get(table_name, {}))
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info("{table_name}")').fetchall()]
+    if not exists or header != columns or 'primary_key' not in GTFS_SCHEMA.get(table_name, {}):
+        stream_gtfs_file(cursor, conn, gtfs_dir, filename, chunk_size)
+        return True
+
+    started = time.perf_counter()
+    cursor.execute('BEGIN')
+    try:
+        rows, inserted, updated, deleted = apply_file_diff(cursor, table_name, file_path, chunk_size)
+        record_import(cursor, file_path, table_name, rows, sha256)
+        cursor.execute('COMMIT')
+    except BaseException:
+        cursor.execute('ROLLBACK')
+        raise
+    elapsed = time.perf_counter() - started
+    print(f'Updated table {table_name} from {filename}: {inserted} inserted, {updated} updated, '
+          f'{deleted} deleted in {elapsed:.2f}s')
+    return True
+
+def build_database(gtfs_dir: str, db_path: str, streaming: bool = False, chunk_size: int = CHUNK_SIZE,
+                   incremental: bool = False, workers: int = 1) -> None:
+    """
+    Imports all GTFS files into the SQLite database at db_path with typed, indexed tables, builds the
+    service_days table and runs ANALYZE so the query planner has statistics for the new indexes.
+    With streaming=True the files are read in chunks of chunk_size rows under bulk-load pragmas.
+    With incremental=True only the files changed since the last import are applied, as row-level
+    diffs in normal journaled transactions.
+    With workers > 1 the files are parsed by that many worker processes at once and streamed
+    into the database by a single writer, under the same bulk-load pragmas.
+    """
+    selected_files = gtfs_files(gtfs_dir)
+    if incremental:
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        try:
+            cursor = conn.cursor()
+            changed = False
+            for filename in selected_files:
+                changed |= reload_gtfs_file(cursor, conn, gtfs_dir, filename, chunk_size)
+            if changed or not table_exists(cursor, SERVICE_DAYS_TABLE):
+                build_service_days(cursor)
+                cursor.execute('ANALYZE')
+        finally:
+            conn.close()
+        return
+    if streaming or workers > 1:
+        # Autocommit mode: stream_gtfs_file issues BEGIN/COMMIT itself, and the
+        # journal_mode pragma cannot be changed inside a transaction.
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        try:
+            cursor = conn.cursor()
+            with bulk_load_pragmas(conn):
+                if workers > 1:
+                    parallel_import_gtfs(cursor, gtfs_dir, selected_files, workers, chunk_size)
+                else:
+                    for filename in selected_files:
+                        stream_gtfs_file(cursor, conn, gtfs_dir, filename, chunk_size)
+                build_service_days(cursor)
+                cursor.execute('ANALYZE')
+        finally:
+            conn.close()
+        return
     with sqlite3.connect(db_path) as conn:
         cursor = conn.cursor()
         for filename in selected_files:
             import_gtfs_file(cursor, conn, gtfs_dir, filename)
+        build_service_days(cursor)
         conn.commit()
+        cursor.execute('ANALYZE')
+
+def copy_database(source_path: str, target_path: str) -> None:
+    """
+    Copies a SQLite database with the online backup API, so a copy taken while the API reads
+    the source is consistent.
+    """
+    with closing(sqlite3.connect(f'file:{source_path}?mode=ro', uri=True)) as source, \
+            closing(sqlite3.connect(target_path)) as target:
+        source.backup(target)
+
+def has_rows(cursor: sqlite3.Cursor, table_name: str) -> bool:
+    """
+    Returns True if the table exists and holds at least one row.
+    """
+    return table_exists(cursor, table_name) and \
+        cursor.execute(f'SELECT 1 FROM "{table_name}" LIMIT 1').fetchone() is not None
+
+def validate_database(db_path: str, gtfs_dir: str, published_path: Optional[str] = None) -> None:
+    """
+    Raises ValueError if the database is corrupt or lacks rows in one of the REQUIRED_TABLES that the
+    GTFS folder has a source file for, or that the database published at published_path has rows in.
+    Feeds without a file (the bundled one ships without stop_times.txt) still import, but a new version
+    never empties a table the API is reading.
+    """
+    required = [table_name for table_name in REQUIRED_TABLES
+                if os.path.exists(os.path.join(gtfs_dir, f'{table_name}.txt'))]
+    if published_path is not None and os.path.exists(published_path):
+        with closing(sqlite3.connect(f'file:{published_path}?mode=ro', uri=True)) as conn:
+            cursor = conn.cursor()
+            required += [table_name for table_name in REQUIRED_TABLES
+                         if table_name not in required and has_rows(cursor, table_name)]
+    with closing(sqlite3.connect(db_path)) as conn:
+        cursor = conn.cursor()
+        check = cursor.execute('PRAGMA quick_check').fetchone()[0]
+        if check != 'ok':
+            raise ValueError(f'{db_path} failed the integrity check: {check}')
+        for table_name in required:
+            if not has_rows(cursor, table_name):
+                raise ValueError(f'{db_path} has no rows in required table {table_name}')
+        if not table_exists(cursor, SERVICE_DAYS_TABLE):
+            raise ValueError(f'{db_path} has no {SERVICE_DAYS_TABLE} table')
+
+def infer_and_import_gtfs(gtfs_dir: str = GTFS_DIR, db_path: str = DB_PATH, streaming: bool = False,
+                          chunk_size: int = CHUNK_SIZE, incremental: bool = False, workers: int = 1) -> None:
+    """
+    Builds a new version of the database at db_path from the GTFS files (see build_database) and
+    publishes it atomically. The new version is written to a versioned temporary file next to db_path
+    (an incremental import starts from a copy of the current database), validated, and renamed over
+    db_path. The API opens db_path for every request, so new requests read the new version while
+    connections already open keep reading the old file, which the OS frees when the last one closes.
+    A failed import or validation leaves the published database untouched.
+    Publishing while the API runs needs Linux or macOS: Windows refuses to rename over a file that open
+    connections hold, so the import fails there with a PermissionError until the API is stopped.
+    """
+    tmp_path = f'{db_path}.{datetime.now():%Y%m%d%H%M%S%f}.tmp'
+    try:
+        if incremental and os.path.exists(db_path):
+            copy_database(db_path, tmp_path)
+        build_database(gtfs_dir, tmp_path, streaming=streaming, chunk_size=chunk_size,
+                       incremental=incremental, workers=workers)
+        validate_database(tmp_path, gtfs_dir, db_path)
+        try:
+            os.replace(tmp_path, db_path)
+        except PermissionError as e:
+            raise PermissionError(f'Cannot replace {db_path} while it is open, e.g. by the pooled connections '
+                                  f'of the API on Windows; stop the API and import again.') from e
+        print(f'Published {db_path}')
+    finally:
+        for path in (tmp_path, tmp_path + '-journal'):
+            if os.path.exists(path):
+                os.remove(path)
+
+def encode_column(values: pd.Series, dictionary: Optional[np.ndarray] = None) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Returns (array, dictionary) for a column of the columnar snapshot. Text columns become int32 codes
+    into a sorted fixed-width string dictionary (NULL is stored as ''), numeric columns are kept as they are.
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(), None
+    strings = values.fillna('').astype(str).to_numpy(dtype=str)
+    if dictionary is None:
+        dictionary, codes = np.unique(strings, return_inverse=True)
+        return codes.astype(np.int32), dictionary
+    codes = np.searchsorted(dictionary, strings)
+    if len(strings) and not np.array_equal(dictionary[np.minimum(codes, len(dictionary) - 1)], strings):
+        raise ValueError('Column has values missing from the shared dictionary.')
+    return codes.astype(np.int32), dictionary
+
+def export_columnar(db_path: str, columnar_dir: str) -> None:
+    """
+    Writes a columnar snapshot of the tables read by the services: one .npy array per column,
+    meant to be memory-mapped, plus manifest.json. Besides COLUMNAR_TABLES it writes stop_departures,
+    the (stop_id, departure_secs, row) index of stop_times sorted by stop and time.
+    Every export is a new version folder inside columnar_dir. It is written under a temporary name,
+    renamed when complete and then published by atomically replacing the CURRENT pointer file.
+    The previous version is kept for requests still reading it; older ones are removed.
+    """
+    started = time.perf_counter()
+    version = f'{datetime.now():%Y%m%d%H%M%S%f}'
+    tmp_dir = os.path.join(columnar_dir, version + '.tmp')
+    os.makedirs(tmp_dir)
+    manifest = {'format_version': COLUMNAR_FORMAT_VERSION, 'created_at': datetime.now().isoformat(), 'tables': {}}
+    dictionaries = {}
+    arrays = {}
+
+    def save_table(table_name: str, columns: dict[str, np.ndarray]) -> None:
+        entry = manifest['tables'][table_name] = {'rows': 0, 'columns': {}}
+        for col, array in columns.items():
+            file_name = f'{table_name}.{col}.npy'
+            np.save(os.path.join(tmp_dir, file_name), array)
+            entry['rows'] = len(array)
+            entry['columns'][col] = {'file': file_name, 'dtype': str(array.dtype)}
+            if (table_name, col) in dictionaries:
+                entry['columns'][col]['dictionary'] = dictionaries[(table_name, col)]
+
+    with sqlite3.connect(db_path) as conn:
+        for table_name, spec in COLUMNAR_TABLES.items():
+            df = pd.read_sql_query(spec['query'], conn)
+            columns = {}
+            for col in df.columns:
+                shared = spec.get('shared_dictionaries', {}).get(col)
+                dictionary = arrays[shared + ('dictionary',)] if shared else None
+                columns[col], dictionary = encode_column(df[col], dictionary)
+                if shared:
+                    dictionaries[(table_name, col)] = dictionaries[shared]
+                elif dictionary is not None:
+                    file_name = f'{table_name}.{col}.dict.npy'
+                    np.save(os.path.join(tmp_dir, file_name), dictionary)
+                    dictionaries[(table_name, col)] = file_name
+                    arrays[(table_name, col, 'dictionary')] = dictionary
+            order = np.lexsort([columns[col] for col in reversed(spec['sort_by'])])
+            columns = {col: array[order] for col, array in columns.items()}
+            save_table(table_name, columns)
+            arrays.update({(table_name, col): array for col, array in columns.items()})
+
+    stop_ids, departure_secs = arrays[('stop_times', 'stop_id')], arrays[('stop_times', 'departure_secs')]
+    order = np.lexsort((departure_secs, stop_ids))
+    save_table('stop_departures', {
+        'stop_id': stop_ids[order],
+        'departure_secs': departure_secs[order],
+        'row': order.astype(np.int64),
+    })
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2)
+
+    os.replace(tmp_dir, os.path.join(columnar_dir, version))
+
+    current_file = os.path.join(columnar_dir, COLUMNAR_CURRENT_FILE)
+    previous = None
+    if os.path.exists(current_file):
+        with open(current_file, encoding='utf-8') as file:
+            previous = file.read().strip()
+    with open(current_file + '.tmp', 'w', encoding='utf-8') as file:
+        file.write(version)
+    os.replace(current_file + '.tmp', current_file)
+    for entry in os.listdir(columnar_dir):
+        path = os.path.join(columnar_dir, entry)
+        if os.path.isdir(path) and entry not in (version, previous):
+            shutil.rmtree(path, ignore_errors=True)
+    print(f'Exported columnar snapshot {version} to {columnar_dir} in {time.perf_counter() - started:.2f}s')
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Import GTFS files into a SQLite database.')
+    parser.add_argument('--gtfs-dir', default=GTFS_DIR, help='Folder with the GTFS .txt files.')
+    parser.add_argument('--db-path', default=DB_PATH, help='Target SQLite database file.')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Read files in bounded chunks instead of loading each file into memory.')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='Rows per chunk in streaming mode (default: %(default)s).')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only re-import files whose content changed since the last import.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes parsing files in parallel; values above 1 '
+                             'imply streaming mode (default: %(default)s).')
+    parser.add_argument('--columnar-dir',
+                        help='Also write a memory-mapped columnar snapshot of the database to this folder.')
+    return parser.parse_args()
 
 if __name__ == '__main__':
-    infer_and_import_gtfs()
\ No newline at end of file
+    args = parse_args()
+    infer_and_import_gtfs(args.gtfs_dir, args.db_path, streaming=args.streaming, chunk_size=args.chunk_size,
+                          incremental=args.incremental, workers=args.workers)
+    if args.columnar_dir:
+        export_columnar(args.db_path, args.columnar_dir)